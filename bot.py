@@ -1,28 +1,38 @@
+import time
+_IMPORT_STARTED = time.perf_counter()
+
 import os
+import asyncio
 import logging
+from collections import OrderedDict, deque
+from datetime import datetime
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import BadRequest, TelegramError
 from telegram.ext import (
-    Application, CommandHandler, CallbackQueryHandler,
-    ContextTypes
+    Application, ApplicationHandlerStop, CommandHandler, CallbackQueryHandler, MessageHandler,
+    ContextTypes, TypeHandler, filters
 )
-from sqlalchemy import create_engine, text
+from sqlalchemy import bindparam, text
+from config import Config
+import database
+from callbacks import encode_episode, decode_episode, encode_send, decode_send, decode_start
+from stats import collect_stats
+from progress import ProgressBuffer
+from popularity import PopularityTracker, decay_factor, load_snapshot, save_snapshot
+from catalog_snapshot import CatalogSnapshot
+from episode_files import EpisodeFileCache, media_of
+from ratelimit import RateLimiter
+from circuit import CircuitBreaker, CircuitOpenError, describe_error, is_connectivity_error
+from memdiag import ACTIONS as MEMORY_ACTIONS, DIAGNOSTICS
 
 # ==============================
 # 1. الإعدادات والتكوين
 # ==============================
 BOT_TOKEN = os.environ.get("BOT_TOKEN", "")
-DATABASE_URL = os.environ.get("DATABASE_URL", "")
-
-if not BOT_TOKEN:
-    print("❌ خطأ: BOT_TOKEN غير موجود في متغيرات البيئة!")
-    exit(1)
+DATABASE_URL = Config.DATABASE_URL
 
-if not DATABASE_URL:
-    print("⚠️ تحذير: DATABASE_URL غير موجود. قد لا تعرض المحتويات.")
-
-# إصلاح رابط قاعدة البيانات
-if DATABASE_URL.startswith("postgres://"):
-    DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
+# القناة التي تُنشر فيها الحلقات (نفس القناة التي يراقبها الـ Worker)
+CHANNEL_USERNAME = "ShoofFilm"
 
 # إعداد التسجيل
 logging.basicConfig(
@@ -31,151 +41,1037 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# محرك قاعدة البيانات
+# محرك قاعدة البيانات (يُنشأ عند أول استخدام، لا اتصال عند الاستيراد)
 engine = None
-if DATABASE_URL:
+
+def get_engine():
+    """إرجاع محرك قاعدة البيانات وإنشاؤه عند أول طلب."""
+    global engine
+    if engine is None:
+        try:
+            engine = database.get_engine()
+        except Exception as e:
+            print(f"❌ فشل إنشاء محرك قاعدة البيانات: {e}")
+            return None
+    return engine
+
+# قاطع الدائرة للقاعدة الأساسية: عند تعطلها تُخدم الطلبات من الذاكرة بدلاً من انتظار المهلات
+DB_BREAKER = CircuitBreaker(
+    failure_threshold=Config.DB_BREAKER_FAILURES,
+    reset_seconds=Config.DB_BREAKER_RESET_SECONDS,
+    max_reset_seconds=Config.DB_BREAKER_MAX_RESET_SECONDS,
+)
+
+def note_db_failure(error):
+    if is_connectivity_error(error) and DB_BREAKER.failure(error):
+        print(f"🔌 قاعدة البيانات غير متاحة، فُتح القاطع وتُخدم الطلبات من آخر بيانات محفوظة: {DB_BREAKER.last_error}")
+
+def note_db_success():
+    if DB_BREAKER.success():
+        print("✅ عادت قاعدة البيانات، أُغلق القاطع")
+
+def breaker_rejection():
+    return CircuitOpenError(DB_BREAKER.last_error or "قاعدة البيانات غير متاحة")
+
+def on_connection(engine, func, args=()):
+    """func(conn, *args) على اتصال جديد من engine (يُستدعى داخل خيط عبر run_db أو read_db)."""
+    if engine is None:
+        raise ConnectionError("تعذر إنشاء محرك قاعدة البيانات")
+    with engine.connect() as conn:
+        return func(conn, *args)
+
+async def run_db(func, *args, timeout=None):
+    """تشغيل دالة قاعدة بيانات متزامنة في خيط عبر القاطع.
+
+    timeout يحدد انتظار المعالج فقط (الخيط يكمل عمله)؛ الاستعلام نفسه محدود بـ DB_STATEMENT_TIMEOUT_MS.
+    """
+    if not DB_BREAKER.allow():
+        raise breaker_rejection()
     try:
-        engine = create_engine(DATABASE_URL)
-        # اختبار الاتصال
-        with engine.connect() as conn:
-            conn.execute(text("SELECT 1"))
-        print("✅ تم الاتصال بقاعدة البيانات بنجاح.")
-        
-        # اختبار جلب البيانات مباشرة
-        with engine.connect() as conn:
-            series_count = conn.execute(text("SELECT COUNT(*) FROM series WHERE type = 'series'")).scalar()
-            movies_count = conn.execute(text("SELECT COUNT(*) FROM series WHERE type = 'movie'")).scalar()
-            print(f"📊 في الاختبار المبدئي:")
-            print(f"   - عدد المسلسلات: {series_count}")
-            print(f"   - عدد الأفلام: {movies_count}")
-            
+        result = await asyncio.wait_for(asyncio.to_thread(func, *args), timeout)
     except Exception as e:
-        print(f"❌ فشل الاتصال بقاعدة البيانات: {e}")
-        engine = None
+        note_db_failure(e)
+        raise
+    note_db_success()
+    return result
+
+# النسخة المتماثلة للقراءة (None إذا لم يُضبط DATABASE_READ_URL)
+READ_REPLICA = (
+    database.ReadReplica(Config.DATABASE_READ_URL, Config.READ_REPLICA_RETRY_SECONDS)
+    if Config.DATABASE_READ_URL else None
+)
+
+# آخر حالة مطبوعة للنسخة المتماثلة حتى لا تتكرر الرسالة كل فحص
+READ_REPLICA_LOGGED = {"state": None}
+
+def get_read_engine():
+    """محرك القراءة: النسخة المتماثلة إن كانت متاحة ومحدثة، وإلا الأساسية.
+
+    الكتابات (تقدم المشاهدة، الشعبية، file_id) وقراءات ما يكتبه البوت نفسه تبقى على get_engine().
+    """
+    if READ_REPLICA and READ_REPLICA.usable(CATALOG_STATE["version"]):
+        return READ_REPLICA.engine
+    return get_engine()
+
+async def read_db(func, *args):
+    """قراءة func(conn, *args) في خيط بمهلة DB_CALL_TIMEOUT_SECONDS، فالقاعدة البطيئة لا توقف حلقة البوت.
+
+    النسخة المتماثلة أولاً إن كانت صالحة (خطأ اتصالها أو مهلتها يرجع إلى الأساسية)، والأساسية
+    عبر القاطع في run_db. المستدعي يرجع إلى LAST_GOOD_READS عند أي خطأ.
+    """
+    engine = get_read_engine()
+    if READ_REPLICA and engine is not None and engine is READ_REPLICA.engine:
+        try:
+            return await asyncio.wait_for(
+                asyncio.to_thread(on_connection, engine, func, args), Config.DB_CALL_TIMEOUT_SECONDS
+            )
+        except Exception as e:
+            if not is_connectivity_error(e):
+                raise
+            print(f"⚠️ تعذرت القراءة من النسخة المتماثلة، القراءة من الأساسية: {describe_error(e)}")
+            READ_REPLICA.mark_down(e)
+    return await run_db(on_connection, get_engine(), func, args, timeout=Config.DB_CALL_TIMEOUT_SECONDS)
+
+async def check_read_replica():
+    """فحص النسخة المتماثلة بعد كل تحديث لإصدار الكتالوج من الأساسية."""
+    if not READ_REPLICA:
+        return
+    await asyncio.to_thread(READ_REPLICA.check)
+    status = READ_REPLICA.status(CATALOG_STATE["version"])
+    # طباعة التغير فقط (متزامنة/متأخرة/غير متاحة)
+    if status.split()[0] != READ_REPLICA_LOGGED["state"]:
+        READ_REPLICA_LOGGED["state"] = status.split()[0]
+        print(f"🔀 النسخة المتماثلة للقراءة: {status}")
+
+# أزمنة بدء التشغيل (بالثواني) لمراقبة سرعة الإقلاع
+STARTUP_TIMES = {}
+
+# المهام الخلفية التي تعمل طوال عمر البوت
+BACKGROUND_TASKS = []
+
+# هل اكتملت تهيئة الجداول وتحميل الحالة من القاعدة (تُعاد في watch_catalog حتى تنجح)
+DB_STATE = {"prepared": False}
+
+async def prepare_database():
+    """اختبار الاتصال، تهيئة الجداول، وتحميل الشعبية وآخر الإضافات."""
+    engine = get_engine()
+    await run_db(on_connection, engine, lambda conn: conn.execute(text("SELECT 1")),
+                 timeout=Config.DB_CALL_TIMEOUT_SECONDS)
+    print(f"✅ تم الاتصال بقاعدة البيانات بنجاح ({engine.dialect.name}).")
+    # قد تطول عند حساب مفاتيح الفهرس للمحتويات القديمة، فبدون مهلة لكن خارج حلقة البوت
+    await run_db(database.init_db, engine)
+    await load_popularity()
+    # يبلغ المستمعين أيضاً، فتبدأ لقطة الإحصائيات بالتحميل في الخلفية
+    await refresh_catalog()
+    await check_read_replica()
+    DB_STATE["prepared"] = True
+
+async def post_init(application: Application):
+    """يعمل بعد تهيئة البوت وقبل بدء الاستقبال: اختبار الاتصال، تحميل آخر الإضافات وتشغيل المهام الخلفية."""
+    started = time.perf_counter()
+    # اللقطة المحفوظة تخدم القراءة فوراً، وتُقارن بإصدار قاعدة البيانات في refresh_catalog
+    await load_catalog_snapshot()
+    try:
+        await prepare_database()
+    except Exception as e:
+        # البوت يعمل من اللقطة، و watch_catalog يعيد المحاولة حتى تعود القاعدة
+        print(f"❌ فشل الاتصال بقاعدة البيانات عند الإقلاع، ستُعاد المحاولة في الخلفية: {e}")
+    BACKGROUND_TASKS.append(asyncio.create_task(watch_catalog()))
+    BACKGROUND_TASKS.append(asyncio.create_task(watch_stats()))
+    BACKGROUND_TASKS.append(asyncio.create_task(watch_progress_flusher()))
+    BACKGROUND_TASKS.append(asyncio.create_task(watch_popularity()))
+    BACKGROUND_TASKS.append(asyncio.create_task(watch_catalog_snapshot()))
+    watch_bot_memory(application)
+    memory_sampler = DIAGNOSTICS.start_sampling(Config.MEMORY_RSS_SECONDS)
+    if memory_sampler:
+        BACKGROUND_TASKS.append(memory_sampler)
+    STARTUP_TIMES["db_check"] = time.perf_counter() - started
+    STARTUP_TIMES["ready"] = time.perf_counter() - _IMPORT_STARTED
+    print(
+        f"⏱️ زمن الإقلاع: الاستيراد {STARTUP_TIMES['import'] * 1000:.0f}ms، "
+        f"فحص القاعدة {STARTUP_TIMES['db_check'] * 1000:.0f}ms، "
+        f"جاهز بعد {STARTUP_TIMES['ready'] * 1000:.0f}ms"
+    )
+
+async def post_shutdown(application: Application):
+    """إيقاف المهام الخلفية عند إيقاف البوت وحفظ ما تبقى في الذاكرة."""
+    for task in BACKGROUND_TASKS:
+        task.cancel()
+    await asyncio.gather(*BACKGROUND_TASKS, return_exceptions=True)
+    BACKGROUND_TASKS.clear()
+    await flush_watch_progress()
+    await save_popularity()
+    await save_catalog_snapshot()
+
+def format_startup_times():
+    """تنسيق أزمنة الإقلاع المسجلة للعرض في /debug."""
+    labels = {"import": "استيراد", "ready": "جاهز", "first_update": "أول تحديث"}
+    parts = [f"{label} `{STARTUP_TIMES[key] * 1000:.0f}ms`" for key, label in labels.items() if key in STARTUP_TIMES]
+    return "، ".join(parts) or "غير متوفر"
+
+async def record_first_update(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """تسجيل زمن وصول أول تحديث منذ بدء التشغيل (مرة واحدة فقط)."""
+    if "first_update" not in STARTUP_TIMES:
+        STARTUP_TIMES["first_update"] = time.perf_counter() - _IMPORT_STARTED
+        print(f"⏱️ أول تحديث بعد {STARTUP_TIMES['first_update'] * 1000:.0f}ms من بدء التشغيل")
+
+# ==============================
+# 1.1 تحديد معدل الطلبات وصلاحيات المشرفين
+# ==============================
+# الفئات: nav للتصفح (رخيص غالباً من الذاكرة)، send لإرسال الملفات، stats لأوامر المشرفين المكلفة
+RATE_LIMITER = RateLimiter({
+    "nav": (Config.RATE_LIMIT_NAV_BURST, Config.RATE_LIMIT_NAV_PER_MINUTE),
+    "send": (Config.RATE_LIMIT_SEND_BURST, Config.RATE_LIMIT_SEND_PER_MINUTE),
+    "stats": (Config.RATE_LIMIT_STATS_BURST, Config.RATE_LIMIT_STATS_PER_MINUTE),
+}, Config.RATE_LIMIT_MAX_USERS) if Config.RATE_LIMIT_ENABLED else None
+
+ADMIN_COMMANDS = {"test", "debug", "memory"}
+ADMIN_CALLBACKS = {"test_db"}
+
+# ردود ثابتة لا تحتاج قاعدة البيانات
+ADMIN_ONLY_TEXT = "⛔ هذا الأمر للمشرفين فقط."
+RATE_LIMITED_TEXT = "⏳ طلبات كثيرة، حاول مرة أخرى بعد {seconds} ثانية."
+DB_UNAVAILABLE_TEXT = "❌ قاعدة البيانات غير متاحة حالياً، حاول مرة أخرى بعد قليل."
+
+def is_admin(user):
+    return bool(user) and user.id in Config.ADMIN_IDS
+
+def request_category(update: Update):
+    """فئة الطلب للحد من المعدل، أو None للتحديثات غير المحدودة (منشورات القناة مثلاً)."""
+    query = update.callback_query
+    if query:
+        data = query.data or ""
+        if data in ADMIN_CALLBACKS:
+            return "stats"
+        if decode_send(data) is not None:
+            return "send"
+        return "nav"
+    # effective_message: الرسالة المعدلة إلى أمر تُعامل كأمر جديد (CommandHandler يقبلها افتراضياً)
+    message = update.effective_message
+    if message and message.text and message.text.startswith("/"):
+        command = message.text.split()[0][1:].split("@")[0].lower()
+        return "stats" if command in ADMIN_COMMANDS else "nav"
+    return None
+
+async def reply_without_db(update: Update, reply_text):
+    """رد ثابت: تنبيه صغير للأزرار، أو رسالة للأوامر."""
+    try:
+        if update.callback_query:
+            await update.callback_query.answer(reply_text)
+        elif update.effective_message:
+            await update.effective_message.reply_text(reply_text)
+    except TelegramError as e:
+        print(f"⚠️ تعذر إرسال رد التقييد: {e}")
+
+async def limit_requests(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """يعمل قبل كل المعالجات: يمنع غير المشرفين من أوامر المشرفين، ويطبق حدود المعدل."""
+    user = update.effective_user
+    category = request_category(update)
+    if not user or not category:
+        return
+    if category == "stats" and not is_admin(user):
+        await reply_without_db(update, ADMIN_ONLY_TEXT)
+        raise ApplicationHandlerStop
+    if RATE_LIMITER and not RATE_LIMITER.allow(user.id, category):
+        if RATE_LIMITER.first_rejection(user.id, category):
+            seconds = max(1, round(RATE_LIMITER.retry_after(user.id, category)))
+            await reply_without_db(update, RATE_LIMITED_TEXT.format(seconds=seconds))
+        elif update.callback_query:
+            # إيقاف مؤشر التحميل على الزر بدون رسالة
+            await update.callback_query.answer()
+        raise ApplicationHandlerStop
 
 # ==============================
 # 2. دوال المساعدة للتعامل مع قاعدة البيانات
 # ==============================
+# آخر نتيجة ناجحة لكل قراءة من القاعدة: (اسم القراءة، المعاملات) -> النتيجة
+# تُعرض عند تعذر القراءة (القاطع مفتوح أو مهلة)، والشاشات تُعلَّم بـ stale_note
+LAST_GOOD_READS = OrderedDict()
+
+def remember_read(key, value):
+    LAST_GOOD_READS[key] = value
+    LAST_GOOD_READS.move_to_end(key)
+    while len(LAST_GOOD_READS) > Config.STALE_CACHE_SIZE:
+        LAST_GOOD_READS.popitem(last=False)
+    return value
+
+def recall_read(key, default, what, error):
+    """آخر نتيجة ناجحة لنفس القراءة (أو default)، مع طباعة الخطأ إلا رفض القاطع المفتوح."""
+    if not isinstance(error, CircuitOpenError):
+        print(f"❌ خطأ في {what}: {describe_error(error)}")
+    return LAST_GOOD_READS.get(key, default)
+
+def stale_note():
+    """تنبيه يُضاف لنص الشاشة عندما تكون القاعدة متعطلة والبيانات من الذاكرة."""
+    if not DB_BREAKER.degraded:
+        return ""
+    return "\n\n⚠️ _قاعدة البيانات غير متاحة مؤقتاً: هذه آخر بيانات محفوظة وقد لا تشمل أحدث الإضافات._"
+
+# استعلامات القراءة تُنفذ داخل خيط عبر read_db: query(conn, ...) -> الصفوف
+def query_rows(conn, sql, params):
+    return conn.execute(text(sql), params).fetchall()
+
+def query_first_row(conn, sql, params):
+    return conn.execute(text(sql), params).fetchone()
+
+def query_all_content(conn, content_type=None):
+    query = """
+        SELECT s.id, s.name, s.type, COUNT(e.id) as episode_count
+        FROM series s
+        LEFT JOIN episodes e ON s.id = e.series_id
+    """
+    
+    if content_type:
+        query += f" WHERE s.type = '{content_type}'"
+    
+    query += """
+        GROUP BY s.id, s.name, s.type
+        ORDER BY s.id ASC
+    """
+    
+    print(f"🔍 تنفيذ الاستعلام: {query[:100]}...")
+    rows = conn.execute(text(query)).fetchall()
+    
+    print(f"📊 تم جلب {len(rows)} صفاً من قاعدة البيانات:")
+    for row in rows:
+        print(f"   - {row[1]} ({row[2]}) - {row[3]} حلقة/جزء")
+    return rows
+
 async def get_all_content(content_type=None):
     """جلب جميع المحتويات من قاعدة البيانات حسب النوع (مسلسلات/أفلام)"""
+    catalog = current_catalog()
+    if catalog:
+        return catalog.list_content(content_type)
+    
+    engine = get_engine()
     if not engine:
         print("⚠️ محرك قاعدة البيانات غير متاح في get_all_content")
         return []
     
     try:
-        with engine.connect() as conn:
-            query = """
-                SELECT s.id, s.name, s.type, COUNT(e.id) as episode_count
-                FROM series s
-                LEFT JOIN episodes e ON s.id = e.series_id
-            """
-            
-            if content_type:
-                query += f" WHERE s.type = '{content_type}'"
-            
-            query += """
-                GROUP BY s.id, s.name, s.type
-                ORDER BY s.id ASC
-            """
-            
-            print(f"🔍 تنفيذ الاستعلام: {query[:100]}...")
-            result = conn.execute(text(query))
-            rows = result.fetchall()
-            
-            print(f"📊 تم جلب {len(rows)} صفاً من قاعدة البيانات:")
-            for row in rows:
-                print(f"   - {row[1]} ({row[2]}) - {row[3]} حلقة/جزء")
-            
-            return rows
-            
+        return remember_read(("all_content", content_type), await read_db(query_all_content, content_type))
     except Exception as e:
-        print(f"❌ خطأ في جلب المحتويات: {e}")
-        import traceback
-        traceback.print_exc()
-        return []
+        return recall_read(("all_content", content_type), [], "جلب المحتويات", e)
 
-async def get_content_episodes(series_id):
-    """جلب حلقات/أجزاء محتوى محدد"""
+def query_content_episodes(conn, series_id, limit=None):
+    return conn.execute(text("""
+        SELECT e.id, e.season, e.episode_number, 
+               e.telegram_message_id, e.telegram_channel_id
+        FROM episodes e
+        WHERE e.series_id = :series_id
+        ORDER BY e.season, e.episode_number
+    """ + (" LIMIT :limit" if limit else "")), {"series_id": series_id, "limit": limit}).fetchall()
+
+async def get_content_episodes(series_id, limit=None):
+    """جلب حلقات/أجزاء محتوى محدد (مع حد أقصى اختياري لعدد الصفوف)"""
+    catalog = current_catalog()
+    if catalog:
+        return catalog.episodes(series_id, limit)
+    
+    engine = get_engine()
     if not engine:
         print("⚠️ محرك قاعدة البيانات غير متاح في get_content_episodes")
         return []
     
     try:
-        with engine.connect() as conn:
-            result = conn.execute(text("""
-                SELECT e.id, e.season, e.episode_number, 
-                       e.telegram_message_id, e.telegram_channel_id
-                FROM episodes e
-                WHERE e.series_id = :series_id
-                ORDER BY e.season, e.episode_number
-            """), {"series_id": series_id})
-            rows = result.fetchall()
-            print(f"🔍 تم جلب {len(rows)} حلقة/جزء للمحتوى {series_id}")
-            return rows
+        rows = await read_db(query_content_episodes, series_id, limit)
+        print(f"🔍 تم جلب {len(rows)} حلقة/جزء للمحتوى {series_id}")
+        return remember_read(("episodes", series_id, limit), rows)
     except Exception as e:
-        print(f"❌ خطأ في جلب حلقات المحتوى {series_id}: {e}")
+        return recall_read(("episodes", series_id, limit), [], f"جلب حلقات المحتوى {series_id}", e)
+
+# ذاكرة مؤقتة لأسماء المحتويات: series_id -> (id, name, type)
+SERIES_CACHE_SIZE = 5000
+SERIES_CACHE = OrderedDict()
+
+def cache_series_info(row):
+    """حفظ معلومات محتوى في الذاكرة المؤقتة مع حذف الأقدم عند الامتلاء."""
+    SERIES_CACHE[row[0]] = tuple(row)
+    SERIES_CACHE.move_to_end(row[0])
+    while len(SERIES_CACHE) > SERIES_CACHE_SIZE:
+        SERIES_CACHE.popitem(last=False)
+
+async def get_cached_content_info(series_id):
+    """معلومات المحتوى من الذاكرة المؤقتة، أو من قاعدة البيانات عند عدم وجودها."""
+    row = SERIES_CACHE.get(series_id)
+    if row:
+        SERIES_CACHE.move_to_end(series_id)
+        return row
+    return await get_content_info(series_id)
+
+def query_content_seasons(conn, series_id):
+    return conn.execute(text("""
+        SELECT e.season, COUNT(*), MIN(e.episode_number), MAX(e.episode_number)
+        FROM episodes e
+        WHERE e.series_id = :series_id
+        GROUP BY e.season
+        ORDER BY e.season
+    """), {"series_id": series_id}).fetchall()
+
+async def get_content_seasons(series_id):
+    """ملخص المواسم: (الموسم، عدد الحلقات، أول حلقة، آخر حلقة) دون جلب الحلقات نفسها"""
+    catalog = current_catalog()
+    if catalog:
+        return catalog.seasons(series_id)
+    
+    engine = get_engine()
+    if not engine:
+        print("⚠️ محرك قاعدة البيانات غير متاح في get_content_seasons")
         return []
+    
+    try:
+        return remember_read(("seasons", series_id), await read_db(query_content_seasons, series_id))
+    except Exception as e:
+        return recall_read(("seasons", series_id), [], f"جلب مواسم المحتوى {series_id}", e)
+
+async def get_season_episodes(series_id, season, low=None, high=None):
+    """جلب حلقات موسم واحد، ضمن نطاق أرقام حلقات اختياري"""
+    catalog = current_catalog()
+    if catalog:
+        return catalog.season_episodes(series_id, season, low, high)
+    
+    engine = get_engine()
+    if not engine:
+        print("⚠️ محرك قاعدة البيانات غير متاح في get_season_episodes")
+        return []
+    
+    query = """
+        SELECT e.id, e.season, e.episode_number,
+               e.telegram_message_id, e.telegram_channel_id
+        FROM episodes e
+        WHERE e.series_id = :series_id
+    """
+    # NULL لا يساوي شيئاً في SQL: الحلقات بلا موسم تُطلب بـ IS NULL
+    query += " AND e.season IS NULL" if season is None else " AND e.season = :season"
+    if low is not None:
+        query += " AND e.episode_number BETWEEN :low AND :high"
+    query += " ORDER BY e.episode_number"
+    
+    params = {"series_id": series_id, "season": season, "low": low, "high": high}
+    try:
+        return remember_read(("season", series_id, season, low), await read_db(query_rows, query, params))
+    except Exception as e:
+        return recall_read(
+            ("season", series_id, season, low), [], f"جلب حلقات الموسم {season} للمحتوى {series_id}", e
+        )
 
 async def get_content_info(series_id):
     """جلب معلومات محتوى محدد"""
+    catalog = current_catalog()
+    if catalog:
+        row = catalog.info(series_id)
+        if row:
+            cache_series_info(row)
+        return row
+    
+    engine = get_engine()
     if not engine:
         print("⚠️ محرك قاعدة البيانات غير متاح في get_content_info")
         return None
     
     try:
-        with engine.connect() as conn:
-            result = conn.execute(text("""
-                SELECT id, name, type FROM series WHERE id = :series_id
-            """), {"series_id": series_id})
-            row = result.fetchone()
-            if row:
-                print(f"🔍 معلومات المحتوى {series_id}: {row[1]} ({row[2]})")
-            return row
+        row = await read_db(query_first_row, """
+            SELECT id, name, type FROM series WHERE id = :series_id
+        """, {"series_id": series_id})
+        if row:
+            print(f"🔍 معلومات المحتوى {series_id}: {row[1]} ({row[2]})")
+            cache_series_info(row)
+        return row
     except Exception as e:
-        print(f"❌ خطأ في جلب معلومات المحتوى {series_id}: {e}")
+        if not isinstance(e, CircuitOpenError):
+            print(f"❌ خطأ في جلب معلومات المحتوى {series_id}: {e}")
+        # الصفوف الناجحة محفوظة أصلاً في SERIES_CACHE
+        return SERIES_CACHE.get(series_id)
+
+async def get_content_infos(series_ids):
+    """معلومات عدة محتويات باستعلام واحد لما ليس في الذاكرة المؤقتة: {series_id: (id, name, type)}"""
+    infos = {series_id: SERIES_CACHE[series_id] for series_id in series_ids if series_id in SERIES_CACHE}
+    missing = [series_id for series_id in series_ids if series_id not in infos]
+    catalog = current_catalog()
+    if catalog:
+        infos.update((series_id, catalog.info(series_id)) for series_id in missing if catalog.info(series_id))
+        return infos
+    engine = get_engine()
+    if missing and engine:
+        try:
+            rows = await read_db(lambda conn: conn.execute(
+                text("SELECT id, name, type FROM series WHERE id IN :ids").bindparams(
+                    bindparam("ids", expanding=True)
+                ),
+                {"ids": missing}
+            ).fetchall())
+            for row in rows:
+                cache_series_info(row)
+                infos[row[0]] = tuple(row)
+        except CircuitOpenError:
+            pass
+        except Exception as e:
+            print(f"❌ خطأ في جلب معلومات المحتويات: {e}")
+    return infos
+
+async def get_episode_by_message(msg_id):
+    """(series_id, name, type, season, episode_number) لحلقة برقم رسالتها في القناة، أو None."""
+    engine = get_engine()
+    if not engine:
         return None
+    try:
+        return remember_read(("by_message", msg_id), await read_db(query_first_row, """
+            SELECT s.id, s.name, s.type, e.season, e.episode_number
+            FROM episodes e
+            JOIN series s ON s.id = e.series_id
+            WHERE e.telegram_message_id = :msg_id
+        """, {"msg_id": msg_id}))
+    except Exception as e:
+        return recall_read(("by_message", msg_id), None, f"جلب الحلقة للرسالة {msg_id}", e)
+
+# الحلقة السابقة والتالية باستعلام واحد على الفهرس (series_id, season, episode_number)،
+# عبر حدود المواسم (آخر حلقة في موسم تليها أول حلقة في الموسم التالي)
+# الموسم الفارغ (NULL) يُقارن كـ -1 مثل ترتيب لقطة الكتالوج (المقارنة مع NULL لا تطابق شيئاً)
+EPISODE_NEIGHBORS_QUERY = """
+    SELECT * FROM (
+        SELECT 1 AS direction, season, episode_number, telegram_message_id FROM episodes
+        WHERE series_id = :series_id
+          AND (COALESCE(season, -1), episode_number) > (COALESCE(:season, -1), :episode_number)
+        ORDER BY COALESCE(season, -1), episode_number
+        LIMIT 1
+    ) AS next_episode
+    UNION ALL
+    SELECT * FROM (
+        SELECT -1 AS direction, season, episode_number, telegram_message_id FROM episodes
+        WHERE series_id = :series_id
+          AND (COALESCE(season, -1), episode_number) < (COALESCE(:season, -1), :episode_number)
+        ORDER BY COALESCE(season, -1) DESC, episode_number DESC
+        LIMIT 1
+    ) AS previous_episode
+"""
+
+async def get_episode_neighbors(series_id, season, episode_num):
+    """(السابقة، التالية) لحلقة: كل منهما (season, episode_number, message_id) أو None."""
+    catalog = current_catalog()
+    if catalog:
+        return catalog.neighbors(series_id, season, episode_num)
+    
+    key = ("neighbors", series_id, season, episode_num)
+    try:
+        rows = await read_db(query_rows, EPISODE_NEIGHBORS_QUERY, {
+            "series_id": series_id, "season": season, "episode_number": episode_num
+        })
+        by_direction = {row[0]: tuple(row[1:]) for row in rows}
+        return remember_read(key, (by_direction.get(-1), by_direction.get(1)))
+    except Exception as e:
+        return recall_read(key, (None, None), f"جلب الحلقات المجاورة للمحتوى {series_id}", e)
+
+async def get_letter_counts(content_type):
+    """[(الحرف، عدد المحتويات)] من الأعداد المحسوبة مسبقاً عند الإضافة."""
+    engine = get_engine()
+    if not engine:
+        return []
+    try:
+        rows = await read_db(query_rows, """
+            SELECT initial, series_count FROM series_letter_counts
+            WHERE type = :type AND series_count > 0
+        """, {"type": content_type})
+        remember_read(("letters", content_type), rows)
+    except Exception as e:
+        rows = recall_read(("letters", content_type), [], "جلب حروف الفهرس", e)
+    # الحروف العربية أولاً ثم اللاتينية ثم '#'
+    return sorted(rows, key=lambda row: (row[0] == "#", row[0].isascii(), row[0]))
+
+LETTER_PAGE_QUERY = """
+    SELECT s.id, s.name, s.type,
+           (SELECT COUNT(*) FROM episodes e WHERE e.series_id = s.id) AS episode_count
+    FROM series s
+    WHERE s.type = :type AND s.initial = :initial {keyset}
+    ORDER BY s.sort_key {direction}, s.id {direction}
+    LIMIT :limit
+"""
+
+async def get_letter_page(content_type, initial, after_id=0, before_id=0, limit=None):
+    """صفحة من محتويات حرف بترتيب sort_key (keyset): بعد after_id أو قبل before_id.
+
+    يرجع (الصفوف، هل توجد صفحة سابقة، هل توجد صفحة تالية).
+    """
+    limit = limit or Config.LETTER_PAGE_SIZE
+    params = {"type": content_type, "initial": initial, "limit": limit + 1}
+    if before_id:
+        keyset = "AND (s.sort_key, s.id) < (SELECT sort_key, id FROM series WHERE id = :before_id)"
+        query = LETTER_PAGE_QUERY.format(keyset=keyset, direction="DESC")
+        params["before_id"] = before_id
+    elif after_id:
+        keyset = "AND (s.sort_key, s.id) > (SELECT sort_key, id FROM series WHERE id = :after_id)"
+        query = LETTER_PAGE_QUERY.format(keyset=keyset, direction="ASC")
+        params["after_id"] = after_id
+    else:
+        query = LETTER_PAGE_QUERY.format(keyset="", direction="ASC")
+    key = ("letter_page", content_type, initial, after_id, before_id)
+    try:
+        rows = remember_read(key, await read_db(query_rows, query, params))
+    except Exception as e:
+        rows = recall_read(key, [], f"جلب صفحة الحرف {initial}", e)
+    more = len(rows) > limit
+    rows = rows[:limit]
+    if before_id:
+        return list(reversed(rows)), more, True
+    return rows, bool(after_id), more
+
+def query_direct_data(conn):
+    # جلب المسلسلات
+    series = conn.execute(text("""
+        SELECT id, name FROM series WHERE type = 'series' ORDER BY id ASC
+    """)).fetchall()
+    
+    # جلب الأفلام
+    movies = conn.execute(text("""
+        SELECT id, name FROM series WHERE type = 'movie' ORDER BY id ASC
+    """)).fetchall()
+    return series, movies
 
 async def get_direct_data():
     """جلب البيانات مباشرة بدون JOIN للمقارنة"""
+    engine = get_engine()
     if not engine:
         return [], []
     
     try:
-        with engine.connect() as conn:
-            # جلب المسلسلات
-            series_result = conn.execute(text("""
-                SELECT id, name FROM series WHERE type = 'series' ORDER BY id ASC
-            """))
-            series = series_result.fetchall()
-            
-            # جلب الأفلام
-            movies_result = conn.execute(text("""
-                SELECT id, name FROM series WHERE type = 'movie' ORDER BY id ASC
-            """))
-            movies = movies_result.fetchall()
-            
-            print(f"📊 البيانات المباشرة:")
-            print(f"   - عدد المسلسلات: {len(series)}")
-            print(f"   - عدد الأفلام: {len(movies)}")
-            
-            return series, movies
+        series, movies = await read_db(query_direct_data)
+        
+        print(f"📊 البيانات المباشرة:")
+        print(f"   - عدد المسلسلات: {len(series)}")
+        print(f"   - عدد الأفلام: {len(movies)}")
+        
+        return series, movies
             
     except Exception as e:
         print(f"❌ خطأ في جلب البيانات المباشرة: {e}")
         return [], []
 
+# ==============================
+# 2.1 مراقبة تغييرات الكتالوج وآخر الإضافات
+# ==============================
+# آخر الحلقات المضافة في الذاكرة: (episode_id, series_id, name, type, season, episode_number, message_id)
+LATEST_EPISODES = deque(maxlen=Config.LATEST_BUFFER_SIZE)
+
+# دوال تُستدعى عند تغير الكتالوج: listener(version, new_rows)
+CATALOG_LISTENERS = []
+
+# آخر إصدار للكتالوج وآخر حلقة رآها البوت
+CATALOG_STATE = {"version": None, "last_episode_id": 0}
+
+def fetch_recent_episodes(conn, after_id=0, limit=None):
+    """آخر الحلقات المضافة بعد معرف معين، مرتبة من الأقدم للأحدث."""
+    rows = conn.execute(text("""
+        SELECT e.id, s.id, s.name, s.type, e.season, e.episode_number, e.telegram_message_id
+        FROM episodes e
+        JOIN series s ON e.series_id = s.id
+        WHERE e.id > :after_id
+        ORDER BY e.id DESC
+        LIMIT :limit
+    """), {"after_id": after_id, "limit": limit or Config.LATEST_BUFFER_SIZE}).fetchall()
+    return list(reversed(rows))
+
+def add_latest_episodes(rows):
+    """إضافة حلقات إلى ذاكرة آخر الإضافات (الرسالة المعدلة تحل محل نسختها السابقة)."""
+    for row in rows:
+        for old in [old for old in LATEST_EPISODES if old[6] == row[6]]:
+            LATEST_EPISODES.remove(old)
+        LATEST_EPISODES.append(tuple(row))
+        cache_series_info((row[1], row[2], row[3]))
+
+def read_catalog_changes(conn, known_version, last_episode_id):
+    """(الإصدار، الحلقات الجديدة، هل أعيد بناء القائمة)، أو None إذا لم يتغير الإصدار (داخل خيط)."""
+    version = database.get_catalog_version(conn)
+    if version == known_version:
+        return None
+    rows = fetch_recent_episodes(conn, after_id=last_episode_id)
+    if rows or known_version is None:
+        return version, rows, False
+    # تغيير بدون حلقات جديدة (تعديل أو حذف): نعيد بناء القائمة
+    return version, fetch_recent_episodes(conn), True
+
+async def refresh_catalog():
+    """قراءة إصدار الكتالوج، وعند تغيره جلب الحلقات الجديدة فقط وإبلاغ المستمعين."""
+    known_version = CATALOG_STATE["version"]
+    changes = await run_db(
+        on_connection, get_engine(), read_catalog_changes, (known_version, CATALOG_STATE["last_episode_id"]),
+        timeout=Config.DB_CALL_TIMEOUT_SECONDS,
+    )
+    # الوضع المدمج: قد يكون apply_ingest_change طبق نفس التغيير أثناء الانتظار
+    if changes is None or CATALOG_STATE["version"] != known_version:
+        return
+    version, rows, rebuilt = changes
+    if rebuilt:
+        LATEST_EPISODES.clear()
+    add_latest_episodes(rows)
+    if rows:
+        CATALOG_STATE["last_episode_id"] = max(CATALOG_STATE["last_episode_id"], rows[-1][0])
+    CATALOG_STATE["version"] = version
+    await notify_catalog_listeners(version, rows)
+
+async def notify_catalog_listeners(version, rows):
+    for listener in CATALOG_LISTENERS:
+        try:
+            await listener(version, rows)
+        except Exception as e:
+            print(f"⚠️ خطأ في مستمع تغييرات الكتالوج: {e}")
+
+def run_in_background(coro):
+    """تشغيل مهمة قصيرة مع الاحتفاظ بها في BACKGROUND_TASKS حتى تُلغى عند الإيقاف."""
+    BACKGROUND_TASKS.append(asyncio.create_task(coro))
+    BACKGROUND_TASKS[:] = [task for task in BACKGROUND_TASKS if not task.done()]
+
+def apply_ingest_change(previous_version, version, removed_msg_ids, added_rows):
+    """الوضع المدمج: تطبيق تغيير الـ Worker على ذاكرة البوت مباشرة بعد نجاح معاملته.
+
+    يُطبق فقط إذا كان البوت على الإصدار السابق للتغيير تماماً؛ وإلا (تغيير من عملية
+    أخرى مثل dedupe.py) تُقرأ التغييرات من قاعدة البيانات كالمعتاد.
+    """
+    if CATALOG_STATE["version"] != previous_version:
+        run_in_background(refresh_catalog())
+        return
+    catalog = current_catalog()
+    if catalog is not None:
+        if removed_msg_ids:
+            catalog.remove_messages(removed_msg_ids)
+        for row in added_rows:
+            catalog.add_episode(*row)
+        catalog.version = version
+    
+    if removed_msg_ids:
+        removed = set(removed_msg_ids)
+        for old in [old for old in LATEST_EPISODES if old[6] in removed]:
+            LATEST_EPISODES.remove(old)
+    add_latest_episodes(added_rows)
+    if added_rows:
+        CATALOG_STATE["last_episode_id"] = max(CATALOG_STATE["last_episode_id"], added_rows[-1][0])
+    CATALOG_STATE["version"] = version
+    run_in_background(notify_catalog_listeners(version, added_rows))
+
+async def watch_catalog():
+    """مهمة خلفية تتحقق من إصدار الكتالوج الذي يحدّثه الـ Worker."""
+    while True:
+        await asyncio.sleep(Config.CATALOG_POLL_SECONDS)
+        try:
+            # هذا الاستطلاع هو أيضاً المحاولة التجريبية التي تغلق القاطع عند عودة القاعدة
+            if not DB_STATE["prepared"]:
+                await prepare_database()
+                continue
+            await refresh_catalog()
+            await check_read_replica()
+        except CircuitOpenError:
+            pass
+        except Exception as e:
+            print(f"⚠️ تعذر التحقق من تغييرات الكتالوج: {e}")
+
+# ==============================
+# 2.2 لقطة الإحصائيات (تُحدّث في الخلفية)
+# ==============================
+# {"data": آخر لقطة من stats.collect_stats، "refreshed_at": وقت آخر تحديث، "version": إصدار الكتالوج عندها}
+STATS_SNAPSHOT = {"data": None, "refreshed_at": 0.0, "version": None}
+
+async def refresh_stats(force=False):
+    """تحديث لقطة الإحصائيات، بحد أدنى STATS_REFRESH_SECONDS بين كل تحديثين."""
+    if not force and time.monotonic() - STATS_SNAPSHOT["refreshed_at"] < Config.STATS_REFRESH_SECONDS:
+        return
+    engine = get_engine()
+    if not engine or DB_BREAKER.degraded:
+        return
+    STATS_SNAPSHOT["refreshed_at"] = time.monotonic()
+    version = CATALOG_STATE["version"]
+    try:
+        STATS_SNAPSHOT["data"] = await asyncio.to_thread(collect_stats, get_read_engine())
+        STATS_SNAPSHOT["version"] = version
+    except Exception as e:
+        print(f"⚠️ تعذر تحديث لقطة الإحصائيات: {e}")
+
+async def watch_stats():
+    """مهمة خلفية تلتقط التغييرات التي وصلت أثناء فترة التهدئة بين تحديثين."""
+    while True:
+        await asyncio.sleep(Config.STATS_REFRESH_SECONDS)
+        if STATS_SNAPSHOT["version"] != CATALOG_STATE["version"] or STATS_SNAPSHOT["data"] is None:
+            await refresh_stats()
+
+async def on_catalog_change_stats(version, rows):
+    """مستمع تغييرات الكتالوج: تحديث الإحصائيات في الخلفية دون انتظار."""
+    BACKGROUND_TASKS.append(asyncio.create_task(refresh_stats()))
+    BACKGROUND_TASKS[:] = [task for task in BACKGROUND_TASKS if not task.done()]
+
+CATALOG_LISTENERS.append(on_catalog_change_stats)
+
+def stats_not_ready_text():
+    return "⏳ يتم تجهيز الإحصائيات في الخلفية، حاول مرة أخرى بعد قليل."
+
+def stats_age_text(snapshot):
+    age = (datetime.utcnow() - snapshot["collected_at"]).total_seconds()
+    return f"🕒 _آخر تحديث للإحصائيات قبل {int(age)} ث_"
+
+# ==============================
+# 2.3 تقدم المشاهدة (كتابة مؤجلة على دفعات)
+# ==============================
+WATCH_PROGRESS = ProgressBuffer()
+
+async def flush_watch_progress():
+    """كتابة مواضع المشاهدة المعلقة إلى قاعدة البيانات دفعة واحدة."""
+    engine = get_engine()
+    if not engine:
+        return
+    try:
+        written = await run_db(WATCH_PROGRESS.flush, engine)
+        if written:
+            print(f"💾 تم حفظ تقدم المشاهدة لـ {written} مستخدم/مسلسل")
+    except CircuitOpenError:
+        # تبقى المواضع في الذاكرة حتى تعود القاعدة
+        pass
+    except Exception as e:
+        print(f"⚠️ تعذر حفظ تقدم المشاهدة: {e}")
+
+async def watch_progress_flusher():
+    """مهمة خلفية تكتب تقدم المشاهدة كل PROGRESS_FLUSH_SECONDS."""
+    while True:
+        await asyncio.sleep(Config.PROGRESS_FLUSH_SECONDS)
+        await flush_watch_progress()
+
+async def continue_watching_rows(user, content_id, content_type):
+    """زر "▶️ متابعة" لآخر حلقة فتحها المستخدم في هذا المسلسل (إن وجدت)."""
+    if not user or content_type != 'series':
+        return []
+    try:
+        position = await run_db(
+            WATCH_PROGRESS.get, user.id, content_id, get_engine(), timeout=Config.DB_CALL_TIMEOUT_SECONDS
+        )
+    except Exception as e:
+        if not isinstance(e, CircuitOpenError):
+            print(f"⚠️ تعذر جلب تقدم المشاهدة: {e}")
+        # ما سُجل في هذه العملية متاح دون القاعدة
+        position = WATCH_PROGRESS.get(user.id, content_id)
+    if not position:
+        return []
+    season, ep_num, msg_id = position
+    return [[InlineKeyboardButton(
+        f"▶️ متابعة: الموسم {season} الحلقة {ep_num}",
+        callback_data=encode_episode(content_id, season, ep_num, msg_id)
+    )]]
+
+# ==============================
+# 2.4 ترتيب الشعبية (عدادات تقريبية في الذاكرة)
+# ==============================
+POPULARITY = PopularityTracker(
+    top_k=Config.POPULARITY_TOP_K,
+    width=Config.POPULARITY_SKETCH_WIDTH,
+    depth=Config.POPULARITY_SKETCH_DEPTH,
+)
+
+async def load_popularity():
+    """تحميل آخر لقطة محفوظة للشعبية عند الإقلاع."""
+    engine = get_engine()
+    if not engine:
+        return
+    try:
+        rows = await run_db(load_snapshot, engine)
+        POPULARITY.load(rows)
+        print(f"🔥 تم تحميل لقطة الشعبية ({len(rows)} محتوى)")
+    except Exception as e:
+        print(f"⚠️ تعذر تحميل لقطة الشعبية: {e}")
+
+async def save_popularity():
+    """حفظ قائمة الأكثر شعبية الحالية (استبدال اللقطة السابقة)."""
+    engine = get_engine()
+    if not engine:
+        return
+    try:
+        await run_db(save_snapshot, engine, POPULARITY.ranked())
+    except CircuitOpenError:
+        pass
+    except Exception as e:
+        print(f"⚠️ تعذر حفظ لقطة الشعبية: {e}")
+
+async def watch_popularity():
+    """مهمة خلفية: تناقص العدادات حسب نصف العمر وحفظ لقطة كل POPULARITY_SNAPSHOT_SECONDS."""
+    last_decay = time.monotonic()
+    while True:
+        await asyncio.sleep(Config.POPULARITY_SNAPSHOT_SECONDS)
+        now = time.monotonic()
+        POPULARITY.decay(decay_factor(now - last_decay, Config.POPULARITY_HALF_LIFE_SECONDS))
+        last_decay = now
+        await save_popularity()
+
+# ==============================
+# 2.5 لقطة الكتالوج (إقلاع دافئ وقراءة من الذاكرة)
+# ==============================
+# {"data": CatalogSnapshot في الذاكرة، "saved_version": إصدار آخر لقطة مكتوبة على القرص}
+CATALOG_SNAPSHOT = {"data": None, "saved_version": None}
+CATALOG_SNAPSHOT_LOCK = asyncio.Lock()
+
+def current_catalog():
+    """اللقطة إن كانت بنفس آخر إصدار معروف للكتالوج (أو قبل معرفته عند الإقلاع)، وإلا None."""
+    catalog = CATALOG_SNAPSHOT["data"]
+    if catalog is None:
+        return None
+    if CATALOG_STATE["version"] is not None and catalog.version != CATALOG_STATE["version"]:
+        # أثناء تعطل القاعدة تبقى اللقطة الأقدم أفضل من لا شيء (تُعلَّم الشاشات بأنها قديمة)
+        if not DB_BREAKER.degraded:
+            return None
+    return catalog
+
+async def load_catalog_snapshot():
+    """تحميل لقطة الكتالوج من القرص قبل أي اتصال بقاعدة البيانات."""
+    path = Config.CATALOG_SNAPSHOT_PATH
+    if not path:
+        return
+    started = time.perf_counter()
+    try:
+        catalog = await asyncio.to_thread(CatalogSnapshot.load, path)
+    except Exception as e:
+        print(f"⚠️ تعذر قراءة لقطة الكتالوج {path}: {e}")
+        return
+    if catalog is None:
+        print(f"ℹ️ لا توجد لقطة كتالوج صالحة في {path}")
+        return
+    CATALOG_SNAPSHOT["data"] = catalog
+    CATALOG_SNAPSHOT["saved_version"] = catalog.version
+    print(
+        f"📦 تم تحميل لقطة الكتالوج (إصدار {catalog.version}، {len(catalog.series)} محتوى، "
+        f"{catalog.episode_count} حلقة) في {(time.perf_counter() - started) * 1000:.0f}ms"
+    )
+
+async def rebuild_catalog_snapshot():
+    """إعادة بناء اللقطة في الخلفية إن كانت أقدم من آخر إصدار معروف."""
+    engine = get_engine()
+    if not engine:
+        return
+    async with CATALOG_SNAPSHOT_LOCK:
+        catalog = CATALOG_SNAPSHOT["data"]
+        if catalog is not None and catalog.version == CATALOG_STATE["version"]:
+            return
+        started = time.perf_counter()
+        try:
+            catalog = await asyncio.to_thread(CatalogSnapshot.build, get_read_engine())
+        except Exception as e:
+            print(f"⚠️ تعذر بناء لقطة الكتالوج: {e}")
+            return
+        current = CATALOG_SNAPSHOT["data"]
+        if current is not None and current.version > catalog.version:
+            # حُدثت اللقطة الحالية في الذاكرة أثناء البناء (الوضع المدمج)
+            return
+        CATALOG_SNAPSHOT["data"] = catalog
+        print(
+            f"📦 تم بناء لقطة الكتالوج (إصدار {catalog.version}، {catalog.episode_count} حلقة) "
+            f"في {(time.perf_counter() - started) * 1000:.0f}ms"
+        )
+
+async def save_catalog_snapshot():
+    """كتابة اللقطة على القرص إن تغيرت منذ آخر كتابة."""
+    catalog = CATALOG_SNAPSHOT["data"]
+    path = Config.CATALOG_SNAPSHOT_PATH
+    if not path or catalog is None or catalog.version == CATALOG_SNAPSHOT["saved_version"]:
+        return
+    try:
+        await asyncio.to_thread(catalog.save, path)
+        CATALOG_SNAPSHOT["saved_version"] = catalog.version
+    except Exception as e:
+        print(f"⚠️ تعذر حفظ لقطة الكتالوج في {path}: {e}")
+
+async def watch_catalog_snapshot():
+    """مهمة خلفية تحفظ اللقطة كل CATALOG_SNAPSHOT_SECONDS."""
+    while True:
+        await asyncio.sleep(Config.CATALOG_SNAPSHOT_SECONDS)
+        await save_catalog_snapshot()
+
+async def on_catalog_change_snapshot(version, rows):
+    """مستمع تغييرات الكتالوج: القراءة تعود لقاعدة البيانات حتى تُبنى لقطة بالإصدار الجديد."""
+    catalog = CATALOG_SNAPSHOT["data"]
+    if catalog is None or catalog.version != version:
+        run_in_background(rebuild_catalog_snapshot())
+
+CATALOG_LISTENERS.append(on_catalog_change_snapshot)
+
+# ==============================
+# 2.6 تشخيص الذاكرة (/memory للمشرفين)
+# ==============================
+def watch_bot_memory(application):
+    """أنواع PTB وذاكرات البوت المؤقتة التي تُعرض في تقارير الذاكرة."""
+    DIAGNOSTICS.watch_types(
+        "Update", "CallbackQuery", "InlineKeyboardMarkup", "InlineKeyboardButton", "User", "Chat"
+    )
+    DIAGNOSTICS.track_size("user_data", lambda: len(application.user_data))
+    DIAGNOSTICS.track_size("chat_data", lambda: len(application.chat_data))
+    DIAGNOSTICS.track_size("series_cache", lambda: len(SERIES_CACHE))
+    DIAGNOSTICS.track_size("last_good_reads", lambda: len(LAST_GOOD_READS))
+    DIAGNOSTICS.track_size("watch_progress", lambda: len(WATCH_PROGRESS.known) + len(WATCH_PROGRESS.pending))
+    DIAGNOSTICS.track_size("episode_files", lambda: len(EPISODE_FILES.known))
+    if RATE_LIMITER:
+        DIAGNOSTICS.track_size("rate_limit_buckets", lambda: len(RATE_LIMITER.buckets))
+
 # ==============================
 # 3. دوال البوت الرئيسية
 # ==============================
+class ReplyQuery:
+    """بديل CallbackQuery لعرض شاشات الأزرار من أمر نصي (مثل /start s12).
+
+    أول edit_message_text يرسل رسالة جديدة رداً على الأمر، وما بعده يعدلها.
+    """
+
+    def __init__(self, message, user):
+        self.message = message
+        self.from_user = user
+        self.sent = None
+
+    async def answer(self, *args, **kwargs):
+        pass
+
+    async def edit_message_text(self, text, **kwargs):
+        if self.sent is None:
+            self.sent = await self.message.reply_text(text, **kwargs)
+        else:
+            self.sent = await self.sent.edit_text(text, **kwargs)
+        return self.sent
+
+class ReplyUpdate:
+    """تحديث يحمل ReplyQuery، تكفي لدوال العرض التي لا تقرأ إلا update.callback_query."""
+
+    def __init__(self, update):
+        self.callback_query = ReplyQuery(update.message, update.effective_user)
+        self.effective_user = update.effective_user
+        self.effective_chat = update.effective_chat
+
+async def open_start_payload(update: Update, context: ContextTypes.DEFAULT_TYPE, payload):
+    """فتح مسلسل أو حلقة مباشرة من رابط t.me/<bot>?start=s12 أو ?start=e3456.
+
+    يرجع False إذا لم تكن الحمولة معروفة، فتظهر رسالة الترحيب العادية.
+    """
+    target = decode_start(payload)
+    if not target:
+        return False
+    kind, target_id = target
+    reply_update = ReplyUpdate(update)
+    if kind == "series":
+        await show_content_details(reply_update, context, target_id)
+        return True
+    row = await get_episode_by_message(target_id)
+    if not row:
+        await update.message.reply_text("❌ الحلقة/الجزء غير موجود.")
+        return True
+    series_id, series_name, series_type, season, episode_num = row
+    cache_series_info((series_id, series_name, series_type))
+    await render_episode_details(
+        reply_update.callback_query, series_id, series_name, series_type, season, episode_num, target_id
+    )
+    return True
+
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """أمر /start"""
+    """أمر /start (مع حمولة اختيارية من رابط عميق: s<معرف المحتوى> أو e<رقم الرسالة>)"""
+    if update.message and context.args and await open_start_payload(update, context, context.args[0]):
+        return
+    
     keyboard = [
         [InlineKeyboardButton("📺 المسلسلات", callback_data='series_list'),
          InlineKeyboardButton("🎬 الأفلام", callback_data='movies_list')],
-        [InlineKeyboardButton("📁 جميع المحتويات", callback_data='all_content')],
-        [InlineKeyboardButton("🔍 بحث سريع", switch_inline_query_current_chat='')],
-        [InlineKeyboardButton("🔄 اختبار قاعدة البيانات", callback_data='test_db')],
+        [InlineKeyboardButton("📁 جميع المحتويات", callback_data='all_content'),
+         InlineKeyboardButton("🆕 آخر الإضافات", callback_data='latest')],
+        [InlineKeyboardButton("🔥 الرائج", callback_data='trending'),
+         InlineKeyboardButton("🔍 بحث سريع", switch_inline_query_current_chat='')],
     ]
+    if is_admin(update.effective_user):
+        keyboard.append([InlineKeyboardButton("🔄 اختبار قاعدة البيانات", callback_data='test_db')])
     
     reply_markup = InlineKeyboardMarkup(keyboard)
     
@@ -193,8 +1089,11 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 /series - عرض المسلسلات
 /movies - عرض الأفلام
 /all - عرض كل المحتويات
-/test - اختبار قاعدة البيانات
-/debug - فحص حالة النظام
+/latest - آخر الإضافات
+/trending - الأكثر مشاهدة حالياً
+/test - اختبار قاعدة البيانات (للمشرفين)
+/debug - فحص حالة النظام (للمشرفين)
+/memory - تشخيص الذاكرة (للمشرفين)
     """
     
     if update.callback_query:
@@ -210,8 +1109,9 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
             reply_markup=reply_markup
         )
 
-async def show_content(update: Update, context: ContextTypes.DEFAULT_TYPE, content_type=None):
-    """عرض المحتويات حسب النوع"""
+async def show_content(update: Update, context: ContextTypes.DEFAULT_TYPE, content_type=None, sort=None):
+    """عرض المحتويات حسب النوع (sort='hot' للترتيب حسب الشعبية بدلاً من الأقدم أولاً)"""
+    engine = get_engine()
     if not engine:
         error_msg = "❌ قاعدة البيانات غير متاحة حالياً."
         if update.callback_query:
@@ -221,6 +1121,10 @@ async def show_content(update: Update, context: ContextTypes.DEFAULT_TYPE, conte
         return
     
     content_list = await get_all_content(content_type)
+    if sort == 'hot':
+        # الترتيب مستقر، فالمحتويات بنفس الشعبية تبقى بترتيب المعرف
+        content_list = sorted(content_list, key=lambda row: -POPULARITY.score(row[0]))
+    list_data = {'series': 'series_list', 'movie': 'movies_list'}.get(content_type, 'all_content')
     
     if content_type == 'series':
         title = "📺 *قائمة المسلسلات*"
@@ -321,6 +1225,8 @@ async def show_content(update: Update, context: ContextTypes.DEFAULT_TYPE, conte
             return
     
     # بناء النص
+    if sort == 'hot':
+        title += " 🔥"
     text = f"{title}\n\n"
     keyboard = []
     
@@ -341,8 +1247,17 @@ async def show_content(update: Update, context: ContextTypes.DEFAULT_TYPE, conte
                 callback_data=f"content_{content_id}"
             )
         ])
+    text += stale_note()
     
     # أزرار التنقل
+    if sort == 'hot':
+        keyboard.append([InlineKeyboardButton("🆔 الترتيب الافتراضي", callback_data=list_data)])
+    else:
+        keyboard.append([InlineKeyboardButton("🔥 حسب الشعبية", callback_data=f"hot_{list_data}")])
+    # content_type تغيّر داخل الحلقة السابقة، فالنوع المعروض يُؤخذ من list_data
+    index_type = {'series_list': 's', 'movies_list': 'm'}.get(list_data)
+    if index_type:
+        keyboard.append([InlineKeyboardButton("🔤 الفهرس الأبجدي", callback_data=f"ix_{index_type}")])
     keyboard.append([
         InlineKeyboardButton("📺 المسلسلات", callback_data="series_list"),
         InlineKeyboardButton("🎬 الأفلام", callback_data="movies_list")
@@ -365,6 +1280,137 @@ async def show_content(update: Update, context: ContextTypes.DEFAULT_TYPE, conte
             reply_markup=reply_markup
         )
 
+# ==============================
+# 3.1 الفهرس الأبجدي
+# ==============================
+# الحرف الأول من النوع في callback_data: ix_s (حروف المسلسلات)، ln_s_م_<id> (الصفحة التالية)، lp_s_م_<id> (السابقة)
+LETTER_TYPES = {'s': 'series', 'm': 'movie'}
+LETTERS_PER_ROW = 6
+
+def letter_label(initial):
+    return initial.upper()
+
+async def show_letter_index(update: Update, context: ContextTypes.DEFAULT_TYPE, content_type):
+    """لوحة الحروف مع عدد المحتويات لكل حرف."""
+    query = update.callback_query
+    letters = await get_letter_counts(content_type)
+    title = "📺 *فهرس المسلسلات*" if content_type == 'series' else "🎬 *فهرس الأفلام*"
+    if not letters:
+        await query.edit_message_text(
+            f"{title}\n\n📭 لا توجد محتويات حالياً.",
+            parse_mode='Markdown',
+            reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ رجوع", callback_data=list_callback(content_type))]])
+        )
+        return
+    
+    keyboard = []
+    row = []
+    for initial, count in letters:
+        row.append(InlineKeyboardButton(
+            f"{letter_label(initial)} ({count})",
+            callback_data=f"ln_{content_type[0]}_{initial}_0"
+        ))
+        if len(row) == LETTERS_PER_ROW:
+            keyboard.append(row)
+            row = []
+    if row:
+        keyboard.append(row)
+    keyboard.append([
+        InlineKeyboardButton("⬅️ رجوع", callback_data=list_callback(content_type)),
+        InlineKeyboardButton("🏠 الرئيسية", callback_data="home")
+    ])
+    total = sum(count for _, count in letters)
+    await query.edit_message_text(
+        f"{title}\n\n🔤 اختر الحرف الأول ({total} محتوى):{stale_note()}",
+        parse_mode='Markdown',
+        reply_markup=InlineKeyboardMarkup(keyboard)
+    )
+
+async def show_letter_page(update: Update, context: ContextTypes.DEFAULT_TYPE, content_type, initial,
+                           after_id=0, before_id=0):
+    """صفحة محتويات حرف واحد مرتبة أبجدياً، مع أزرار السابق والتالي."""
+    query = update.callback_query
+    rows, has_prev, has_next = await get_letter_page(content_type, initial, after_id, before_id)
+    type_code = content_type[0]
+    type_icon = "📺" if content_type == 'series' else "🎬"
+    unit = "حلقة" if content_type == 'series' else "جزء"
+    
+    text = f"🔤 *{letter_label(initial)}*\n\n"
+    keyboard = []
+    for content_id, name, _, episode_count in rows:
+        text += f"{type_icon} {name} ({episode_count} {unit})\n"
+        keyboard.append([InlineKeyboardButton(f"{type_icon} {name[:30]}", callback_data=f"content_{content_id}")])
+    if not rows:
+        text += "📭 لا توجد محتويات بهذا الحرف."
+    text += stale_note()
+    
+    pager = []
+    if has_prev and rows:
+        pager.append(InlineKeyboardButton("◀️ السابق", callback_data=f"lp_{type_code}_{initial}_{rows[0][0]}"))
+    if has_next and rows:
+        pager.append(InlineKeyboardButton("التالي ▶️", callback_data=f"ln_{type_code}_{initial}_{rows[-1][0]}"))
+    if pager:
+        keyboard.append(pager)
+    keyboard.append([
+        InlineKeyboardButton("🔤 الحروف", callback_data=f"ix_{type_code}"),
+        InlineKeyboardButton("🏠 الرئيسية", callback_data="home")
+    ])
+    await query.edit_message_text(text, parse_mode='Markdown', reply_markup=InlineKeyboardMarkup(keyboard))
+
+async def show_latest(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """عرض آخر الإضافات من الذاكرة مباشرة (بدون أي استعلام)"""
+    if LATEST_EPISODES:
+        text = "🆕 *آخر الإضافات*\n\n"
+        keyboard = []
+        for ep_id, series_id, name, content_type, season, ep_num, msg_id in reversed(LATEST_EPISODES):
+            if content_type == 'series':
+                label = f"📺 {name} - م{season} ح{ep_num}"
+            else:
+                label = f"🎬 {name} - جزء {season}"
+            text += f"{label}\n"
+            keyboard.append([
+                InlineKeyboardButton(label[:40], callback_data=encode_episode(series_id, season, ep_num, msg_id))
+            ])
+    else:
+        text = "📭 لا توجد إضافات جديدة حالياً."
+        keyboard = []
+    text += stale_note()
+    keyboard.append([InlineKeyboardButton("🏠 الرئيسية", callback_data="home")])
+    reply_markup = InlineKeyboardMarkup(keyboard)
+    
+    if update.callback_query:
+        await update.callback_query.edit_message_text(text, parse_mode='Markdown', reply_markup=reply_markup)
+    else:
+        await update.message.reply_text(text, parse_mode='Markdown', reply_markup=reply_markup)
+
+async def show_trending(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """عرض الأكثر شعبية حالياً من العدادات في الذاكرة"""
+    ranked = POPULARITY.ranked()
+    infos = await get_content_infos([series_id for series_id, _ in ranked[:Config.TRENDING_SIZE * 2]])
+    # المحتويات المحذوفة قد تبقى في العدادات حتى تتناقص
+    ranked = [(series_id, score) for series_id, score in ranked if series_id in infos][:Config.TRENDING_SIZE]
+    
+    if ranked:
+        text = "🔥 *الرائج الآن*\n\n"
+        keyboard = []
+        for position, (series_id, score) in enumerate(ranked, start=1):
+            _, name, content_type = infos[series_id]
+            type_icon = "📺" if content_type == 'series' else "🎬"
+            text += f"{position}. {type_icon} {name}\n"
+            keyboard.append([
+                InlineKeyboardButton(f"{position}. {type_icon} {name[:30]}", callback_data=f"content_{series_id}")
+            ])
+    else:
+        text = "📭 لا توجد بيانات كافية عن الرائج بعد."
+        keyboard = []
+    keyboard.append([InlineKeyboardButton("🏠 الرئيسية", callback_data="home")])
+    reply_markup = InlineKeyboardMarkup(keyboard)
+    
+    if update.callback_query:
+        await update.callback_query.edit_message_text(text, parse_mode='Markdown', reply_markup=reply_markup)
+    else:
+        await update.message.reply_text(text, parse_mode='Markdown', reply_markup=reply_markup)
+
 async def series_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """أمر /series - عرض المسلسلات"""
     await show_content(update, context, 'series')
@@ -378,116 +1424,85 @@ async def all_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await show_content(update, context)
 
 async def test_db_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """أمر /test - اختبار قاعدة البيانات"""
-    try:
-        if not engine:
-            await update.message.reply_text("❌ قاعدة البيانات غير متصلة.")
-            return
-        
-        with engine.connect() as conn:
-            # جلب جميع الجداول
-            tables_result = conn.execute(text("""
-                SELECT table_name FROM information_schema.tables 
-                WHERE table_schema = 'public'
-            """)).fetchall()
-            
-            tables_info = "📋 *الجداول الموجودة:*\n"
-            for table in tables_result:
-                table_name = table[0]
-                count_result = conn.execute(text(f"SELECT COUNT(*) FROM {table_name}")).fetchone()
-                count = count_result[0] if count_result else 0
-                tables_info += f"• `{table_name}`: {count} صف\n"
-            
-            # جلب عينات من البيانات
-            series_sample = conn.execute(text("""
-                SELECT id, name, type FROM series ORDER BY id LIMIT 5
-            """)).fetchall()
-            
-            episodes_sample = conn.execute(text("""
-                SELECT id, series_id, season, episode_number FROM episodes ORDER BY id LIMIT 5
-            """)).fetchall()
-            
-            series_text = "🎬 *عينة من المسلسلات والأفلام:*\n"
-            for row in series_sample:
-                series_text += f"• ID:{row[0]} - {row[1]} ({row[2]})\n"
-            
-            episodes_text = "📺 *عينة من الحلقات:*\n"
-            for row in episodes_sample:
-                episodes_text += f"• ID:{row[0]} - مسلسل:{row[1]} - م{row[2]} ح{row[3]}\n"
-            
-            reply_text = f"{tables_info}\n{series_text}\n{episodes_text}"
-            
-        await update.message.reply_text(reply_text, parse_mode='Markdown')
-        
-    except Exception as e:
-        await update.message.reply_text(f"❌ خطأ في اختبار قاعدة البيانات:\n`{str(e)[:300]}`")
+    """أمر /test - اختبار قاعدة البيانات (من لقطة الإحصائيات، بدون مسح الجداول)"""
+    snapshot = STATS_SNAPSHOT.get("data")
+    if not snapshot:
+        await update.message.reply_text(stats_not_ready_text())
+        return
+    
+    tables_info = "📋 *الجداول الموجودة:*\n"
+    for table_name, count in sorted(snapshot["table_counts"].items()):
+        approx = "~" if table_name in snapshot["approximate_tables"] else ""
+        tables_info += f"• `{table_name}`: {approx}{count} صف\n"
+    
+    series_text = "🎬 *عينة من المسلسلات والأفلام:*\n"
+    for row in snapshot["series_sample"]:
+        series_text += f"• ID:{row[0]} - {row[1]} ({row[2]})\n"
+    
+    episodes_text = "📺 *عينة من الحلقات:*\n"
+    for row in snapshot["episodes_sample"]:
+        episodes_text += f"• ID:{row[0]} - مسلسل:{row[1]} - م{row[2]} ح{row[3]}\n"
+    
+    reply_text = f"{tables_info}\n{series_text}\n{episodes_text}\n{stats_age_text(snapshot)}"
+    await update.message.reply_text(reply_text, parse_mode='Markdown')
+
+async def memory_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """أمر /memory [rss|snap|stop|objects] - تشخيص ذاكرة البوت (للمشرفين)"""
+    message = update.effective_message
+    # تحقق ثانٍ بعد limit_requests: snap يشغل tracemalloc للعملية كلها و objects يمر على كل الكائنات
+    if not is_admin(update.effective_user):
+        await message.reply_text(ADMIN_ONLY_TEXT)
+        return
+    action = context.args[0].lower() if context.args else "rss"
+    if action not in MEMORY_ACTIONS:
+        await message.reply_text(f"الاستخدام: /memory [{'|'.join(MEMORY_ACTIONS)}]")
+        return
+    report = DIAGNOSTICS.report(action)
+    # حد طول رسالة تليجرام
+    await message.reply_text(report[:4000])
 
 async def debug_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """أمر /debug - فحص حالة النظام"""
-    try:
-        if not engine:
-            await update.message.reply_text("❌ قاعدة البيانات غير متصلة.")
-            return
-        
-        with engine.connect() as conn:
-            # إحصائيات عامة
-            series_result = conn.execute(text("SELECT COUNT(*) FROM series WHERE type = 'series'")).fetchone()
-            movies_result = conn.execute(text("SELECT COUNT(*) FROM series WHERE type = 'movie'")).fetchone()
-            episodes_result = conn.execute(text("SELECT COUNT(*) FROM episodes")).fetchone()
-            
-            # تفاصيل أكثر
-            series_with_episodes = conn.execute(text("""
-                SELECT s.name, s.type, COUNT(e.id) as ep_count
-                FROM series s
-                LEFT JOIN episodes e ON s.id = e.series_id
-                GROUP BY s.id, s.name, s.type
-                ORDER BY s.id ASC
-                LIMIT 5
-            """)).fetchall()
-            
-            # آخر 10 حلقات مضافة
-            recent_eps = conn.execute(text("""
-                SELECT s.name, s.type, e.season, e.episode_number, e.added_at
-                FROM episodes e 
-                JOIN series s ON e.series_id = s.id 
-                ORDER BY e.id DESC 
-                LIMIT 10
-            """)).fetchall()
-        
-        series_count = series_result[0] if series_result else 0
-        movies_count = movies_result[0] if movies_result else 0
-        episodes_count = episodes_result[0] if episodes_result else 0
-        
-        series_details = "📊 *تفاصيل بعض المحتويات:*\n"
-        for row in series_with_episodes:
-            name, content_type, ep_count = row
-            icon = "📺" if content_type == 'series' else "🎬"
-            series_details += f"{icon} {name}: {ep_count} {'حلقة' if content_type == 'series' else 'جزء'}\n"
-        
-        recent_details = "🆕 *آخر الحلقات المضافة:*\n"
-        for row in recent_eps:
-            name, content_type, season, ep_num, added_at = row
-            icon = "📺" if content_type == 'series' else "🎬"
-            if content_type == 'series':
-                recent_details += f"{icon} {name}: م{season} ح{ep_num}\n"
-            else:
-                recent_details += f"{icon} {name}: جزء {season}\n"
-        
-        reply_text = (
-            f"📊 **فحص النظام:**\n"
-            f"• قاعدة البيانات: {'✅ متصلة' if engine else '❌ غير متصلة'}\n"
-            f"• عدد المسلسلات: `{series_count}`\n"
-            f"• عدد الأفلام: `{movies_count}`\n"
-            f"• إجمالي المحتويات: `{series_count + movies_count}`\n"
-            f"• عدد الحلقات/الأجزاء: `{episodes_count}`\n\n"
-            f"{series_details}\n"
-            f"{recent_details}"
-        )
-        
-        await update.message.reply_text(reply_text, parse_mode='Markdown')
-        
-    except Exception as e:
-        await update.message.reply_text(f"❌ خطأ في الفحص:\n`{str(e)[:300]}`")
+    """أمر /debug - فحص حالة النظام (من لقطة الإحصائيات وذاكرة آخر الإضافات)"""
+    snapshot = STATS_SNAPSHOT.get("data")
+    if not snapshot:
+        await update.message.reply_text(stats_not_ready_text())
+        return
+    
+    series_count = snapshot["series_count"]
+    movies_count = snapshot["movies_count"]
+    episodes_count = snapshot["episodes_count"]
+    episodes_approx = "~" if snapshot["episodes_approximate"] else ""
+    
+    series_details = "📊 *تفاصيل بعض المحتويات:*\n"
+    for name, content_type, ep_count in snapshot["series_with_episodes"]:
+        icon = "📺" if content_type == 'series' else "🎬"
+        series_details += f"{icon} {name}: {ep_count} {'حلقة' if content_type == 'series' else 'جزء'}\n"
+    
+    # آخر 10 حلقات مضافة
+    recent_details = "🆕 *آخر الحلقات المضافة:*\n"
+    for ep_id, series_id, name, content_type, season, ep_num, msg_id in list(reversed(LATEST_EPISODES))[:10]:
+        icon = "📺" if content_type == 'series' else "🎬"
+        if content_type == 'series':
+            recent_details += f"{icon} {name}: م{season} ح{ep_num}\n"
+        else:
+            recent_details += f"{icon} {name}: جزء {season}\n"
+    
+    reply_text = (
+        f"📊 **فحص النظام:**\n"
+        f"• قاعدة البيانات: {'⚠️' if DB_BREAKER.degraded else '✅'} `{DB_BREAKER.status()}`\n"
+        f"• عدد المسلسلات: `{series_count}`\n"
+        f"• عدد الأفلام: `{movies_count}`\n"
+        f"• إجمالي المحتويات: `{series_count + movies_count}`\n"
+        f"• عدد الحلقات/الأجزاء: `{episodes_approx}{episodes_count}`\n"
+        f"• إصدار الكتالوج: `{CATALOG_STATE['version']}`\n"
+        f"• نسخة القراءة: {READ_REPLICA.status(CATALOG_STATE['version']) if READ_REPLICA else 'غير مفعلة'}\n"
+        f"• زمن الإقلاع: {format_startup_times()}\n\n"
+        f"{series_details}\n"
+        f"{recent_details}\n"
+        f"{stats_age_text(snapshot)}"
+    )
+    
+    await update.message.reply_text(reply_text, parse_mode='Markdown')
 
 # ==============================
 # 4. معالج الأزرار التفاعلية
@@ -507,6 +1522,14 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await test_db_button(update, context)
         return
     
+    elif data == 'latest':
+        await show_latest(update, context)
+        return
+    
+    elif data == 'trending':
+        await show_trending(update, context)
+        return
+    
     elif data == 'all_content':
         await show_content(update, context)
         return
@@ -519,68 +1542,135 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await show_content(update, context, 'movie')
         return
     
+    elif data.startswith('hot_'):
+        content_type = {'series_list': 'series', 'movies_list': 'movie'}.get(data[len('hot_'):])
+        await show_content(update, context, content_type, sort='hot')
+        return
+    
+    elif data.startswith('ix_') and data[3:] in LETTER_TYPES:
+        await show_letter_index(update, context, LETTER_TYPES[data[3:]])
+        return
+    
+    elif data.startswith(('ln_', 'lp_')):
+        direction, type_code, initial, row_id = data.split('_', 3)
+        if type_code in LETTER_TYPES:
+            row_id = int(row_id)
+            await show_letter_page(
+                update, context, LETTER_TYPES[type_code], initial,
+                after_id=row_id if direction == 'ln' else 0,
+                before_id=row_id if direction == 'lp' else 0,
+            )
+        return
+    
     elif data.startswith('content_'):
         content_id = int(data.split('_')[1])
+        POPULARITY.hit(content_id)
         await show_content_details(update, context, content_id)
         return
     
+    elif data.startswith('season_'):
+        _, content_id, season_num = data.split('_')
+        await show_season(update, context, int(content_id), parse_season(season_num))
+        return
+    
+    elif data.startswith('range_'):
+        _, content_id, season_num, low = data.split('_')
+        await show_season(update, context, int(content_id), parse_season(season_num), low=int(low))
+        return
+    
     elif data.startswith('ep_'):
+        # أزرار قديمة تحمل معرف الحلقة فقط
         episode_id = int(data.split('_')[1])
         await show_episode_details(update, context, episode_id)
         return
+    
+    elif (episode := decode_episode(data)) is not None:
+        await show_encoded_episode(update, context, *episode)
+        return
+    
+    elif (episode := decode_send(data)) is not None:
+        await send_episode_here(update, context, *episode)
+        return
 
 async def test_db_button(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """اختبار قاعدة البيانات من الزر"""
+    """اختبار قاعدة البيانات من الزر (من لقطة الإحصائيات)"""
     query = update.callback_query
     
-    try:
-        if not engine:
-            await query.edit_message_text("❌ قاعدة البيانات غير متصلة.")
-            return
-        
-        with engine.connect() as conn:
-            # جلب إحصائيات بسيطة
-            series_count = conn.execute(text("SELECT COUNT(*) FROM series WHERE type = 'series'")).scalar()
-            movies_count = conn.execute(text("SELECT COUNT(*) FROM series WHERE type = 'movie'")).scalar()
-            
-            # جلب بعض الأمثلة
-            series_examples = conn.execute(text("""
-                SELECT name FROM series WHERE type = 'series' ORDER BY id LIMIT 3
-            """)).fetchall()
-            
-            movies_examples = conn.execute(text("""
-                SELECT name FROM series WHERE type = 'movie' ORDER BY id LIMIT 3
-            """)).fetchall()
-        
-        series_names = [row[0] for row in series_examples] if series_examples else ["لا يوجد"]
-        movies_names = [row[0] for row in movies_examples] if movies_examples else ["لا يوجد"]
-        
-        reply_text = (
-            f"✅ *اختبار قاعدة البيانات:*\n\n"
-            f"📊 *الإحصائيات:*\n"
-            f"• عدد المسلسلات: {series_count}\n"
-            f"• عدد الأفلام: {movies_count}\n\n"
-            f"📺 *أمثلة على المسلسلات:*\n"
-            f"{chr(10).join(['• ' + name for name in series_names])}\n\n"
-            f"🎬 *أمثلة على الأفلام:*\n"
-            f"{chr(10).join(['• ' + name for name in movies_names])}\n\n"
-            f"ℹ️ *ملاحظة:* إذا كانت الأرقام غير صفرية ولكن لا تظهر في القوائم، قد يكون هناك مشكلة في استعلام JOIN."
-        )
-        
-        keyboard = [
-            [InlineKeyboardButton("📺 عرض المسلسلات", callback_data="series_list"),
-             InlineKeyboardButton("🎬 عرض الأفلام", callback_data="movies_list")],
-            [InlineKeyboardButton("🏠 الرئيسية", callback_data="home")]
-        ]
-        
-        await query.edit_message_text(
-            reply_text,
-            parse_mode='Markdown',
-            reply_markup=InlineKeyboardMarkup(keyboard)
+    snapshot = STATS_SNAPSHOT.get("data")
+    if not snapshot:
+        await query.edit_message_text(stats_not_ready_text())
+        return
+    
+    series_names = snapshot["series_examples"] or ["لا يوجد"]
+    movies_names = snapshot["movies_examples"] or ["لا يوجد"]
+    
+    reply_text = (
+        f"✅ *اختبار قاعدة البيانات:*\n\n"
+        f"📊 *الإحصائيات:*\n"
+        f"• عدد المسلسلات: {snapshot['series_count']}\n"
+        f"• عدد الأفلام: {snapshot['movies_count']}\n\n"
+        f"📺 *أمثلة على المسلسلات:*\n"
+        f"{chr(10).join(['• ' + name for name in series_names])}\n\n"
+        f"🎬 *أمثلة على الأفلام:*\n"
+        f"{chr(10).join(['• ' + name for name in movies_names])}\n\n"
+        f"ℹ️ *ملاحظة:* إذا كانت الأرقام غير صفرية ولكن لا تظهر في القوائم، قد يكون هناك مشكلة في استعلام JOIN.\n"
+        f"{stats_age_text(snapshot)}"
+    )
+    
+    keyboard = [
+        [InlineKeyboardButton("📺 عرض المسلسلات", callback_data="series_list"),
+         InlineKeyboardButton("🎬 عرض الأفلام", callback_data="movies_list")],
+        [InlineKeyboardButton("🏠 الرئيسية", callback_data="home")]
+    ]
+    
+    await query.edit_message_text(
+        reply_text,
+        parse_mode='Markdown',
+        reply_markup=InlineKeyboardMarkup(keyboard)
+    )
+
+# الحد الأقصى لأزرار الحلقات في رسالة واحدة (حدود لوحة مفاتيح تليجرام)
+EPISODE_GRID_LIMIT = 50
+EPISODES_PER_ROW = 5
+
+def list_callback(content_type):
+    """callback_data لقائمة النوع (المسلسلات أو الأفلام)."""
+    return "series_list" if content_type == 'series' else "movies_list"
+
+def season_label(content_type, season_num):
+    if season_num is None:
+        return "بدون موسم" if content_type == 'series' else "بدون جزء"
+    return f"الموسم {season_num}" if content_type == 'series' else f"الجزء {season_num}"
+
+def parse_season(token):
+    """الموسم من بيانات الزر: 'None' للحلقات بلا موسم (NULL)."""
+    return None if token == "None" else int(token)
+
+def season_sort_key(season_num):
+    """بلا موسم أولاً، كما في ترتيب اللقطة والاستعلامات (COALESCE(season, -1))."""
+    return -1 if season_num is None else season_num
+
+def range_label(low, high):
+    return f"{low}" if low == high else f"{low}–{high}"
+
+def build_episode_rows(content_id, episodes):
+    """أزرار الحلقات (5 أزرار في كل صف) بترميز callback مضغوط."""
+    rows = []
+    row = []
+    for ep_id, season_num, ep_num, msg_id, channel_id in episodes:
+        row.append(
+            InlineKeyboardButton(
+                f"{ep_num}",
+                callback_data=encode_episode(content_id, season_num, ep_num, msg_id)
+            )
         )
-        
-    except Exception as e:
-        await query.edit_message_text(f"❌ خطأ في اختبار قاعدة البيانات:\n`{str(e)[:200]}`")
+        # كل 5 أزرار نبدأ صف جديد
+        if len(row) == EPISODES_PER_ROW:
+            rows.append(row)
+            row = []
+    if row:
+        rows.append(row)
+    return rows
 
 async def show_content_details(update: Update, context: ContextTypes.DEFAULT_TYPE, content_id):
     """عرض تفاصيل محتوى محدد (مسلسل أو فيلم)"""
@@ -593,14 +1683,15 @@ async def show_content_details(update: Update, context: ContextTypes.DEFAULT_TYP
         return
     
     content_id, name, content_type = content_info
-    episodes = await get_content_episodes(content_id)
+    # نجلب حداً أقصى من الحلقات: إذا تجاوزه المحتوى نعرض اختيار المواسم بدلاً منها
+    episodes = await get_content_episodes(content_id, limit=EPISODE_GRID_LIMIT + 1)
     
     type_arabic = "مسلسل" if content_type == 'series' else "فيلم"
     type_icon = "📺" if content_type == 'series' else "🎬"
     
     if not episodes:
         message_text = f"{type_icon} *{name}*\n\n📭 لا توجد { 'حلقات' if content_type == 'series' else 'أجزاء' } حالياً."
-        keyboard = [[InlineKeyboardButton("⬅️ رجوع", callback_data=f"{content_type}_list")]]
+        keyboard = [[InlineKeyboardButton("⬅️ رجوع", callback_data=list_callback(content_type))]]
         await query.edit_message_text(
             message_text, 
             parse_mode='Markdown', 
@@ -608,48 +1699,131 @@ async def show_content_details(update: Update, context: ContextTypes.DEFAULT_TYP
         )
         return
     
+    if len(episodes) > EPISODE_GRID_LIMIT:
+        seasons = await get_content_seasons(content_id)
+        if len(seasons) == 1:
+            # موسم واحد كبير: ننتقل مباشرة إلى نطاقات الحلقات
+            await show_season(update, context, content_id, seasons[0][0], content_info, seasons)
+            return
+        await show_season_picker(query, content_info, seasons)
+        return
+    
     # تجميع الحلقات حسب الموسم
     seasons = {}
     for ep in episodes:
-        ep_id, season, ep_num, msg_id, channel_id = ep
-        if season not in seasons:
-            seasons[season] = []
-        seasons[season].append((ep_id, ep_num, msg_id, channel_id))
+        seasons.setdefault(ep[1], []).append(ep)
     
     # بناء النص
     message_text = f"{type_icon} *{name}*\n\n"
+    keyboard = await continue_watching_rows(query.from_user, content_id, content_type)
+    
+    for season_num in sorted(seasons.keys(), key=season_sort_key):
+        message_text += f"📁 *{season_label(content_type, season_num)}:*\n"
+        keyboard.extend(build_episode_rows(content_id, seasons[season_num]))
+    message_text += stale_note()
+    
+    # أزرار التنقل
+    keyboard.append([
+        InlineKeyboardButton("⬅️ رجوع", callback_data=list_callback(content_type)),
+        InlineKeyboardButton("🏠 الرئيسية", callback_data="home")
+    ])
+    
+    await query.edit_message_text(
+        message_text,
+        parse_mode='Markdown',
+        reply_markup=InlineKeyboardMarkup(keyboard)
+    )
+
+async def show_season_picker(query, content_info, seasons):
+    """قائمة المواسم مع ملخص نطاق الحلقات لكل موسم"""
+    content_id, name, content_type = content_info
+    type_icon = "📺" if content_type == 'series' else "🎬"
+    unit = "حلقة" if content_type == 'series' else "جزء"
+    
+    message_text = f"{type_icon} *{name}*\n\n"
+    keyboard = await continue_watching_rows(query.from_user, content_id, content_type)
+    row = []
+    for season_num, count, first_ep, last_ep in seasons:
+        message_text += f"📁 {season_label(content_type, season_num)}: {count} {unit} ({range_label(first_ep, last_ep)})\n"
+        row.append(InlineKeyboardButton(
+            f"📁 {season_label(content_type, season_num)}",
+            callback_data=f"season_{content_id}_{season_num}"
+        ))
+        if len(row) == 3:
+            keyboard.append(row)
+            row = []
+    if row:
+        keyboard.append(row)
+    message_text += stale_note()
+    
+    keyboard.append([
+        InlineKeyboardButton("⬅️ رجوع", callback_data=list_callback(content_type)),
+        InlineKeyboardButton("🏠 الرئيسية", callback_data="home")
+    ])
+    await query.edit_message_text(
+        message_text,
+        parse_mode='Markdown',
+        reply_markup=InlineKeyboardMarkup(keyboard)
+    )
+
+async def show_season(update: Update, context: ContextTypes.DEFAULT_TYPE, content_id, season_num,
+                      content_info=None, seasons=None, low=None):
+    """عرض موسم واحد: شبكة الحلقات إذا كان صغيراً، أو نطاقات (مثل 1–50) إذا كان كبيراً"""
+    query = update.callback_query
+    
+    content_info = content_info or await get_cached_content_info(content_id)
+    if not content_info:
+        await query.edit_message_text("❌ المحتوى غير موجود.")
+        return
+    content_id, name, content_type = content_info
+    type_icon = "📺" if content_type == 'series' else "🎬"
+    
+    message_text = f"{type_icon} *{name}*\n📁 *{season_label(content_type, season_num)}*\n\n"
     keyboard = []
     
-    for season_num in sorted(seasons.keys()):
-        if content_type == 'series':
-            message_text += f"📁 *الموسم {season_num}:*\n"
-        else:
-            message_text += f"📁 *الجزء {season_num}:*\n"
+    if low is not None:
+        # نطاق داخل موسم كبير
+        high = low + EPISODE_GRID_LIMIT - 1
+        episodes = await get_season_episodes(content_id, season_num, low, high)
+        message_text += f"🔢 الحلقات {range_label(low, high)}"
+        keyboard.extend(build_episode_rows(content_id, episodes))
+        back = f"season_{content_id}_{season_num}"
+    else:
+        if seasons is None:
+            seasons = await get_content_seasons(content_id)
+        summary = next((s for s in seasons if s[0] == season_num), None)
+        if not summary:
+            await query.edit_message_text("❌ الموسم غير موجود.")
+            return
         
-        # تقسيم أزرار الحلقات (5 أزرار في كل صف)
-        season_buttons = []
-        for ep_id, ep_num, msg_id, channel_id in seasons[season_num]:
-            season_buttons.append(
-                InlineKeyboardButton(
-                    f"{ep_num}",
-                    callback_data=f"ep_{ep_id}"
-                )
-            )
-            
-            # كل 5 أزرار نبدأ صف جديد
-            if len(season_buttons) == 5:
-                keyboard.append(season_buttons)
-                season_buttons = []
+        _, count, first_ep, last_ep = summary
+        if count > EPISODE_GRID_LIMIT:
+            # موسم كبير: أزرار نطاقات بدلاً من زر لكل حلقة
+            message_text += f"{count} حلقة ({range_label(first_ep, last_ep)}). اختر النطاق:"
+            row = []
+            for start in range(first_ep, last_ep + 1, EPISODE_GRID_LIMIT):
+                end = min(start + EPISODE_GRID_LIMIT - 1, last_ep)
+                row.append(InlineKeyboardButton(
+                    range_label(start, end),
+                    callback_data=f"range_{content_id}_{season_num}_{start}"
+                ))
+                if len(row) == 3:
+                    keyboard.append(row)
+                    row = []
+            if row:
+                keyboard.append(row)
+        else:
+            episodes = await get_season_episodes(content_id, season_num)
+            keyboard.extend(build_episode_rows(content_id, episodes))
         
-        if season_buttons:
-            keyboard.append(season_buttons)
+        # المحتوى ذو الموسم الواحد يُعرض مباشرة من صفحته، فالرجوع يكون للقائمة
+        back = list_callback(content_type) if len(seasons) == 1 else f"content_{content_id}"
+    message_text += stale_note()
     
-    # أزرار التنقل
     keyboard.append([
-        InlineKeyboardButton("⬅️ رجوع", callback_data=f"{content_type}_list"),
+        InlineKeyboardButton("⬅️ رجوع", callback_data=back),
         InlineKeyboardButton("🏠 الرئيسية", callback_data="home")
     ])
-    
     await query.edit_message_text(
         message_text,
         parse_mode='Markdown',
@@ -660,29 +1834,55 @@ async def show_episode_details(update: Update, context: ContextTypes.DEFAULT_TYP
     """عرض تفاصيل حلقة/جزء مع روابط"""
     query = update.callback_query
     
+    key = ("episode", episode_id)
     try:
-        with engine.connect() as conn:
-            from sqlalchemy import text as sql_text
-            result = conn.execute(sql_text("""
-                SELECT e.season, e.episode_number, e.telegram_message_id,
-                       s.name as series_name, s.type as series_type, s.id as series_id
-                FROM episodes e
-                JOIN series s ON e.series_id = s.id
-                WHERE e.id = :episode_id
-            """), {"episode_id": episode_id}).fetchone()
+        result = remember_read(key, await read_db(query_first_row, """
+            SELECT e.season, e.episode_number, e.telegram_message_id,
+                   s.name as series_name, s.type as series_type, s.id as series_id
+            FROM episodes e
+            JOIN series s ON e.series_id = s.id
+            WHERE e.id = :episode_id
+        """, {"episode_id": episode_id}))
     except Exception as e:
-        await query.edit_message_text(f"❌ خطأ في جلب معلومات الحلقة: {e}")
-        return
+        result = recall_read(key, None, f"جلب معلومات الحلقة {episode_id}", e)
+        if result is None:
+            await query.edit_message_text(DB_UNAVAILABLE_TEXT)
+            return
     
     if not result:
         await query.edit_message_text("❌ الحلقة/الجزء غير موجود.")
         return
     
     season, episode_num, msg_id, series_name, series_type, series_id = result
+    cache_series_info((series_id, series_name, series_type))
+    await render_episode_details(query, series_id, series_name, series_type, season, episode_num, msg_id)
+
+async def show_encoded_episode(update: Update, context: ContextTypes.DEFAULT_TYPE,
+                               series_id, season, episode_num, msg_id):
+    """عرض حلقة من بيانات الزر المضغوطة مباشرة، دون استعلام إذا كان اسم المحتوى محفوظاً."""
+    query = update.callback_query
+    content_info = await get_cached_content_info(series_id)
+    if not content_info:
+        await query.edit_message_text("❌ المحتوى غير موجود.")
+        return
+    _, series_name, series_type = content_info
+    await render_episode_details(query, series_id, series_name, series_type, season, episode_num, msg_id)
+
+def neighbor_label(content_type, season, episode_num):
+    if content_type == 'series':
+        return f"م{season} ح{episode_num}"
+    return f"الجزء {season}"
+
+async def render_episode_details(query, series_id, series_name, series_type, season, episode_num, msg_id):
+    """بناء رسالة الحلقة/الجزء وأزرارها."""
+    # تسجيل تقدم المشاهدة في الذاكرة (يُكتب لاحقاً على دفعات)
+    if query.from_user:
+        WATCH_PROGRESS.record(query.from_user.id, series_id, season, episode_num, msg_id)
+    POPULARITY.hit(series_id)
     
     # بناء الرابط
     if msg_id:
-        episode_link = f"https://t.me/ShoofFilm/{msg_id}"
+        episode_link = f"https://t.me/{CHANNEL_USERNAME}/{msg_id}"
         if series_type == 'series':
             link_text = f"🔗 [رابط الحلقة في القناة]({episode_link})"
         else:
@@ -705,6 +1905,7 @@ async def show_episode_details(update: Update, context: ContextTypes.DEFAULT_TYP
             f"{link_text}\n\n"
             f"*ملاحظة:* تأكد من أنك منضم للقناة لمشاهدة الجزء."
         )
+    message_text += stale_note()
     
     # بناء لوحة المفاتيح
     keyboard = []
@@ -713,6 +1914,25 @@ async def show_episode_details(update: Update, context: ContextTypes.DEFAULT_TYP
             keyboard.append([InlineKeyboardButton("▶️ مشاهدة الحلقة", url=episode_link)])
         else:
             keyboard.append([InlineKeyboardButton("▶️ مشاهدة الجزء", url=episode_link)])
+        keyboard.append([InlineKeyboardButton(
+            "📥 إرسال هنا", callback_data=encode_send(series_id, season, episode_num, msg_id)
+        )])
+    
+    # التنقل المتتابع بدون الرجوع لصفحة المحتوى
+    previous, following = await get_episode_neighbors(series_id, season, episode_num)
+    nav_row = []
+    if previous:
+        nav_row.append(InlineKeyboardButton(
+            f"⏮ {neighbor_label(series_type, *previous[:2])}",
+            callback_data=encode_episode(series_id, *previous)
+        ))
+    if following:
+        nav_row.append(InlineKeyboardButton(
+            f"{neighbor_label(series_type, *following[:2])} ⏭",
+            callback_data=encode_episode(series_id, *following)
+        ))
+    if nav_row:
+        keyboard.append(nav_row)
     
     keyboard.append([
         InlineKeyboardButton("⬅️ رجوع للمحتوى", callback_data=f"content_{series_id}"),
@@ -726,27 +1946,155 @@ async def show_episode_details(update: Update, context: ContextTypes.DEFAULT_TYP
         disable_web_page_preview=False
     )
 
+# ==============================
+# 4.1 إرسال الحلقة داخل البوت (file_id محفوظ)
+# ==============================
+EPISODE_FILES = EpisodeFileCache()
+
+def episode_caption(content_info, season, episode_num):
+    if not content_info:
+        return None
+    _, name, content_type = content_info
+    if content_type == 'series':
+        return f"🎬 {name} - الموسم {season} الحلقة {episode_num}"
+    return f"🎬 {name} - الجزء {season}"
+
+async def send_cached_file(bot, chat_id, file_id, media_type, caption):
+    """إرسال ملف بالـ file_id فقط (تليجرام يعيد استخدام الملف المخزن لديه)."""
+    if media_type == 'document':
+        await bot.send_document(chat_id=chat_id, document=file_id, caption=caption)
+    else:
+        await bot.send_video(chat_id=chat_id, video=file_id, caption=caption, supports_streaming=True)
+
+async def resolve_file_id(bot, engine, msg_id):
+    """التقاط file_id لحلقة قديمة بإعادة توجيهها مرة واحدة إلى محادثة التخزين."""
+    try:
+        forwarded = await bot.forward_message(
+            chat_id=Config.FILE_CACHE_CHAT_ID,
+            from_chat_id=f"@{CHANNEL_USERNAME}",
+            message_id=msg_id,
+            disable_notification=True
+        )
+    except TelegramError as e:
+        print(f"⚠️ تعذر التقاط file_id للرسالة {msg_id}: {e}")
+        return None
+    media, media_type = media_of(forwarded)
+    if not media:
+        return None
+    try:
+        await run_db(
+            EPISODE_FILES.save, engine, msg_id, media.file_id, media.file_unique_id, media_type,
+            timeout=Config.DB_CALL_TIMEOUT_SECONDS
+        )
+    except Exception as e:
+        print(f"⚠️ تعذر حفظ file_id للرسالة {msg_id}: {e}")
+    return media.file_id, media_type
+
+async def send_episode_here(update: Update, context: ContextTypes.DEFAULT_TYPE,
+                            series_id, season, episode_num, msg_id):
+    """إرسال ملف الحلقة في المحادثة نفسها بدلاً من رابط القناة."""
+    query = update.callback_query
+    chat_id = query.message.chat_id
+    caption = episode_caption(await get_cached_content_info(series_id), season, episode_num)
+    engine = get_engine()
+    
+    cached = None
+    if engine:
+        try:
+            cached = await run_db(EPISODE_FILES.get, engine, msg_id, timeout=Config.DB_CALL_TIMEOUT_SECONDS)
+        except Exception as e:
+            print(f"⚠️ تعذر قراءة file_id للرسالة {msg_id}: {e}")
+    if cached is None and engine and Config.FILE_CACHE_CHAT_ID and not DB_BREAKER.degraded:
+        cached = await resolve_file_id(context.bot, engine, msg_id)
+    
+    if cached:
+        file_id, media_type = cached
+        try:
+            await send_cached_file(context.bot, chat_id, file_id, media_type, caption)
+            return
+        except BadRequest as e:
+            # file_id لم يعد صالحاً: يُحذف ويُعاد التقاطه في الطلب التالي
+            print(f"⚠️ file_id غير صالح للرسالة {msg_id}: {e}")
+            try:
+                await run_db(EPISODE_FILES.forget, engine, msg_id, timeout=Config.DB_CALL_TIMEOUT_SECONDS)
+            except Exception as e:
+                print(f"⚠️ تعذر حذف file_id للرسالة {msg_id}: {e}")
+    
+    # بدون file_id: نسخ الرسالة من القناة (لا تنزيل ولا "منقول من")
+    try:
+        await context.bot.copy_message(
+            chat_id=chat_id,
+            from_chat_id=f"@{CHANNEL_USERNAME}",
+            message_id=msg_id
+        )
+    except TelegramError as e:
+        print(f"❌ تعذر إرسال الرسالة {msg_id}: {e}")
+        await context.bot.send_message(chat_id=chat_id, text="❌ تعذر إرسال الحلقة هنا، استخدم رابط القناة.")
+
+async def capture_channel_file(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """التقاط file_id لمنشورات القناة عند نشرها أو تعديلها (يتطلب أن يكون البوت مشرفاً فيها)."""
+    chat = update.effective_chat
+    if not chat or (chat.username or "").lower() != CHANNEL_USERNAME.lower():
+        return
+    media, media_type = media_of(update.effective_message)
+    engine = get_engine()
+    if not media or not engine:
+        return
+    try:
+        await run_db(
+            EPISODE_FILES.save, engine, update.effective_message.message_id,
+            media.file_id, media.file_unique_id, media_type
+        )
+    except Exception as e:
+        print(f"⚠️ تعذر حفظ file_id لمنشور القناة: {e}")
+
 # ==============================
 # 5. الدالة الرئيسية
 # ==============================
-def main():
-    """الدالة الرئيسية لتشغيل البوت"""
-    # إنشاء تطبيق البوت
-    application = Application.builder().token(BOT_TOKEN).build()
+def build_application(builder=None):
+    """إنشاء تطبيق البوت وتسجيل جميع الـ Handlers."""
+    if builder is None:
+        builder = Application.builder().token(BOT_TOKEN)
+    application = builder.post_init(post_init).post_shutdown(post_shutdown).build()
     
     # إضافة Handlers
+    application.add_handler(TypeHandler(Update, limit_requests), group=-2)
+    application.add_handler(TypeHandler(Update, record_first_update), group=-1)
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CommandHandler("series", series_command))
     application.add_handler(CommandHandler("movies", movies_command))
     application.add_handler(CommandHandler("all", all_command))
-    application.add_handler(CommandHandler("test", test_db_command))
-    application.add_handler(CommandHandler("debug", debug_command))
+    application.add_handler(CommandHandler("latest", show_latest))
+    application.add_handler(CommandHandler("trending", show_trending))
+    # أوامر المشرفين من الرسائل الجديدة فقط، لا من تعديل رسالة قديمة إلى أمر
+    application.add_handler(CommandHandler("test", test_db_command, filters=filters.UpdateType.MESSAGE))
+    application.add_handler(CommandHandler("debug", debug_command, filters=filters.UpdateType.MESSAGE))
+    application.add_handler(CommandHandler("memory", memory_command, filters=filters.UpdateType.MESSAGE))
     application.add_handler(CallbackQueryHandler(button_handler))
+    application.add_handler(MessageHandler(
+        filters.UpdateType.CHANNEL_POSTS & (filters.VIDEO | filters.Document.ALL),
+        capture_channel_file
+    ))
+    return application
+
+def main():
+    """الدالة الرئيسية لتشغيل البوت"""
+    if not BOT_TOKEN:
+        print("❌ خطأ: BOT_TOKEN غير موجود في متغيرات البيئة!")
+        exit(1)
+    
+    if "DATABASE_URL" not in os.environ:
+        print(f"⚠️ تحذير: DATABASE_URL غير موجود. سيتم استخدام {DATABASE_URL}")
+    
+    # إنشاء تطبيق البوت
+    application = build_application()
     
     # تشغيل البوت
     print("🤖 البوت يعمل باستخدام Polling...")
-    print(f"✅ تم الاتصال بقاعدة البيانات: {engine is not None}")
     application.run_polling(allowed_updates=Update.ALL_TYPES)
 
+# زمن استيراد الوحدة (بدون أي اتصال بالشبكة أو قاعدة البيانات)
+STARTUP_TIMES["import"] = time.perf_counter() - _IMPORT_STARTED
+
 if __name__ == "__main__":
     main()
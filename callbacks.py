@@ -0,0 +1,130 @@
+"""
+ترميز مضغوط لبيانات الأزرار (callback_data) ضمن حد تليجرام البالغ 64 بايت.
+
+زر الحلقة يحمل كل ما يلزم لعرضها (المسلسل، الموسم، الحلقة، رقم الرسالة) بدلاً من
+معرف الحلقة فقط، فلا يحتاج عرض الحلقة إلى استعلام من قاعدة البيانات.
+
+الصيغة: "<بادئة الإصدار>" + base64url لأرقام مضغوطة بترميز varint.
+"""
+import base64
+
+MAX_CALLBACK_BYTES = 64
+
+# الإصدار الثاني لأزرار الحلقات: (series_id, season + 1, episode_number, message_id)
+# الموسم يُخزن مزاحاً بواحد، والصفر يعني "بدون موسم" (NULL)
+EPISODE_PREFIX = "e2:"
+# زر "إرسال هنا" يحمل نفس الحقول
+SEND_PREFIX = "v2:"
+# الإصدار الأول خزّن الموسم كما هو (None كصفر): يُقبل من الأزرار المرسلة سابقاً
+LEGACY_PREFIXES = {EPISODE_PREFIX: "e1:", SEND_PREFIX: "v1:"}
+
+def _pack_varints(values):
+    """ترميز أعداد صحيحة غير سالبة بصيغة varint (7 بتات لكل بايت)."""
+    out = bytearray()
+    for value in values:
+        if value < 0:
+            raise ValueError("varint لا يدعم الأعداد السالبة")
+        while True:
+            byte = value & 0x7F
+            value >>= 7
+            if value:
+                out.append(byte | 0x80)
+            else:
+                out.append(byte)
+                break
+    return bytes(out)
+
+def _unpack_varints(data):
+    values = []
+    value = shift = 0
+    for byte in data:
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            values.append(value)
+            value = shift = 0
+    if shift:
+        raise ValueError("بيانات varint غير مكتملة")
+    return values
+
+def _b64encode(raw):
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+def _b64decode(encoded):
+    return base64.urlsafe_b64decode(encoded + "=" * (-len(encoded) % 4))
+
+def _encode_season(season):
+    return 0 if season is None else season + 1
+
+def _decode_season(value):
+    return None if value == 0 else value - 1
+
+def _encode(prefix, series_id, season, episode_number, message_id):
+    data = prefix + _b64encode(_pack_varints((series_id, _encode_season(season), episode_number, message_id)))
+    if len(data.encode("utf-8")) > MAX_CALLBACK_BYTES:
+        raise ValueError("callback_data يتجاوز 64 بايت")
+    return data
+
+def _decode(prefix, data):
+    legacy = LEGACY_PREFIXES[prefix]
+    if data.startswith(prefix):
+        payload, season_of = data[len(prefix):], _decode_season
+    elif data.startswith(legacy):
+        payload, season_of = data[len(legacy):], lambda value: value or None
+    else:
+        return None
+    try:
+        values = _unpack_varints(_b64decode(payload))
+    except ValueError:
+        return None
+    if len(values) != 4:
+        return None
+    series_id, season, episode_number, message_id = values
+    return series_id, season_of(season), episode_number, message_id
+
+def encode_episode(series_id, season, episode_number, message_id):
+    """ترميز زر حلقة، مثال: encode_episode(12, 1, 7, 3456) -> 'e2:DAIHgBs'."""
+    return _encode(EPISODE_PREFIX, series_id, season, episode_number, message_id)
+
+def decode_episode(data):
+    """فك ترميز زر حلقة، وإرجاع None إذا لم يكن بالإصدار الحالي أو كان تالفاً."""
+    return _decode(EPISODE_PREFIX, data)
+
+def encode_send(series_id, season, episode_number, message_id):
+    """ترميز زر "إرسال هنا" لنفس الحلقة."""
+    return _encode(SEND_PREFIX, series_id, season, episode_number, message_id)
+
+def decode_send(data):
+    return _decode(SEND_PREFIX, data)
+
+# ==============================
+# حمولة روابط /start العميقة
+# ==============================
+# t.me/<bot>?start=<payload>: حتى 64 حرفاً من [A-Za-z0-9_-]
+MAX_START_PAYLOAD = 64
+SERIES_LINK_PREFIX = "s"
+# الحلقة برقم رسالتها في القناة: ثابت، بعكس معرف الحلقة الذي يتغير عند إعادة التحليل
+EPISODE_LINK_PREFIX = "e"
+
+def encode_start_series(series_id):
+    """حمولة فتح مسلسل/فيلم، مثال: encode_start_series(12) -> 's12'."""
+    return f"{SERIES_LINK_PREFIX}{int(series_id)}"
+
+def encode_start_episode(message_id):
+    """حمولة فتح حلقة برقم رسالتها في القناة، مثال: encode_start_episode(3456) -> 'e3456'."""
+    return f"{EPISODE_LINK_PREFIX}{int(message_id)}"
+
+def decode_start(payload):
+    """('series', id) أو ('episode', message_id)، أو None إذا لم تكن الحمولة معروفة."""
+    if not payload or len(payload) > MAX_START_PAYLOAD:
+        return None
+    kinds = {SERIES_LINK_PREFIX: "series", EPISODE_LINK_PREFIX: "episode"}
+    kind, number = kinds.get(payload[0]), payload[1:]
+    if not kind or not number.isascii() or not number.isdigit():
+        return None
+    return kind, int(number)
+
+def start_link(bot_username, payload):
+    """رابط يفتح البوت مباشرة على الحمولة."""
+    return f"https://t.me/{bot_username.lstrip('@')}?start={payload}"
@@ -0,0 +1,279 @@
+"""
+لقطة مضغوطة للكتالوج في الذاكرة وعلى القرص لإقلاع البوت بذاكرة دافئة.
+
+اللقطة تحمل المحتويات مع عدد حلقاتها وفهرس كل الحلقات مرتبة حسب
+(المسلسل، الموسم، الحلقة)، وتخدم قوائم البوت وصفحات المواسم بدون استعلامات.
+
+صيغة الملف (سريعة التحميل، بدون تحليل صف بصف):
+    MAGIC (8 بايت) + طول الترويسة (4 بايت) + ترويسة JSON (الإصدار والمحتويات)
+    + أعمدة الحلقات كمصفوفات int64 متتالية تُقرأ مباشرة بـ array.frombytes.
+"""
+import json
+import os
+import struct
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+
+from sqlalchemy import text
+
+from database import get_catalog_version
+
+MAGIC = b"CATSNAP1"
+FORMAT_VERSION = 1
+
+# أعمدة فهرس الحلقات بنفس ترتيبها في الملف
+EPISODE_COLUMNS = ("episode_id", "series_id", "season", "episode_number", "message_id")
+
+# الموسم الفارغ (NULL) لا يُخزن في مصفوفة أعداد، ويُرتب قبل كل المواسم
+# (build يرتب بـ COALESCE(season, -1) لأن PostgreSQL يضع NULL في النهاية)
+_NO_SEASON = -1
+
+class CatalogSnapshot:
+    """الكتالوج في الذاكرة: المحتويات + فهرس الحلقات، مع رقم إصدار الكتالوج."""
+
+    def __init__(self, version, series, columns, created_at=None):
+        self.version = version
+        self.created_at = created_at or datetime.utcnow()
+        # (id, name, type, episode_count) مرتبة حسب المعرف
+        self.series = [tuple(row) for row in series]
+        self.series_by_id = {row[0]: row for row in self.series}
+        self.columns = columns
+        self.offsets = self._index_offsets(columns["series_id"])
+
+    @staticmethod
+    def _index_offsets(series_column):
+        """نطاق حلقات كل مسلسل في المصفوفات: series_id -> (بداية، نهاية)."""
+        offsets = {}
+        start = 0
+        for position in range(1, len(series_column) + 1):
+            if position == len(series_column) or series_column[position] != series_column[start]:
+                offsets[series_column[start]] = (start, position)
+                start = position
+        return offsets
+
+    @property
+    def episode_count(self):
+        return len(self.columns["episode_id"])
+
+    # ------------------------------
+    # البناء من قاعدة البيانات
+    # ------------------------------
+    @classmethod
+    def build(cls, engine):
+        """بناء لقطة كاملة من قاعدة البيانات (تُستدعى من خيط خلفي)."""
+        with engine.connect() as conn:
+            # قراءة الإصدار أولاً: إن تغير الكتالوج أثناء البناء تبدو اللقطة أقدم فيُعاد بناؤها
+            version = get_catalog_version(conn)
+            series = conn.execute(text("""
+                SELECT s.id, s.name, s.type, COUNT(e.id) as episode_count
+                FROM series s
+                LEFT JOIN episodes e ON s.id = e.series_id
+                GROUP BY s.id, s.name, s.type
+                ORDER BY s.id ASC
+            """)).fetchall()
+            columns = {name: array("q") for name in EPISODE_COLUMNS}
+            result = conn.execute(text("""
+                SELECT id, series_id, season, episode_number, telegram_message_id
+                FROM episodes
+                WHERE series_id IS NOT NULL
+                ORDER BY series_id, COALESCE(season, -1), episode_number, id
+            """))
+            for episode_id, series_id, season, episode_number, message_id in result:
+                columns["episode_id"].append(episode_id)
+                columns["series_id"].append(series_id)
+                columns["season"].append(_NO_SEASON if season is None else season)
+                columns["episode_number"].append(episode_number)
+                columns["message_id"].append(message_id)
+        return cls(version, series, columns)
+
+    # ------------------------------
+    # الحفظ والتحميل
+    # ------------------------------
+    def save(self, path):
+        """كتابة اللقطة في ملف مؤقت ثم استبداله، فلا يُقرأ ملف نصف مكتوب أبداً."""
+        header = json.dumps({
+            "format": FORMAT_VERSION,
+            "version": self.version,
+            "created_at": self.created_at.isoformat(),
+            "byteorder": sys.byteorder,
+            "episodes": self.episode_count,
+            "series": self.series,
+        }, ensure_ascii=False).encode("utf-8")
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(MAGIC)
+            f.write(struct.pack("<I", len(header)))
+            f.write(header)
+            for name in EPISODE_COLUMNS:
+                self.columns[name].tofile(f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """تحميل لقطة من ملف، أو None إذا لم يوجد الملف أو كانت صيغته غير معروفة."""
+        try:
+            with open(path, "rb") as f:
+                raw = f.read()
+        except FileNotFoundError:
+            return None
+        if raw[:len(MAGIC)] != MAGIC:
+            return None
+        offset = len(MAGIC)
+        (header_size,) = struct.unpack_from("<I", raw, offset)
+        offset += 4
+        header = json.loads(raw[offset:offset + header_size].decode("utf-8"))
+        offset += header_size
+        if header.get("format") != FORMAT_VERSION:
+            return None
+
+        count = header["episodes"]
+        columns = {}
+        view = memoryview(raw)
+        for name in EPISODE_COLUMNS:
+            column = array("q")
+            size = count * column.itemsize
+            column.frombytes(view[offset:offset + size])
+            if header["byteorder"] != sys.byteorder:
+                column.byteswap()
+            columns[name] = column
+            offset += size
+        return cls(
+            header["version"],
+            header["series"],
+            columns,
+            created_at=datetime.fromisoformat(header["created_at"]),
+        )
+
+    # ------------------------------
+    # القراءة (بنفس شكل صفوف استعلامات bot.py)
+    # ------------------------------
+    def list_content(self, content_type=None):
+        """(id, name, type, episode_count) مثل get_all_content."""
+        if content_type:
+            return [row for row in self.series if row[2] == content_type]
+        return list(self.series)
+
+    def info(self, series_id):
+        """(id, name, type) مثل get_content_info، أو None."""
+        row = self.series_by_id.get(series_id)
+        return row[:3] if row else None
+
+    def _episode_row(self, position):
+        season = self.columns["season"][position]
+        return (
+            self.columns["episode_id"][position],
+            None if season == _NO_SEASON else season,
+            self.columns["episode_number"][position],
+            self.columns["message_id"][position],
+            None,  # telegram_channel_id غير مخزن في اللقطة
+        )
+
+    def episodes(self, series_id, limit=None):
+        """(id, season, episode_number, message_id, channel_id) مرتبة مثل get_content_episodes."""
+        start, end = self.offsets.get(series_id, (0, 0))
+        if limit:
+            end = min(end, start + limit)
+        return [self._episode_row(position) for position in range(start, end)]
+
+    def seasons(self, series_id):
+        """(الموسم، عدد الحلقات، أول حلقة، آخر حلقة) مثل get_content_seasons."""
+        start, end = self.offsets.get(series_id, (0, 0))
+        summary = []
+        for position in range(start, end):
+            season = self.columns["season"][position]
+            season = None if season == _NO_SEASON else season
+            episode_number = self.columns["episode_number"][position]
+            if summary and summary[-1][0] == season:
+                _, count, first_ep, _ = summary[-1]
+                summary[-1] = (season, count + 1, first_ep, episode_number)
+            else:
+                summary.append((season, 1, episode_number, episode_number))
+        return summary
+
+    def season_episodes(self, series_id, season, low=None, high=None):
+        """حلقات موسم واحد ضمن نطاق اختياري مثل get_season_episodes."""
+        stored_season = _NO_SEASON if season is None else season
+        start, end = self.offsets.get(series_id, (0, 0))
+        rows = []
+        for position in range(start, end):
+            if self.columns["season"][position] != stored_season:
+                continue
+            episode_number = self.columns["episode_number"][position]
+            if low is not None and not low <= episode_number <= high:
+                continue
+            rows.append(self._episode_row(position))
+        return rows
+
+    def neighbors(self, series_id, season, episode_number):
+        """(السابقة، التالية) مثل get_episode_neighbors: (season, episode_number, message_id) أو None."""
+        stored_season = _NO_SEASON if season is None else season
+        start, end = self.offsets.get(series_id, (0, 0))
+        seasons, numbers = self.columns["season"], self.columns["episode_number"]
+        positions = range(start, end)
+        key = (stored_season, episode_number)
+        # الحلقات مرتبة حسب (الموسم، الحلقة) داخل نطاق المسلسل
+        low = start + bisect_left(positions, key, key=lambda position: (seasons[position], numbers[position]))
+        high = start + bisect_right(positions, key, key=lambda position: (seasons[position], numbers[position]))
+        previous = self._episode_row(low - 1)[1:4] if low > start else None
+        following = self._episode_row(high)[1:4] if high < end else None
+        return previous, following
+
+    # ------------------------------
+    # التحديث في الذاكرة (الوضع المدمج: تغييرات الـ Worker تصل مباشرة بدون إعادة بناء)
+    # ------------------------------
+    def _set_series(self, row):
+        row = tuple(row)
+        position = bisect_left(self.series, (row[0],))
+        if position < len(self.series) and self.series[position][0] == row[0]:
+            self.series[position] = row
+        else:
+            self.series.insert(position, row)
+        self.series_by_id[row[0]] = row
+
+    def add_episode(self, episode_id, series_id, name, content_type, season, episode_number, message_id):
+        """إضافة حلقة في موضعها المرتب (المسلسل، الموسم، الحلقة، المعرف)."""
+        stored_season = _NO_SEASON if season is None else season
+        key = (stored_season, episode_number, episode_id)
+        start, end = self.offsets.get(series_id, (None, None))
+        if start is None:
+            # أول حلقة للمسلسل: موضعها حسب ترتيب series_id
+            start = end = bisect_left(self.columns["series_id"], series_id)
+        if message_id in self.columns["message_id"][start:end]:
+            return
+        position = start
+        while position < end and (
+            self.columns["season"][position],
+            self.columns["episode_number"][position],
+            self.columns["episode_id"][position],
+        ) < key:
+            position += 1
+
+        values = (episode_id, series_id, stored_season, episode_number, message_id)
+        for column, value in zip(EPISODE_COLUMNS, values):
+            self.columns[column].insert(position, value)
+        # إزاحة نطاقات المسلسلات التالية بمقدار حلقة واحدة
+        for other_id, (other_start, other_end) in self.offsets.items():
+            if other_start >= end and other_id != series_id:
+                self.offsets[other_id] = (other_start + 1, other_end + 1)
+        self.offsets[series_id] = (start, end + 1)
+
+        row = self.series_by_id.get(series_id)
+        count = row[3] if row else 0
+        self._set_series((series_id, name, content_type, count + 1))
+
+    def remove_messages(self, message_ids):
+        """حذف حلقات رسائل محذوفة أو معدلة، وإرجاع عدد المحذوف."""
+        message_ids = set(message_ids)
+        positions = [i for i, msg_id in enumerate(self.columns["message_id"]) if msg_id in message_ids]
+        for position in reversed(positions):
+            series_id = self.columns["series_id"][position]
+            row = self.series_by_id.get(series_id)
+            if row:
+                self._set_series(row[:3] + (row[3] - 1,))
+            for name in EPISODE_COLUMNS:
+                del self.columns[name][position]
+        if positions:
+            self.offsets = self._index_offsets(self.columns["series_id"])
+        return len(positions)
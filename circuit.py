@@ -0,0 +1,106 @@
+"""
+قاطع دائرة (circuit breaker) لاتصالات قاعدة البيانات في البوت.
+
+مغلق: كل الطلبات تمر إلى القاعدة. بعد failure_threshold أخطاء اتصال متتالية يُفتح:
+لا تحاول الطلبات الاتصال (فلا ينتظر المستخدم مهلة قاعدة متوقفة) وتُخدم من آخر نتائج
+ناجحة. بعد reset_seconds يُسمح بمحاولة واحدة (نصف مفتوح): نجاحها يغلق القاطع، وفشلها
+يعيد فتحه بمهلة مضاعفة حتى max_reset_seconds.
+
+أخطاء الاستعلام نفسه (جدول غير موجود، صيغة خاطئة...) لا تُحسب، فقط أخطاء الاتصال والمهلات.
+"""
+import asyncio
+import time
+
+from sqlalchemy import exc
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+class CircuitOpenError(Exception):
+    """رُفض الطلب دون محاولة الاتصال لأن القاطع مفتوح."""
+
+def is_connectivity_error(error):
+    """هل الخطأ من الاتصال بالقاعدة أو من تجاوز مهلة (وليس من الاستعلام نفسه)؟"""
+    if isinstance(error, (exc.OperationalError, exc.InterfaceError, exc.TimeoutError,
+                          ConnectionError, TimeoutError, asyncio.TimeoutError)):
+        return True
+    return isinstance(error, exc.DBAPIError) and error.connection_invalidated
+
+def describe_error(error):
+    """السطر الأول من الخطأ بطول محدود، للسجلات و /debug."""
+    message = str(error).splitlines()[0][:200] if str(error) else ""
+    return message or type(error).__name__
+
+class CircuitBreaker:
+    """حالة القاطع لقاعدة بيانات واحدة (تُستدعى من حلقة asyncio واحدة)."""
+
+    def __init__(self, failure_threshold=3, reset_seconds=5, max_reset_seconds=60):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.max_reset_seconds = max_reset_seconds
+        self.state = CLOSED
+        self.failures = 0
+        self.delay = reset_seconds
+        self.retry_at = 0.0
+        self.opened_at = None
+        self.last_error = None
+        self.rejected = 0
+
+    def allow(self, now=None):
+        """هل يُسمح بمحاولة الاتصال الآن؟"""
+        if self.state == CLOSED:
+            return True
+        now = time.monotonic() if now is None else now
+        if now < self.retry_at:
+            self.rejected += 1
+            return False
+        # محاولة تجريبية واحدة؛ ما بعدها يُرفض حتى تعود نتيجتها (أو تمر مهلة أخرى)
+        self.state = HALF_OPEN
+        self.retry_at = now + self.delay
+        return True
+
+    def success(self):
+        """نجحت محاولة؛ يرجع True إذا كان القاطع مفتوحاً وأُغلق الآن."""
+        recovered = self.state != CLOSED
+        self.state = CLOSED
+        self.failures = 0
+        self.delay = self.reset_seconds
+        self.opened_at = None
+        self.last_error = None
+        return recovered
+
+    def failure(self, error, now=None):
+        """فشلت محاولة اتصال؛ يرجع True إذا فُتح القاطع بسبب هذا الخطأ."""
+        now = time.monotonic() if now is None else now
+        self.failures += 1
+        self.last_error = describe_error(error)
+        if self.state == CLOSED and self.failures < self.failure_threshold:
+            return False
+        if self.state == HALF_OPEN:
+            self.delay = min(self.delay * 2, self.max_reset_seconds)
+        opened = self.state == CLOSED
+        if opened:
+            self.opened_at = now
+        self.state = OPEN
+        self.retry_at = now + self.delay
+        return opened
+
+    @property
+    def degraded(self):
+        """القاطع غير مغلق، أو فشلت آخر محاولة: النتائج المعروضة قد تكون قديمة."""
+        return self.state != CLOSED or self.failures > 0
+
+    def status(self, now=None):
+        """وصف قصير للحالة (لـ /debug)."""
+        if self.state == CLOSED:
+            if self.failures:
+                return f"متصلة ({self.failures} أخطاء متتالية: {self.last_error})"
+            return "متصلة"
+        now = time.monotonic() if now is None else now
+        down = now - self.opened_at if self.opened_at is not None else 0
+        retry = max(0, self.retry_at - now)
+        return (
+            f"القاطع مفتوح منذ {down:.0f} ث، المحاولة التالية بعد {retry:.0f} ث "
+            f"({self.rejected} طلب خُدم من الذاكرة): {self.last_error}"
+        )
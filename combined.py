@@ -0,0 +1,86 @@
+"""
+تشغيل البوت والـ Worker في عملية واحدة وحلقة asyncio واحدة.
+
+بديل اختياري لعمليتي Procfile (web: bot.py و worker: python worker.py) على الخطط
+الصغيرة: مفسر واحد، ومحرك قاعدة بيانات واحد، وكتالوج واحد في الذاكرة. كل معاملة
+ناجحة للـ Worker (إضافة/تعديل/حذف) تُطبق مباشرة على ذاكرة البوت (آخر الإضافات
+ولقطة الكتالوج) عبر worker.INGEST_LISTENERS بدلاً من انتظار استطلاع إصدار الكتالوج.
+
+كتابات الـ Worker (الرسائل الحية واستيراد التاريخ) تُنفذ في خيط واحد مخصص
+(worker.DB_IN_THREAD)، فمعاملة بطيئة أو استيراد كامل لا يوقف معالجات البوت، ويُعاد
+تطبيق التغيير على ذاكرة البوت داخل الحلقة بـ call_soon_threadsafe.
+
+العمليتان مرتبطتان: إذا توقف الـ Worker (monitor_channel يطبع الخطأ وينتهي، مثلاً
+عند فشل الاتصال بتليجرام أو انتهاء الجلسة) يتوقف البوت أيضاً وتنتهي العملية، ليعيد
+مدير التشغيل (Railway) تشغيلهما معاً.
+
+الاستخدام (بنفس متغيرات البيئة للعمليتين):
+    python combined.py
+"""
+import asyncio
+import signal
+import sys
+
+from telegram import Update
+from telethon import TelegramClient
+from telethon.sessions import StringSession
+
+import bot
+import database
+import worker
+
+async def run():
+    engine = database.get_engine()
+    # محرك واحد للطرفين
+    bot.engine = engine
+    worker.engine = engine
+    worker.create_tables()
+    loop = asyncio.get_running_loop()
+    worker.DB_IN_THREAD = True
+    # المستمع يُستدعى من خيط الكتابة، وذاكرة البوت تُعدل داخل الحلقة فقط
+    worker.INGEST_LISTENERS.append(
+        lambda *change: loop.call_soon_threadsafe(bot.apply_ingest_change, *change)
+    )
+
+    application = bot.build_application()
+    client = TelegramClient(StringSession(worker.STRING_SESSION), worker.API_ID, worker.API_HASH)
+
+    stop = asyncio.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(signum, stop.set)
+        except NotImplementedError:
+            pass
+
+    # نفس ترتيب run_polling: التهيئة، post_init، الاستقبال
+    await application.initialize()
+    await application.post_init(application)
+    await application.updater.start_polling(allowed_updates=Update.ALL_TYPES)
+    await application.start()
+    print("🤖 البوت والـ Worker يعملان في عملية واحدة...")
+
+    monitor = asyncio.create_task(worker.monitor_channel(client=client))
+    stopper = asyncio.create_task(stop.wait())
+    try:
+        # انتهاء الـ Worker لأي سبب يوقف البوت أيضاً (انظر أعلى الملف)
+        await asyncio.wait({monitor, stopper}, return_when=asyncio.FIRST_COMPLETED)
+        if monitor.done() and not stop.is_set():
+            print("🛑 توقف الـ Worker، إيقاف البوت أيضاً...")
+    finally:
+        stopper.cancel()
+        # monitor_channel يغلق الاتصال وينتهي عند قطع العميل
+        await client.disconnect()
+        await asyncio.gather(monitor, return_exceptions=True)
+        await application.updater.stop()
+        await application.stop()
+        await application.post_shutdown(application)
+        await application.shutdown()
+
+if __name__ == "__main__":
+    if not bot.BOT_TOKEN:
+        print("❌ خطأ: BOT_TOKEN غير موجود في متغيرات البيئة!")
+        sys.exit(1)
+    if not all([worker.API_ID, worker.API_HASH, worker.STRING_SESSION]):
+        print("❌ خطأ: واحد أو أكثر من المتغيرات التالية مفقود: API_ID, API_HASH, STRING_SESSION")
+        sys.exit(1)
+    asyncio.run(run())
@@ -11,8 +11,72 @@ class Config:
     # قناة المسلسلات
     CHANNEL_USERNAME = os.environ.get("CHANNEL_USERNAME", "@your_channel")
     
-    # المشرفون (ضع ID الخاص بك)
+    # المشرفون (ضع ID الخاص بك)، وحدهم يستطيعون استخدام /test و /debug
     ADMIN_IDS = list(map(int, os.environ.get("ADMIN_IDS", "123456789").split(",")))
     
+    # تحديد معدل الطلبات لكل مستخدم: السعة (دفعة قصيرة) والرموز المضافة في الدقيقة لكل فئة
+    RATE_LIMIT_ENABLED = os.environ.get("RATE_LIMIT_ENABLED", "true").lower() == "true"
+    RATE_LIMIT_NAV_BURST = int(os.environ.get("RATE_LIMIT_NAV_BURST", 20))
+    RATE_LIMIT_NAV_PER_MINUTE = float(os.environ.get("RATE_LIMIT_NAV_PER_MINUTE", 60))
+    RATE_LIMIT_SEND_BURST = int(os.environ.get("RATE_LIMIT_SEND_BURST", 5))
+    RATE_LIMIT_SEND_PER_MINUTE = float(os.environ.get("RATE_LIMIT_SEND_PER_MINUTE", 10))
+    RATE_LIMIT_STATS_BURST = int(os.environ.get("RATE_LIMIT_STATS_BURST", 2))
+    RATE_LIMIT_STATS_PER_MINUTE = float(os.environ.get("RATE_LIMIT_STATS_PER_MINUTE", 2))
+    RATE_LIMIT_MAX_USERS = int(os.environ.get("RATE_LIMIT_MAX_USERS", 50000))
+    
     # إعدادات قاعدة البيانات
-    DATABASE_URL = os.environ.get("DATABASE_URL", "sqlite:///series.db")
\ No newline at end of file
+    DATABASE_URL = os.environ.get("DATABASE_URL", "sqlite:///series.db")
+    
+    # نسخة متماثلة للقراءة فقط (فارغ = كل القراءات من DATABASE_URL) ومدة استبعادها بعد فشل الاتصال
+    DATABASE_READ_URL = os.environ.get("DATABASE_READ_URL", "")
+    READ_REPLICA_RETRY_SECONDS = float(os.environ.get("READ_REPLICA_RETRY_SECONDS", 30))
+    
+    # مهلات PostgreSQL: الاتصال (بالثواني)، الانتظار على مجمع الاتصالات، وأقصى مدة لاستعلام واحد (0 بلا حد)
+    DB_CONNECT_TIMEOUT_SECONDS = int(os.environ.get("DB_CONNECT_TIMEOUT_SECONDS", 5))
+    DB_POOL_TIMEOUT_SECONDS = float(os.environ.get("DB_POOL_TIMEOUT_SECONDS", 5))
+    DB_STATEMENT_TIMEOUT_MS = int(os.environ.get("DB_STATEMENT_TIMEOUT_MS", 15000))
+    
+    # قاطع الدائرة في البوت: أخطاء الاتصال المتتالية قبل فتحه، وأول/أقصى مدة قبل إعادة المحاولة
+    DB_BREAKER_FAILURES = int(os.environ.get("DB_BREAKER_FAILURES", 3))
+    DB_BREAKER_RESET_SECONDS = float(os.environ.get("DB_BREAKER_RESET_SECONDS", 5))
+    DB_BREAKER_MAX_RESET_SECONDS = float(os.environ.get("DB_BREAKER_MAX_RESET_SECONDS", 60))
+    # أقصى انتظار لعملية قاعدة بيانات داخل معالج طلب، وعدد آخر النتائج الناجحة المحفوظة لوقت التعطل
+    DB_CALL_TIMEOUT_SECONDS = float(os.environ.get("DB_CALL_TIMEOUT_SECONDS", 5))
+    STALE_CACHE_SIZE = int(os.environ.get("STALE_CACHE_SIZE", 2000))
+    
+    # إعدادات SQLite (للنشر على خادم واحد وللاختبارات)
+    SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", 5000))
+    SQLITE_MMAP_SIZE = int(os.environ.get("SQLITE_MMAP_SIZE", 256 * 1024 * 1024))
+    SQLITE_CACHE_SIZE_KB = int(os.environ.get("SQLITE_CACHE_SIZE_KB", 64 * 1024))
+    
+    # آخر الإضافات ومراقبة تغييرات الكتالوج في البوت
+    LATEST_BUFFER_SIZE = int(os.environ.get("LATEST_BUFFER_SIZE", 20))
+    CATALOG_POLL_SECONDS = float(os.environ.get("CATALOG_POLL_SECONDS", 5))
+    
+    # أقل مدة بين تحديثين للقطة إحصائيات /debug و /test (بالثواني)
+    STATS_REFRESH_SECONDS = float(os.environ.get("STATS_REFRESH_SECONDS", 300))
+    
+    # عدد المحتويات في كل صفحة من صفحات الفهرس الأبجدي
+    LETTER_PAGE_SIZE = int(os.environ.get("LETTER_PAGE_SIZE", 20))
+    
+    # الفترة بين كل دفعتين لكتابة تقدم المشاهدة (بالثواني)
+    PROGRESS_FLUSH_SECONDS = float(os.environ.get("PROGRESS_FLUSH_SECONDS", 30))
+    
+    # ترتيب الشعبية (🔥 الرائج): حجم القائمة والعدادات ونصف العمر وفترة الحفظ
+    TRENDING_SIZE = int(os.environ.get("TRENDING_SIZE", 10))
+    POPULARITY_TOP_K = int(os.environ.get("POPULARITY_TOP_K", 100))
+    POPULARITY_SKETCH_WIDTH = int(os.environ.get("POPULARITY_SKETCH_WIDTH", 2048))
+    POPULARITY_SKETCH_DEPTH = int(os.environ.get("POPULARITY_SKETCH_DEPTH", 4))
+    POPULARITY_HALF_LIFE_SECONDS = float(os.environ.get("POPULARITY_HALF_LIFE_SECONDS", 24 * 3600))
+    POPULARITY_SNAPSHOT_SECONDS = float(os.environ.get("POPULARITY_SNAPSHOT_SECONDS", 300))
+    
+    # لقطة الكتالوج على القرص لإقلاع دافئ (مسار فارغ لتعطيلها) والفترة بين كل حفظين
+    CATALOG_SNAPSHOT_PATH = os.environ.get("CATALOG_SNAPSHOT_PATH", "catalog_snapshot.bin")
+    CATALOG_SNAPSHOT_SECONDS = float(os.environ.get("CATALOG_SNAPSHOT_SECONDS", 600))
+    
+    # تشخيص الذاكرة (/memory في البوت): الفترة بين عينات RSS (0 لتعطيلها)، وعدد إطارات tracemalloc لكل تخصيص
+    MEMORY_RSS_SECONDS = float(os.environ.get("MEMORY_RSS_SECONDS", 60))
+    MEMORY_TRACE_FRAMES = int(os.environ.get("MEMORY_TRACE_FRAMES", 1))
+    
+    # محادثة تخزين (قناة خاصة أو محادثة المشرف) تُعاد إليها الحلقات القديمة مرة واحدة لالتقاط file_id، 0 لتعطيلها
+    FILE_CACHE_CHAT_ID = int(os.environ.get("FILE_CACHE_CHAT_ID", 0))
@@ -1,80 +1,386 @@
 import os
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+import time
+from sqlalchemy import (
+    create_engine, event, inspect, text, Column, Integer, BigInteger, Float, String, Text, DateTime, ForeignKey, Index
+)
+from sqlalchemy.orm import declarative_base, sessionmaker
 from datetime import datetime
 from config import Config
+from textnorm import index_letter, sort_key
 
+# ==============================
 # إنشاء محرك قاعدة البيانات
-if Config.DATABASE_URL.startswith("postgres"):
-    engine = create_engine(Config.DATABASE_URL)
-else:
-    engine = create_engine(Config.DATABASE_URL)
+# ==============================
+def normalize_database_url(url):
+    """إصلاح روابط postgres:// القديمة (Railway/Heroku) لتعمل مع SQLAlchemy."""
+    if url.startswith("postgres://"):
+        url = url.replace("postgres://", "postgresql://", 1)
+    return url
+
+def _tune_sqlite(dbapi_connection, connection_record):
+    """إعدادات SQLite للنشر على خادم واحد: WAL يسمح للبوت والـ Worker بمشاركة نفس الملف."""
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={Config.SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute(f"PRAGMA mmap_size={Config.SQLITE_MMAP_SIZE}")
+    # القيمة السالبة تعني الحجم بالكيلوبايت بدلاً من عدد الصفحات
+    cursor.execute(f"PRAGMA cache_size=-{Config.SQLITE_CACHE_SIZE_KB}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.close()
+
+def create_db_engine(url=None, tune_sqlite=True):
+    """إنشاء محرك قاعدة البيانات حسب نوعها (PostgreSQL أو SQLite)."""
+    url = normalize_database_url(url or Config.DATABASE_URL)
+    if url.startswith("sqlite"):
+        engine = create_engine(
+            url,
+            connect_args={
+                "timeout": Config.SQLITE_BUSY_TIMEOUT_MS / 1000,
+                "check_same_thread": False,
+            },
+        )
+        if tune_sqlite:
+            event.listen(engine, "connect", _tune_sqlite)
+        return engine
+    # مهلات حتى لا تعلق العمليات على قاعدة بطيئة أو غير متاحة
+    connect_args = {"connect_timeout": Config.DB_CONNECT_TIMEOUT_SECONDS}
+    if Config.DB_STATEMENT_TIMEOUT_MS:
+        connect_args["options"] = f"-c statement_timeout={Config.DB_STATEMENT_TIMEOUT_MS}"
+    return create_engine(
+        url, pool_pre_ping=True, pool_timeout=Config.DB_POOL_TIMEOUT_SECONDS, connect_args=connect_args
+    )
+
+_engine = None
+
+def get_engine():
+    """المحرك المشترك، يُنشأ عند أول استخدام وليس عند الاستيراد."""
+    global _engine
+    if _engine is None:
+        _engine = create_db_engine()
+    return _engine
+
+# ترتيب ثنائي لمفاتيح الفهرس الأبجدي: BINARY افتراضي في SQLite، و "C" صراحة في PostgreSQL
+SortKey = String(255).with_variant(String(255, collation="C"), "postgresql")
 
 Base = declarative_base()
-Session = sessionmaker(bind=engine)
+Session = sessionmaker()
 
-# تعريف النماذج
-# تعريف Series المصحّح في database.py
+# ==============================
+# تعريف النماذج (مطابقة للجداول التي يستخدمها bot.py و worker.py)
+# ==============================
 class Series(Base):
     __tablename__ = 'series'
-    
+
     id = Column(Integer, primary_key=True)
-    name = Column(String(255), nullable=False, unique=True)  # هذا العمود موجود
-    created_at = Column(DateTime, default=datetime.utcnow)   # هذا موجود
-    # احذف الأعمدة التالية إذا كانت موجودة في كودك:
-    # description = Column(Text)
-    # category = Column(String(100))
-    # cover_image = Column(String(500))
-    # is_active = Column(Integer, default=1)
+    name = Column(String(255), nullable=False)
+    type = Column(String(10), default='series')  # 'series' أو 'movie'
+    created_at = Column(DateTime, default=datetime.utcnow)
+    # الفهرس الأبجدي (textnorm.sort_key و textnorm.index_letter)
+    sort_key = Column(SortKey)
+    initial = Column(SortKey)
+
+    __table_args__ = (
+        Index('idx_series_name_type', 'name', 'type', unique=True),
+        # صفحات حرف واحد مرتبة أبجدياً (keyset على sort_key ثم id)
+        Index('idx_series_initial_sort', 'type', 'initial', 'sort_key', 'id'),
+    )
 
 class Episode(Base):
     __tablename__ = 'episodes'
-    
+
     id = Column(Integer, primary_key=True)
-    series_id = Column(Integer, nullable=False)
+    series_id = Column(Integer, ForeignKey('series.id'))
     season = Column(Integer, default=1)
     episode_number = Column(Integer, nullable=False)
-    title = Column(String(255))
-    telegram_message_id = Column(Integer, nullable=False)
-    telegram_channel_id = Column(String(255), nullable=False)
-    quality = Column(String(50))
-    duration = Column(String(50))
+    telegram_message_id = Column(Integer, nullable=False, unique=True)
+    telegram_channel_id = Column(String(255))
     added_at = Column(DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        # يخدم جلب حلقات مسلسل مرتبة حسب الموسم والحلقة
+        Index('idx_episodes_series_season_ep', 'series_id', 'season', 'episode_number'),
+    )
+
+class EpisodeFile(Base):
+    """file_id لملف الحلقة في Bot API مفهرس برقم رسالة القناة (يلتقطه البوت)."""
+    __tablename__ = 'episode_files'
+
+    telegram_message_id = Column(Integer, primary_key=True)
+    file_id = Column(String(255), nullable=False)
+    file_unique_id = Column(String(64))
+    media_type = Column(String(10), default='video')  # 'video' أو 'document'
+    captured_at = Column(DateTime, default=datetime.utcnow)
+
+class RawMessage(Base):
+    """نص كل رسالة من القناة كما وصل (للإضافة فقط)، لإعادة التحليل بدون تليجرام."""
+    __tablename__ = 'raw_messages'
+
+    id = Column(Integer, primary_key=True)
+    telegram_message_id = Column(Integer, nullable=False)
+    message_date = Column(DateTime)
+    text = Column(Text)
+    event = Column(String(10), nullable=False)  # 'new' أو 'edit' أو 'delete' أو 'reparse'
+    parse_status = Column(String(10), nullable=False)  # 'parsed' أو 'unparsed' أو 'deleted'
+    parser_version = Column(Integer, nullable=False)
+    received_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        # آخر نسخة لكل رسالة: MAX(id) لكل telegram_message_id
+        Index('idx_raw_messages_msg', 'telegram_message_id', 'id'),
+    )
+
 class UserFavorite(Base):
     __tablename__ = 'user_favorites'
-    
+
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, nullable=False)
     series_id = Column(Integer, nullable=False)
     added_at = Column(DateTime, default=datetime.utcnow)
 
+class WatchProgress(Base):
+    """آخر حلقة فتحها المستخدم في كل مسلسل (يكتبها البوت على دفعات)."""
+    __tablename__ = 'watch_progress'
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(BigInteger, nullable=False)
+    series_id = Column(Integer, nullable=False)
+    season = Column(Integer, default=1)
+    episode_number = Column(Integer, nullable=False)
+    telegram_message_id = Column(Integer, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index('idx_watch_progress_user_series', 'user_id', 'series_id', unique=True),
+    )
+
+class SeriesPopularity(Base):
+    """آخر لقطة لقائمة الأكثر شعبية (تُستبدل دورياً من ذاكرة البوت)."""
+    __tablename__ = 'series_popularity'
+
+    series_id = Column(Integer, primary_key=True)
+    score = Column(Float, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+class SeriesMergeCandidate(Base):
+    """زوج محتويات مكررة محتمل ينتظر مراجعة المشرف (من dedupe.py)."""
+    __tablename__ = 'series_merge_candidates'
+
+    id = Column(Integer, primary_key=True)
+    series_id = Column(Integer, nullable=False)  # المحتوى الأساسي المقترح
+    duplicate_id = Column(Integer, nullable=False)
+    score = Column(Float, nullable=False)
+    status = Column(String(10), default='pending')  # 'pending' أو 'merged' أو 'rejected'
+    created_at = Column(DateTime, default=datetime.utcnow)
+    reviewed_at = Column(DateTime)
+
+    __table_args__ = (
+        Index('idx_merge_candidates_pair', 'series_id', 'duplicate_id', unique=True),
+    )
+
+class SeriesAlias(Base):
+    """اسم محتوى مدموج يشير إلى المحتوى الأساسي، حتى لا تعيد المنشورات الجديدة إنشاءه (من dedupe.py)."""
+    __tablename__ = 'series_aliases'
+
+    name = Column(String(255), primary_key=True)
+    type = Column(String(10), primary_key=True)
+    series_id = Column(Integer, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class SeriesLetterCount(Base):
+    """عدد المحتويات لكل حرف في الفهرس الأبجدي، يُحدّث مع كل إضافة أو حذف لمحتوى."""
+    __tablename__ = 'series_letter_counts'
+
+    type = Column(String(10), primary_key=True)
+    initial = Column(SortKey, primary_key=True)
+    series_count = Column(Integer, nullable=False, default=0)
+
+class CatalogState(Base):
+    """صف واحد يحمل رقم إصدار الكتالوج، يزيده الـ Worker مع كل تغيير في الحلقات."""
+    __tablename__ = 'catalog_state'
+
+    id = Column(Integer, primary_key=True)
+    version = Column(BigInteger, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
 # إنشاء الجداول
-def init_db():
-    Base.metadata.create_all(engine)
+def init_db(bind=None):
+    """إنشاء الجداول والفهارس الناقصة بصيغة تناسب PostgreSQL و SQLite."""
+    bind = bind or get_engine()
+    Base.metadata.create_all(bind)
+    # create_all لا يضيف الأعمدة ولا الفهارس الجديدة إلى الجداول الموجودة مسبقاً
+    add_missing_columns(bind)
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind, checkfirst=True)
+    with bind.begin() as conn:
+        if conn.execute(text("SELECT 1 FROM catalog_state WHERE id = 1")).fetchone() is None:
+            conn.execute(text("INSERT INTO catalog_state (id, version) VALUES (1, 0)"))
+    backfill_sort_keys(bind)
+
+def add_missing_columns(bind):
+    """إضافة أعمدة النماذج الناقصة في الجداول الموجودة (أعمدة تقبل NULL فقط)."""
+    inspector = inspect(bind)
+    existing_tables = set(inspector.get_table_names())
+    with bind.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing or not column.nullable:
+                    continue
+                preparer = bind.dialect.identifier_preparer
+                conn.execute(text(
+                    f"ALTER TABLE {preparer.quote(table.name)} ADD COLUMN "
+                    f"{preparer.quote(column.name)} {column.type.compile(dialect=bind.dialect)}"
+                ))
+                print(f"🧱 تمت إضافة العمود {table.name}.{column.name}")
+
+def backfill_sort_keys(bind):
+    """حساب مفاتيح الفهرس للمحتويات القديمة، وإعادة بناء أعداد الحروف عند الحاجة."""
+    with bind.begin() as conn:
+        rows = conn.execute(text("SELECT id, name FROM series WHERE sort_key IS NULL")).fetchall()
+        if rows:
+            params = []
+            for series_id, name in rows:
+                key = sort_key(name)
+                params.append({"id": series_id, "sort_key": key, "initial": index_letter(key)})
+            conn.execute(
+                text("UPDATE series SET sort_key = :sort_key, initial = :initial WHERE id = :id"), params
+            )
+            print(f"🔤 تم حساب مفاتيح الفهرس الأبجدي لـ {len(rows)} محتوى")
+        has_counts = conn.execute(text("SELECT 1 FROM series_letter_counts LIMIT 1")).fetchone()
+        if rows or not has_counts:
+            rebuild_letter_counts(conn)
+
+def rebuild_letter_counts(conn):
+    conn.execute(text("DELETE FROM series_letter_counts"))
+    conn.execute(text("""
+        INSERT INTO series_letter_counts (type, initial, series_count)
+        SELECT type, initial, COUNT(*) FROM series
+        WHERE initial IS NOT NULL
+        GROUP BY type, initial
+    """))
+
+def series_index_fields(name):
+    """(sort_key, initial) لاسم محتوى جديد."""
+    key = sort_key(name)
+    return key, index_letter(key)
+
+def find_series(conn, name, content_type):
+    """(معرف المحتوى، هل وُجد عبر اسم مدموج) بالاسم والنوع، أو (None, False)."""
+    params = {"name": name, "type": content_type}
+    row = conn.execute(text("SELECT id FROM series WHERE name = :name AND type = :type"), params).fetchone()
+    if row:
+        return row[0], False
+    row = conn.execute(text("""
+        SELECT a.series_id FROM series_aliases a
+        JOIN series s ON s.id = a.series_id
+        WHERE a.name = :name AND a.type = :type
+    """), params).fetchone()
+    return (row[0], True) if row else (None, False)
+
+def has_episode(conn, series_id, season, episode_number):
+    """هل توجد حلقة بنفس الموسم والرقم في المحتوى؟"""
+    season_filter = "season = :season" if season is not None else "season IS NULL"
+    row = conn.execute(text(f"""
+        SELECT 1 FROM episodes
+        WHERE series_id = :sid AND {season_filter} AND episode_number = :ep
+        LIMIT 1
+    """), {"sid": series_id, "season": season, "ep": episode_number}).fetchone()
+    return row is not None
+
+def adjust_letter_count(conn, content_type, initial, delta):
+    """تعديل عدد المحتويات لحرف داخل معاملة إضافة أو حذف المحتوى."""
+    conn.execute(text("""
+        INSERT INTO series_letter_counts (type, initial, series_count)
+        VALUES (:type, :initial, :delta)
+        ON CONFLICT (type, initial) DO UPDATE SET
+            series_count = series_letter_counts.series_count + excluded.series_count
+    """), {"type": content_type, "initial": initial, "delta": delta})
+
+# ==============================
+# إصدار الكتالوج (إشارة التغيير بين الـ Worker والبوت)
+# ==============================
+def bump_catalog_version(conn):
+    """زيادة إصدار الكتالوج داخل نفس معاملة التغيير."""
+    conn.execute(text("""
+        UPDATE catalog_state SET version = version + 1, updated_at = CURRENT_TIMESTAMP
+        WHERE id = 1
+    """))
+
+def get_catalog_version(conn):
+    """قراءة إصدار الكتالوج الحالي (استعلام بالمفتاح الأساسي، رخيص جداً)."""
+    row = conn.execute(text("SELECT version FROM catalog_state WHERE id = 1")).fetchone()
+    return row[0] if row else 0
+
+class ReadReplica:
+    """نسخة متماثلة للقراءة مع الرجوع إلى القاعدة الأساسية.
+
+    تُستخدم النسخة فقط إذا نجح آخر فحص لها وكان إصدار الكتالوج فيها لا يقل عن آخر
+    إصدار معروف من الأساسية (التي يكتب فيها الـ Worker). عند فشل الاتصال تُستبعد
+    لمدة retry_seconds ثم يُعاد فحصها. الفحص يتصل بالقاعدة، فيُستدعى من خيط خلفي.
+    """
+
+    def __init__(self, url, retry_seconds=30):
+        self.url = url
+        self.retry_seconds = retry_seconds
+        self.engine = None
+        self.version = None
+        self.error = "لم تُفحص بعد"
+        self.down_until = 0.0
+
+    def check(self):
+        """قراءة إصدار الكتالوج من النسخة المتماثلة، وإرجاعه (أو None عند الفشل)."""
+        if time.monotonic() < self.down_until:
+            return None
+        try:
+            if self.engine is None:
+                self.engine = create_db_engine(self.url)
+            with self.engine.connect() as conn:
+                self.version = get_catalog_version(conn)
+            self.error = None
+            return self.version
+        except Exception as e:
+            self.mark_down(e)
+            return None
+
+    def mark_down(self, error):
+        self.error = str(error).splitlines()[0][:200] if str(error) else type(error).__name__
+        self.down_until = time.monotonic() + self.retry_seconds
+
+    def usable(self, required_version):
+        """هل يمكن القراءة منها الآن دون رؤية كتالوج أقدم من required_version؟"""
+        if self.engine is None or self.error is not None or time.monotonic() < self.down_until:
+            return False
+        return required_version is None or (self.version is not None and self.version >= required_version)
+
+    def status(self, required_version):
+        if self.error is not None:
+            return f"غير متاحة ({self.error})"
+        if not self.usable(required_version):
+            return f"متأخرة (إصدار {self.version} من {required_version})"
+        return f"متزامنة (إصدار {self.version})"
 
 # فئات المساعدة
 class DatabaseManager:
     def __init__(self):
-        self.session = Session()
-    
-    def add_series(self, name, description="", category="عام", cover_image=""):
-        series = Series(
-            name=name,
-            description=description,
-            category=category,
-            cover_image=cover_image
-        )
+        self.session = Session(bind=get_engine())
+
+    def add_series(self, name, content_type="series"):
+        # مفتاح الفهرس الأبجدي وعدد الحرف في نفس المعاملة، مثل worker.insert_episode
+        key, initial = series_index_fields(name)
+        series = Series(name=name, type=content_type, sort_key=key, initial=initial)
         self.session.add(series)
+        self.session.flush()
+        adjust_letter_count(self.session.connection(), content_type, initial, 1)
         self.session.commit()
         return series.id
-    
+
     def get_all_series(self):
-        return self.session.query(Series).filter_by(is_active=1).all()
-    
+        return self.session.query(Series).order_by(Series.id).all()
+
     def close(self):
         self.session.close()
-
-# تهيئة قاعدة البيانات عند الاستيراد
-init_db()
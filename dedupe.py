@@ -0,0 +1,362 @@
+"""
+كشف المحتويات المكررة في جدول series ودمجها (مهمة تُشغّل يدوياً أو دورياً).
+
+اختلافات التحليل (رقم ملتصق بالاسم، كلمة "مسلسل" متبقية، اختلاف الهمزات والتشكيل)
+تُنتج أكثر من صف لنفس العمل وتتوزع حلقاته بينها. بدلاً من مقارنة كل زوج (n²) تُجمع
+العناوين في كتل بمفاتيح رخيصة ولا يُقارن إلا ما داخل الكتلة الواحدة:
+    - بادئة الاسم الموحد (textnorm.normalize_title)
+    - توقيع MinHash لثلاثيات الحروف مقسماً إلى شرائط (LSH)
+
+ثم يُقيّم كل زوج مرشح:
+    - الاسمان متطابقان بعد التوحيد          -> دمج تلقائي في المحتوى الأساسي
+    - متشابهان (الرقم في النهاية فقط أو تشابه عالٍ) -> جدول series_merge_candidates للمراجعة
+
+الدمج دائم: اسم المكرر يبقى في series_aliases، فالمنشورات الجديدة به وإعادة التحليل
+تذهب إلى المحتوى الأساسي بدلاً من إعادة إنشائه.
+
+الاستخدام:
+    python dedupe.py --dry-run            # عرض القرارات بدون أي كتابة
+    python dedupe.py                      # دمج تلقائي + إضافة أزواج المراجعة
+    python dedupe.py --review             # عرض الأزواج المنتظرة
+    python dedupe.py --approve 12 --reject 13
+    python dedupe.py --synthesize 100000  # قياس زمن الكشف على عناوين اصطناعية
+"""
+import argparse
+import random
+import time
+from collections import defaultdict
+from itertools import repeat
+from datetime import datetime
+from difflib import SequenceMatcher
+
+from sqlalchemy import text
+
+from database import adjust_letter_count, bump_catalog_version, create_db_engine, init_db
+from textnorm import normalize_title, strip_trailing_number
+
+# طول البادئة في مفتاح الكتلة الأول
+PREFIX_LENGTH = 4
+# MinHash: عدد دوال التجزئة وعدد القيم في كل شريط (8 دوال = 4 شرائط × 2)
+NUM_HASHES = 8
+BAND_SIZE = 2
+# الكتل الأكبر من هذا عامة جداً (مثل بادئة "ال") فلا تنتج مرشحين مفيدين
+MAX_BLOCK_SIZE = 200
+
+AUTO_MERGE_SCORE = 1.0
+REVIEW_SCORE = 0.85
+
+
+class Title:
+    """عنوان محتوى مع مفاتيحه المحسوبة مرة واحدة."""
+    __slots__ = ("id", "name", "type", "episode_count", "key", "exact_key")
+
+    def __init__(self, series_id, name, content_type, episode_count):
+        self.id = series_id
+        self.name = name
+        self.type = content_type
+        self.episode_count = episode_count
+        self.exact_key = normalize_title(name, strip_number=False)
+        self.key = strip_trailing_number(self.exact_key)
+
+# ==============================
+# 1. مفاتيح الكتل
+# ==============================
+def trigrams(key):
+    compact = f" {key.replace(' ', '')} "
+    return {compact[i:i + 3] for i in range(max(len(compact) - 2, 1))}
+
+def minhash(grams):
+    """توقيع MinHash: أصغر قيمة تجزئة للثلاثيات لكل بذرة.
+
+    hash() للنصوص يتغير بين تشغيل وآخر، وهذا لا يهم لأن الكتل تُبنى وتُستخدم في نفس التشغيل.
+    """
+    return [min(map(hash, zip(repeat(seed), grams))) for seed in range(NUM_HASHES)]
+
+def blocking_keys(title):
+    """مفاتيح الكتل لعنوان: البادئة + شرائط MinHash (كلها ضمن نفس النوع)."""
+    keys = [(title.type, "p", title.key.replace(" ", "")[:PREFIX_LENGTH])]
+    signature = minhash(trigrams(title.key))
+    for band in range(0, NUM_HASHES, BAND_SIZE):
+        keys.append((title.type, band, tuple(signature[band:band + BAND_SIZE])))
+    return keys
+
+def candidate_pairs(titles):
+    """أزواج المرشحين (id أصغر، id أكبر) من العناوين التي تشترك في كتلة واحدة على الأقل."""
+    blocks = defaultdict(list)
+    for title in titles:
+        if title.key:
+            for key in blocking_keys(title):
+                blocks[key].append(title)
+    pairs = set()
+    for members in blocks.values():
+        if len(members) < 2 or len(members) > MAX_BLOCK_SIZE:
+            continue
+        for i, first in enumerate(members):
+            for second in members[i + 1:]:
+                pairs.add((first, second) if first.id < second.id else (second, first))
+    return pairs
+
+# ==============================
+# 2. التقييم والقرار
+# ==============================
+def score_pair(first, second, floor=0.0):
+    """درجة التشابه بين 0 و 1 (1 = نفس الاسم بعد التوحيد بما فيه الأرقام).
+
+    الأزواج التي لا يمكن أن تصل إلى floor تُرفض بالحدود العليا الرخيصة قبل ratio().
+    """
+    if first.exact_key == second.exact_key:
+        return 1.0
+    if first.key == second.key:
+        # الفرق رقم في النهاية فقط: قد يكون جزءاً مختلفاً، فيحتاج مراجعة
+        return 0.95
+    matcher = SequenceMatcher(None, first.key, second.key)
+    if matcher.real_quick_ratio() < floor or matcher.quick_ratio() < floor:
+        return 0.0
+    return round(matcher.ratio(), 3)
+
+def canonical_of(first, second):
+    """المحتوى الأساسي: الأكثر حلقات، ثم الأقدم."""
+    return min((first, second), key=lambda t: (-t.episode_count, t.id))
+
+def find_duplicates(titles, auto_score=AUTO_MERGE_SCORE, review_score=REVIEW_SCORE):
+    """إرجاع (merges, reviews): قوائم (canonical, duplicate, score)."""
+    merges, reviews = [], []
+    for first, second in candidate_pairs(titles):
+        score = score_pair(first, second, review_score)
+        if score < review_score:
+            continue
+        keep = canonical_of(first, second)
+        duplicate = second if keep is first else first
+        (merges if score >= auto_score else reviews).append((keep, duplicate, score))
+    return merges, reviews
+
+def merge_groups(merges):
+    """تجميع الدمج المتعدي (أ=ب، ب=ج) بحيث يُدمج كل مكرر مباشرة في أساسي واحد: [(keep, duplicate)]."""
+    parent = {}
+    titles = {}
+
+    def find(title):
+        while title.id in parent:
+            title = parent[title.id]
+        return title
+
+    for keep, duplicate, _ in merges:
+        titles[keep.id] = keep
+        titles[duplicate.id] = duplicate
+        root_keep, root_dup = find(keep), find(duplicate)
+        if root_keep is root_dup:
+            continue
+        winner = canonical_of(root_keep, root_dup)
+        parent[(root_dup if winner is root_keep else root_keep).id] = winner
+    return [(find(title), title) for title in titles.values() if title.id in parent]
+
+# ==============================
+# 3. التنفيذ على قاعدة البيانات
+# ==============================
+def load_titles(engine):
+    with engine.connect() as conn:
+        rows = conn.execute(text("""
+            SELECT s.id, s.name, s.type, COUNT(e.id)
+            FROM series s
+            LEFT JOIN episodes e ON s.id = e.series_id
+            GROUP BY s.id, s.name, s.type
+        """)).fetchall()
+    return [Title(*row) for row in rows]
+
+# حلقة المكرر التي لها نفس الموسم والرقم في الأساسي (episodes هو صف المكرر)
+_SAME_EPISODE_IN_KEEP = """
+    SELECT 1 FROM episodes k
+    WHERE k.series_id = :keep
+      AND COALESCE(k.season, -1) = COALESCE(episodes.season, -1)
+      AND k.episode_number = episodes.episode_number
+"""
+
+def merge_series(conn, keep_id, duplicate_id):
+    """نقل كل ما يخص المحتوى المكرر إلى الأساسي ثم حذفه (داخل معاملة المستدعي).
+
+    اسم المكرر يُحفظ في series_aliases فيجده insert_episode وإعادة التحليل بعد الدمج،
+    والحلقات الموجودة في الأساسي بنفس الموسم والرقم تُحذف بدلاً من تكرارها.
+    ترجع عدد الحلقات المحذوفة.
+    """
+    params = {"keep": keep_id, "dup": duplicate_id, "now": datetime.utcnow()}
+    # تقدم المشاهدة على حلقة ستُحذف يشير إلى نسختها في الأساسي
+    conn.execute(text(f"""
+        UPDATE watch_progress SET telegram_message_id = (
+            SELECT k.telegram_message_id FROM episodes k
+            WHERE k.series_id = :keep
+              AND COALESCE(k.season, -1) = COALESCE(watch_progress.season, -1)
+              AND k.episode_number = watch_progress.episode_number
+            ORDER BY k.id
+            LIMIT 1
+        )
+        WHERE series_id = :dup AND telegram_message_id IN (
+            SELECT telegram_message_id FROM episodes
+            WHERE series_id = :dup AND EXISTS ({_SAME_EPISODE_IN_KEEP})
+        )
+    """), params)
+    dropped = conn.execute(text(f"""
+        DELETE FROM episodes
+        WHERE series_id = :dup AND EXISTS ({_SAME_EPISODE_IN_KEEP})
+    """), params).rowcount
+    conn.execute(text("UPDATE episodes SET series_id = :keep WHERE series_id = :dup"), params)
+    # تقدم المشاهدة فريد لكل (مستخدم، مسلسل): يبقى موضع الأساسي إن وجد
+    conn.execute(text("""
+        DELETE FROM watch_progress
+        WHERE series_id = :dup
+          AND user_id IN (SELECT user_id FROM watch_progress WHERE series_id = :keep)
+    """), params)
+    conn.execute(text("UPDATE watch_progress SET series_id = :keep WHERE series_id = :dup"), params)
+    conn.execute(text("UPDATE user_favorites SET series_id = :keep WHERE series_id = :dup"), params)
+    conn.execute(text("DELETE FROM series_popularity WHERE series_id = :dup"), params)
+    # الأزواج المنتظرة التي تشير إلى المحتوى المحذوف لم تعد صالحة
+    conn.execute(text("""
+        DELETE FROM series_merge_candidates
+        WHERE status = 'pending' AND (series_id = :dup OR duplicate_id = :dup)
+    """), params)
+    # الأسماء المدموجة سابقاً في المكرر، ثم اسم المكرر نفسه، تشير إلى الأساسي
+    conn.execute(text("UPDATE series_aliases SET series_id = :keep WHERE series_id = :dup"), params)
+    conn.execute(text("""
+        INSERT INTO series_aliases (name, type, series_id, created_at)
+        SELECT name, type, :keep, :now FROM series WHERE id = :dup
+        ON CONFLICT (name, type) DO UPDATE SET series_id = excluded.series_id
+    """), params)
+    duplicate = conn.execute(text("SELECT type, initial FROM series WHERE id = :dup"), params).fetchone()
+    conn.execute(text("DELETE FROM series WHERE id = :dup"), params)
+    if duplicate and duplicate[1] is not None:
+        adjust_letter_count(conn, duplicate[0], duplicate[1], -1)
+    return dropped
+
+def apply_merges(engine, groups):
+    """تنفيذ الدمج، كل مجموعة في معاملة مع زيادة إصدار الكتالوج."""
+    for keep, duplicate in groups:
+        with engine.begin() as conn:
+            dropped = merge_series(conn, keep.id, duplicate.id)
+            bump_catalog_version(conn)
+        print(f"🔗 دمج '{duplicate.name}' (ID:{duplicate.id}) في '{keep.name}' (ID:{keep.id})"
+              + (f"، حُذفت {dropped} حلقة مكررة" if dropped else ""))
+
+def queue_reviews(engine, reviews):
+    """إضافة أزواج المراجعة (الأزواج المرفوضة سابقاً لا تُضاف مرة أخرى)."""
+    if not reviews:
+        return 0
+    with engine.begin() as conn:
+        result = conn.execute(text("""
+            INSERT INTO series_merge_candidates (series_id, duplicate_id, score, status, created_at)
+            VALUES (:keep, :dup, :score, 'pending', :now)
+            ON CONFLICT (series_id, duplicate_id) DO NOTHING
+        """), [
+            {"keep": keep.id, "dup": duplicate.id, "score": score, "now": datetime.utcnow()}
+            for keep, duplicate, score in reviews
+        ])
+    return result.rowcount
+
+def show_reviews(engine):
+    with engine.connect() as conn:
+        rows = conn.execute(text("""
+            SELECT c.id, c.score, k.id, k.name, d.id, d.name
+            FROM series_merge_candidates c
+            JOIN series k ON k.id = c.series_id
+            JOIN series d ON d.id = c.duplicate_id
+            WHERE c.status = 'pending'
+            ORDER BY c.score DESC, c.id
+        """)).fetchall()
+    if not rows:
+        print("📭 لا توجد أزواج بانتظار المراجعة.")
+    for candidate_id, score, keep_id, keep_name, dup_id, dup_name in rows:
+        print(f"#{candidate_id} [{score:.2f}] '{keep_name}' (ID:{keep_id}) ⟵ '{dup_name}' (ID:{dup_id})")
+
+def review_candidate(engine, candidate_id, approve):
+    with engine.begin() as conn:
+        row = conn.execute(text("""
+            SELECT series_id, duplicate_id FROM series_merge_candidates
+            WHERE id = :id AND status = 'pending'
+        """), {"id": candidate_id}).fetchone()
+        if row is None:
+            print(f"⚠️ الزوج #{candidate_id} غير موجود أو تمت مراجعته")
+            return
+        conn.execute(text("""
+            UPDATE series_merge_candidates SET status = :status, reviewed_at = :now WHERE id = :id
+        """), {"status": "merged" if approve else "rejected", "now": datetime.utcnow(), "id": candidate_id})
+        if approve:
+            merge_series(conn, row[0], row[1])
+            bump_catalog_version(conn)
+    print(f"{'✅ تم دمج' if approve else '❌ تم رفض'} الزوج #{candidate_id}")
+
+# ==============================
+# 4. عناوين اصطناعية لقياس الأداء
+# ==============================
+def synthesize_titles(count, seed=0, duplicate_ratio=0.05):
+    """عناوين عشوائية مع نسبة من المكررات بصيغ مختلفة (همزات، تشكيل، "مسلسل"، رقم)."""
+    rng = random.Random(seed)
+    letters = "ابتثجحخدذرزسشصضطظعغفقكلمنهوي"
+    titles = []
+    for series_id in range(1, count + 1):
+        if titles and rng.random() < duplicate_ratio:
+            base = rng.choice(titles)
+            variant = rng.choice([
+                f"مسلسل {base.name}", f"{base.name} 2", base.name.replace("ا", "أ", 1),
+                f"{base.name[:-1]}ـ{base.name[-1]}", f"{base.name}  ",
+            ])
+            titles.append(Title(series_id, variant, base.type, rng.randint(0, 30)))
+            continue
+        words = ["".join(rng.choice(letters) for _ in range(rng.randint(3, 7))) for _ in range(rng.randint(1, 3))]
+        titles.append(Title(series_id, " ".join(words), rng.choice(["series", "movie"]), rng.randint(0, 30)))
+    return titles
+
+def main():
+    parser = argparse.ArgumentParser(description="كشف المحتويات المكررة ودمجها")
+    parser.add_argument("--db", help="رابط قاعدة البيانات (الافتراضي DATABASE_URL)")
+    parser.add_argument("--dry-run", action="store_true", help="عرض القرارات بدون كتابة")
+    parser.add_argument("--auto-score", type=float, default=AUTO_MERGE_SCORE, help="أقل درجة للدمج التلقائي")
+    parser.add_argument("--review-score", type=float, default=REVIEW_SCORE, help="أقل درجة للمراجعة")
+    parser.add_argument("--review", action="store_true", help="عرض الأزواج المنتظرة")
+    parser.add_argument("--approve", type=int, action="append", default=[], help="دمج زوج من قائمة المراجعة")
+    parser.add_argument("--reject", type=int, action="append", default=[], help="رفض زوج من قائمة المراجعة")
+    parser.add_argument("--synthesize", type=int, help="قياس الكشف على عدد من العناوين الاصطناعية")
+    args = parser.parse_args()
+
+    if args.synthesize:
+        started = time.perf_counter()
+        titles = synthesize_titles(args.synthesize)
+        prepared = time.perf_counter()
+        merges, reviews = find_duplicates(titles, args.auto_score, args.review_score)
+        finished = time.perf_counter()
+        print(f"📚 {len(titles)} عنوان: التجهيز {prepared - started:.2f} ث، الكشف {finished - prepared:.2f} ث")
+        print(f"🔗 دمج تلقائي: {len(merges)} | 👀 للمراجعة: {len(reviews)}")
+        return
+
+    engine = create_db_engine(args.db)
+    init_db(engine)
+
+    if args.review or args.approve or args.reject:
+        for candidate_id in args.approve:
+            review_candidate(engine, candidate_id, approve=True)
+        for candidate_id in args.reject:
+            review_candidate(engine, candidate_id, approve=False)
+        if args.review:
+            show_reviews(engine)
+        return
+
+    started = time.perf_counter()
+    titles = load_titles(engine)
+    merges, reviews = find_duplicates(titles, args.auto_score, args.review_score)
+    groups = merge_groups(merges)
+    print(f"📚 {len(titles)} عنوان، {len(groups)} دمج تلقائي، {len(reviews)} للمراجعة "
+          f"({time.perf_counter() - started:.2f} ث)")
+
+    if args.dry_run:
+        for keep, duplicate in groups:
+            print(f"🔗 '{duplicate.name}' (ID:{duplicate.id}) ⟵ سيدمج في '{keep.name}' (ID:{keep.id})")
+        for keep, duplicate, score in sorted(reviews, key=lambda r: -r[2]):
+            print(f"👀 [{score:.2f}] '{keep.name}' (ID:{keep.id}) ~ '{duplicate.name}' (ID:{duplicate.id})")
+        return
+
+    apply_merges(engine, groups)
+    merged_ids = {duplicate.id for _, duplicate in groups}
+    # أزواج المراجعة التي دُمج أحد طرفيها تلقائياً لم تعد صالحة
+    reviews = [r for r in reviews if r[0].id not in merged_ids and r[1].id not in merged_ids]
+    queued = queue_reviews(engine, reviews)
+    print(f"👀 تمت إضافة {queued} زوج لقائمة المراجعة (python dedupe.py --review)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+ذاكرة file_id لملفات الحلقات لإرسالها داخل البوت بدون تنزيل أي ملف.
+
+file_id في Bot API خاص بالبوت الذي استلمه، لذلك يُلتقط من البوت نفسه:
+    - عند نشر الحلقة في القناة (تحديث channel_post إذا كان البوت مشرفاً فيها)
+    - أو عند أول طلب "إرسال هنا" لحلقة قديمة (إعادة توجيه الرسالة مرة واحدة إلى
+      محادثة التخزين FILE_CACHE_CHAT_ID وقراءة file_id منها)
+
+الجدول مفهرس برقم رسالة القناة وليس بمعرف الحلقة، فلا يهم إن وصل الملف للبوت
+قبل أن يضيف الـ Worker الحلقة أو بعده.
+"""
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+from sqlalchemy import text
+
+UPSERT_FILE = """
+    INSERT INTO episode_files (telegram_message_id, file_id, file_unique_id, media_type, captured_at)
+    VALUES (:message_id, :file_id, :file_unique_id, :media_type, :captured_at)
+    ON CONFLICT (telegram_message_id) DO UPDATE SET
+        file_id = excluded.file_id,
+        file_unique_id = excluded.file_unique_id,
+        media_type = excluded.media_type,
+        captured_at = excluded.captured_at
+"""
+
+# قيمة تعني "لا يوجد ملف محفوظ" حتى لا نكرر الاستعلام لنفس الرسالة
+_NO_FILE = ()
+
+class EpisodeFileCache:
+    """ذاكرة محدودة الحجم أمام جدول episode_files: message_id -> (file_id, media_type)."""
+
+    def __init__(self, cache_size=10000):
+        self.known = OrderedDict()
+        self.cache_size = cache_size
+        # القراءة والكتابة تتم في خيوط asyncio.to_thread
+        self.lock = threading.Lock()
+
+    def _remember(self, message_id, entry):
+        with self.lock:
+            self.known[message_id] = entry
+            self.known.move_to_end(message_id)
+            while len(self.known) > self.cache_size:
+                self.known.popitem(last=False)
+
+    def get(self, engine, message_id):
+        """(file_id, media_type) لرسالة القناة، أو None."""
+        with self.lock:
+            entry = self.known.get(message_id)
+        if entry is None:
+            with engine.connect() as conn:
+                row = conn.execute(text("""
+                    SELECT file_id, media_type FROM episode_files WHERE telegram_message_id = :message_id
+                """), {"message_id": message_id}).fetchone()
+            entry = tuple(row) if row else _NO_FILE
+            self._remember(message_id, entry)
+        return entry or None
+
+    def save(self, engine, message_id, file_id, file_unique_id, media_type):
+        with engine.begin() as conn:
+            conn.execute(text(UPSERT_FILE), {
+                "message_id": message_id, "file_id": file_id, "file_unique_id": file_unique_id,
+                "media_type": media_type, "captured_at": datetime.utcnow(),
+            })
+        self._remember(message_id, (file_id, media_type))
+
+    def forget(self, engine, message_id):
+        """حذف file_id لم يعد صالحاً (يُعاد التقاطه عند الطلب التالي)."""
+        with engine.begin() as conn:
+            conn.execute(text("DELETE FROM episode_files WHERE telegram_message_id = :message_id"),
+                         {"message_id": message_id})
+        self._remember(message_id, _NO_FILE)
+
+def media_of(message):
+    """(media, media_type) لرسالة تليجرام تحتوي فيديو أو ملف، أو (None, None)."""
+    if message is None:
+        return None, None
+    if message.video:
+        return message.video, "video"
+    if message.document:
+        return message.document, "document"
+    return None, None
@@ -0,0 +1,325 @@
+"""
+اختبار حمل لمعالجات bot.py عبر Application الحقيقي وخادم Bot API وهمي محلي.
+
+يقوم السكربت بـ:
+    1. تهيئة قاعدة بيانات محلية ببيانات اصطناعية (مسلسلات، أفلام، ومسلسل طويل بمئات الحلقات).
+    2. تشغيل خادم HTTP محلي يحاكي Bot API (getMe، answerCallbackQuery، editMessageText ...).
+    3. توليد تحديثات Update/CallbackQuery متزامنة من مستخدمين افتراضيين.
+    4. طباعة الإنتاجية ونسب زمن الاستجابة لكل مسار.
+
+الاستخدام:
+    python loadtest.py --db sqlite:///loadtest.db --users 1,10,50 --requests 2000
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import random
+import sys
+import time
+
+from sqlalchemy import text
+
+FAKE_TOKEN = "123456:LOADTEST"
+
+# ==============================
+# 1. تهيئة قاعدة البيانات
+# ==============================
+def seed_database(database_url, series_count, movies_count, deep_episodes):
+    """إنشاء الجداول وتعبئتها ببيانات اصطناعية، وإرجاع المعرفات المستخدمة في السيناريوهات."""
+    import worker
+
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        engine = worker.init_database(database_url)
+
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM episodes"))
+        conn.execute(text("DELETE FROM series"))
+        conn.execute(
+            text("INSERT INTO series (name, type) VALUES (:name, :type)"),
+            [{"name": f"مسلسل {i}", "type": "series"} for i in range(series_count)]
+            + [{"name": f"فيلم {i}", "type": "movie"} for i in range(movies_count)]
+            + [{"name": "المسلسل الطويل", "type": "series"}],
+        )
+        rows = conn.execute(text("SELECT id, type, name FROM series ORDER BY id")).fetchall()
+        deep_id = next(r[0] for r in rows if r[2] == "المسلسل الطويل")
+
+        episodes = []
+        msg_id = 1
+        for series_id, content_type, name in rows:
+            if series_id == deep_id:
+                count = deep_episodes
+            else:
+                count = 1 if content_type == "movie" else 12
+            for n in range(count):
+                season = n // 50 + 1 if series_id == deep_id else 1
+                episodes.append({
+                    "sid": series_id, "season": season, "ep_num": n % 50 + 1 if series_id == deep_id else n + 1,
+                    "msg_id": msg_id, "channel": "@ShoofFilm",
+                })
+                msg_id += 1
+        conn.execute(text("""
+            INSERT INTO episodes (series_id, season, episode_number, telegram_message_id, telegram_channel_id)
+            VALUES (:sid, :season, :ep_num, :msg_id, :channel)
+        """), episodes)
+        series_ids = [r[0] for r in rows]
+        episode_columns = "id, series_id, season, episode_number, telegram_message_id"
+        deep_episodes = conn.execute(
+            text(f"SELECT {episode_columns} FROM episodes WHERE series_id = :sid"), {"sid": deep_id}
+        ).fetchall()
+        other_episodes = conn.execute(
+            text(f"SELECT {episode_columns} FROM episodes WHERE series_id <> :sid"), {"sid": deep_id}
+        ).fetchall()
+    # مفاتيح الفهرس الأبجدي وأعداد الحروف للمحتويات المضافة مباشرة
+    from database import backfill_sort_keys
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        backfill_sort_keys(engine)
+    return series_ids, deep_id, deep_episodes, other_episodes
+
+# ==============================
+# 2. خادم Bot API وهمي
+# ==============================
+class FakeBotAPI:
+    """خادم HTTP/1.1 بسيط يرد على طلبات Bot API بردود صالحة."""
+
+    def __init__(self):
+        self.calls = {}
+        self.server = None
+        self.port = None
+
+    def result_for(self, method):
+        if method == "getMe":
+            return {"id": 1, "is_bot": True, "first_name": "LoadTest", "username": "loadtest_bot"}
+        if method in ("sendMessage", "copyMessage", "sendVideo", "sendDocument"):
+            return {"message_id": 1, "date": int(time.time()), "chat": {"id": 1, "type": "private"}, "text": "ok"}
+        return True
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                content_length = 0
+                while True:
+                    header = await reader.readline()
+                    if header in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = header.decode("latin-1").partition(":")
+                    if name.strip().lower() == "content-length":
+                        content_length = int(value.strip())
+                if content_length:
+                    await reader.readexactly(content_length)
+
+                path = request_line.split()[1].decode()
+                method = path.rsplit("/", 1)[-1]
+                self.calls[method] = self.calls.get(method, 0) + 1
+                body = json.dumps({"ok": True, "result": self.result_for(method)}).encode()
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                    + f"Content-Length: {len(body)}\r\n\r\n".encode()
+                    + body
+                )
+                await writer.drain()
+        except (ConnectionResetError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, "127.0.0.1", 0)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self.port
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+# ==============================
+# 3. توليد التحديثات
+# ==============================
+def callback_update(update_id, user_id, data):
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id),
+            "from": {"id": user_id, "is_bot": False, "first_name": "user"},
+            "chat_instance": str(user_id),
+            "data": data,
+            "message": {
+                "message_id": 1, "date": 0, "text": "menu",
+                "chat": {"id": user_id, "type": "private"},
+            },
+        },
+    }
+
+def command_update(update_id, user_id, command):
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id, "date": 0, "text": command,
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "user"},
+            "entities": [{"type": "bot_command", "offset": 0, "length": len(command.split()[0])}],
+        },
+    }
+
+def make_scenario(rng, series_ids, deep_id, deep_episodes, other_episodes):
+    """اختيار مسار عشوائي بأوزان تقارب الاستخدام الحقيقي: (اسم المسار، callback_data أو أمر)."""
+    from callbacks import encode_episode
+
+    roll = rng.random()
+    if roll < 0.07:
+        return "home", "home", False
+    if roll < 0.10:
+        return "latest", "latest", False
+    if roll < 0.27:
+        return "catalog", rng.choice(["series_list", "movies_list", "all_content"]), False
+    if roll < 0.28:
+        return "letters", rng.choice(["ix_s", "ix_m"]), False
+    if roll < 0.30:
+        return "letter_page", f"ln_s_#_{rng.choice([0] + series_ids)}", False
+    if roll < 0.55:
+        return "details", f"content_{rng.choice(series_ids)}", False
+    if roll < 0.60:
+        return "deep_details", f"content_{deep_id}", False
+    if roll < 0.65:
+        season = rng.choice(sorted({ep[2] for ep in deep_episodes}))
+        return "deep_season", f"season_{deep_id}_{season}", False
+    if roll < 0.80:
+        return "episode", encode_episode(*rng.choice(other_episodes)[1:]), False
+    if roll < 0.92:
+        return "deep_episode", encode_episode(*rng.choice(deep_episodes)[1:]), False
+    if roll < 0.97:
+        # أزرار قديمة بصيغة ep_<id>
+        return "legacy_episode", f"ep_{rng.choice(other_episodes)[0]}", False
+    if roll < 0.98:
+        return "start_cmd", "/start", True
+    # روابط t.me/<bot>?start=... العميقة
+    if roll < 0.99:
+        return "start_series", f"/start s{rng.choice(series_ids)}", True
+    return "start_episode", f"/start e{rng.choice(other_episodes)[4]}", True
+
+# ==============================
+# 4. تشغيل الحمل والتقرير
+# ==============================
+def percentile(values, fraction):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+FAILED_UPDATES = set()
+
+async def record_error(update, context):
+    """تسجيل التحديثات التي فشلت معالجتها (PTB يلتقط الاستثناءات داخل process_update)."""
+    if update is not None:
+        FAILED_UPDATES.add(update.update_id)
+
+async def run_level(application, users, total_requests, scenario_args, seed):
+    """تشغيل عدد من المستخدمين المتزامنين يتقاسمون عدد الطلبات الكلي."""
+    from telegram import Update
+
+    rng = random.Random(seed)
+    latencies = {}
+    errors = {}
+    counter = iter(range(1, total_requests + 1))
+
+    async def virtual_user(user_id):
+        for update_id in counter:
+            route, payload, is_command = make_scenario(rng, *scenario_args)
+            data = command_update(update_id, user_id, payload) if is_command \
+                else callback_update(update_id, user_id, payload)
+            update = Update.de_json(data, application.bot)
+            started = time.perf_counter()
+            await application.process_update(update)
+            if update_id in FAILED_UPDATES:
+                errors[route] = errors.get(route, 0) + 1
+            latencies.setdefault(route, []).append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(virtual_user(1000 + u) for u in range(users)))
+    return latencies, errors, time.perf_counter() - started
+
+def print_level(users, latencies, errors, elapsed):
+    total = sum(len(v) for v in latencies.values())
+    print("=" * 72)
+    print(f"👥 مستخدمون متزامنون: {users} | طلبات: {total} | {elapsed:.2f} ث | {total / elapsed:.1f} طلب/ث")
+    print(f"{'route':<14}{'n':>7}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}{'err':>6}")
+    for route in sorted(latencies):
+        values = latencies[route]
+        print(
+            f"{route:<14}{len(values):>7}{len(values) / elapsed:>9.1f}"
+            f"{percentile(values, 0.50) * 1000:>10.2f}"
+            f"{percentile(values, 0.95) * 1000:>10.2f}"
+            f"{percentile(values, 0.99) * 1000:>10.2f}"
+            f"{max(values) * 1000:>10.2f}"
+            f"{errors.get(route, 0):>6}"
+        )
+
+async def run(args):
+    scenario_args = seed_database(args.db, args.series, args.movies, args.deep_episodes)
+
+    import bot
+    from telegram.ext import Application
+
+    fake_api = FakeBotAPI()
+    port = await fake_api.start()
+    max_users = max(args.users)
+    builder = (
+        Application.builder()
+        .token(FAKE_TOKEN)
+        .base_url(f"http://127.0.0.1:{port}/bot")
+        .base_file_url(f"http://127.0.0.1:{port}/file/bot")
+        .connection_pool_size(max_users + 8)
+    )
+    application = bot.build_application(builder)
+    application.add_error_handler(record_error)
+
+    await application.initialize()
+    # نفس خطافات الإقلاع والإيقاف التي يشغلها run_polling
+    await application.post_init(application)
+    try:
+        for level, users in enumerate(args.users):
+            FAILED_UPDATES.clear()
+            with open(os.devnull, "w") as devnull:
+                with contextlib.redirect_stdout(sys.stdout if args.verbose else devnull):
+                    latencies, errors, elapsed = await run_level(
+                        application, users, args.requests, scenario_args, args.seed + level
+                    )
+            print_level(users, latencies, errors, elapsed)
+    finally:
+        await application.post_shutdown(application)
+        await application.shutdown()
+        await fake_api.stop()
+
+    print("=" * 72)
+    print("📡 استدعاءات Bot API: " + ", ".join(f"{k}={v}" for k, v in sorted(fake_api.calls.items())))
+
+def main():
+    parser = argparse.ArgumentParser(description="اختبار حمل لمعالجات البوت")
+    parser.add_argument("--db", default="sqlite:///loadtest.db", help="رابط قاعدة البيانات المحلية")
+    parser.add_argument("--users", default="1,10,50", help="مستويات التزامن مفصولة بفواصل")
+    parser.add_argument("--requests", type=int, default=2000, help="عدد الطلبات لكل مستوى")
+    parser.add_argument("--series", type=int, default=300)
+    parser.add_argument("--movies", type=int, default=100)
+    parser.add_argument("--deep-episodes", type=int, default=600, help="عدد حلقات المسلسل الطويل")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--verbose", action="store_true", help="إظهار مخرجات البوت")
+    args = parser.parse_args()
+    args.users = [int(u) for u in args.users.split(",")]
+
+    # يجب ضبط البيئة قبل استيراد config.py (عبر worker أو bot)
+    os.environ["BOT_TOKEN"] = FAKE_TOKEN
+    os.environ["DATABASE_URL"] = args.db
+    # قاعدة البيانات تُنشأ من جديد في كل تشغيل، فلا نستخدم لقطة كتالوج من تشغيل سابق
+    os.environ["CATALOG_SNAPSHOT_PATH"] = ""
+    # الحمل المصطنع يتجاوز حدود المستخدم الواحد عمداً؛ نقيس مسار المعالجة نفسه
+    os.environ["RATE_LIMIT_ENABLED"] = "false"
+
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    asyncio.run(run(args))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+"""
+تشخيص الذاكرة للعمليات طويلة العمر (البوت والـ Worker)، للمشرفين فقط.
+
+- RSS عبر الزمن: عينة كل MEMORY_RSS_SECONDS في طابور محدود (قراءة /proc/self/statm، بلا تكلفة تذكر).
+- tracemalloc عند الطلب فقط: أول "snap" يبدأ التتبع ويأخذ لقطة أساس، وكل "snap" بعده يقارن
+  لقطة جديدة بالسابقة (أكبر مواقع الزيادة). التتبع يبطئ التخصيص ويستهلك ذاكرة طوال تشغيله،
+  فيُوقف بـ "stop".
+- عدد الكائنات: أنواع مهمة لكل عملية وأكثر الأنواع عدداً (gc.get_objects يمر على كل
+  الكائنات، فيُستدعى عند الطلب فقط).
+
+بدون طلبات تبقى التكلفة الوحيدة عينة RSS الدورية (وتُعطل بـ MEMORY_RSS_SECONDS=0).
+نسخة واحدة DIAGNOSTICS لكل عملية، فالوضع المدمج (combined.py) يشارك التتبع والعينات.
+"""
+import asyncio
+import gc
+import os
+import time
+import tracemalloc
+from collections import Counter, deque
+
+from config import Config
+
+ACTIONS = ("rss", "snap", "stop", "objects")
+
+# إطارات لا تفيد في مواقع التخصيص
+_IGNORED_FRAMES = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+def rss_bytes():
+    """الذاكرة المقيمة الحالية للعملية (Linux)، أو None إن تعذرت قراءتها."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+def format_bytes(size):
+    if size is None:
+        return "?"
+    sign = "-" if size < 0 else ""
+    size = abs(size)
+    for unit in ("B", "KiB", "MiB"):
+        if size < 1024:
+            return f"{sign}{size:.0f} {unit}" if unit == "B" else f"{sign}{size:.1f} {unit}"
+        size /= 1024
+    return f"{sign}{size:.2f} GiB"
+
+def format_age(seconds):
+    if seconds < 120:
+        return f"{seconds:.0f} ث"
+    if seconds < 7200:
+        return f"{seconds / 60:.0f} د"
+    if seconds < 172800:
+        return f"{seconds / 3600:.1f} س"
+    return f"{seconds / 86400:.1f} يوم"
+
+class MemoryDiagnostics:
+    """حالة التشخيص لعملية واحدة.
+
+    key_types: أسماء أنواع تُعد دائماً في "objects" (مثل InlineKeyboardMarkup أو User).
+    sizes: {الاسم: دالة ترجع عدد العناصر} لذاكرات العملية المؤقتة (تُعرض في "rss").
+    """
+
+    def __init__(self, frames=1, history=1440):
+        self.key_types = []
+        self.sizes = {}
+        self.frames = frames
+        self.samples = deque(maxlen=history)
+        self.started_at = time.time()
+        self.sampler = None
+        self.previous = None
+        self.previous_at = None
+
+    def watch_types(self, *names):
+        self.key_types += [name for name in names if name not in self.key_types]
+
+    def track_size(self, name, read):
+        self.sizes[name] = read
+
+    # ------------------------------
+    # RSS عبر الزمن
+    # ------------------------------
+    def sample(self):
+        rss = rss_bytes()
+        if rss is not None:
+            self.samples.append((time.time(), rss))
+        return rss
+
+    async def sample_forever(self, interval):
+        """مهمة خلفية: عينة RSS كل interval ثانية."""
+        while True:
+            self.sample()
+            await asyncio.sleep(interval)
+
+    def start_sampling(self, interval):
+        """تشغيل مهمة العينات مرة واحدة؛ ترجع المهمة لمن شغلها (ليلغيها)، أو None."""
+        if not interval or (self.sampler is not None and not self.sampler.done()):
+            return None
+        self.sampler = asyncio.create_task(self.sample_forever(interval))
+        return self.sampler
+
+    def rss_report(self, points=8):
+        now = time.time()
+        current = self.sample()
+        lines = [f"🧠 RSS الآن: {format_bytes(current)} (عمر العملية {format_age(now - self.started_at)})"]
+        if len(self.samples) > 1:
+            first_at, first = self.samples[0]
+            peak = max(rss for _, rss in self.samples)
+            lines.append(
+                f"منذ {format_age(now - first_at)}: {format_bytes(current - first)}، الأعلى {format_bytes(peak)}"
+            )
+            step = max(1, len(self.samples) // points)
+            history = list(self.samples)[::-1][::step][:points]
+            lines += [f"  قبل {format_age(now - at)}: {format_bytes(rss)}" for at, rss in history[1:]]
+        for name, read in self.sizes.items():
+            try:
+                lines.append(f"• {name}: {read()}")
+            except Exception as e:
+                lines.append(f"• {name}: ? ({type(e).__name__})")
+        if tracemalloc.is_tracing():
+            lines.append(self._tracing_line())
+        return "\n".join(lines)
+
+    # ------------------------------
+    # tracemalloc
+    # ------------------------------
+    def _tracing_line(self):
+        current, peak = tracemalloc.get_traced_memory()
+        return (
+            f"🔬 tracemalloc يعمل: متتبع {format_bytes(current)} (الأعلى {format_bytes(peak)})، "
+            f"تكلفته {format_bytes(tracemalloc.get_tracemalloc_memory())}"
+        )
+
+    def snap(self, limit=10):
+        """بدء التتبع بلقطة أساس، أو مقارنة لقطة جديدة بالسابقة."""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+            self.previous = tracemalloc.take_snapshot().filter_traces(_IGNORED_FRAMES)
+            self.previous_at = time.time()
+            return "🔬 بدأ تتبع التخصيصات (tracemalloc). أعد الأمر لاحقاً لرؤية أكبر الزيادات، و stop لإيقافه."
+        snapshot = tracemalloc.take_snapshot().filter_traces(_IGNORED_FRAMES)
+        stats = snapshot.compare_to(self.previous, "lineno")
+        elapsed = time.time() - self.previous_at
+        self.previous, self.previous_at = snapshot, time.time()
+        growth = sum(stat.size_diff for stat in stats)
+        lines = [f"🔬 الفرق خلال {format_age(elapsed)}: {format_bytes(growth)}", self._tracing_line()]
+        for stat in sorted(stats, key=lambda stat: stat.size_diff, reverse=True)[:limit]:
+            if stat.size_diff <= 0:
+                break
+            frame = stat.traceback[0]
+            lines.append(
+                f"{format_bytes(stat.size_diff):>11} ({stat.count_diff:+d} كتلة) "
+                f"{_short_path(frame.filename)}:{frame.lineno}"
+            )
+        return "\n".join(lines)
+
+    def stop(self):
+        if not tracemalloc.is_tracing():
+            return "ℹ️ tracemalloc لا يعمل."
+        tracemalloc.stop()
+        self.previous = self.previous_at = None
+        return "🛑 أُوقف تتبع التخصيصات وحُررت لقطاته."
+
+    # ------------------------------
+    # عدد الكائنات
+    # ------------------------------
+    def objects(self, limit=12):
+        counts = Counter(type(obj).__name__ for obj in gc.get_objects())
+        lines = [f"📦 كائنات يتتبعها gc: {sum(counts.values())}"]
+        if self.key_types:
+            lines.append("الأنواع المراقبة: " + "، ".join(f"{name}={counts.get(name, 0)}" for name in self.key_types))
+        lines += [f"{count:>9} {name}" for name, count in counts.most_common(limit)]
+        return "\n".join(lines)
+
+    def report(self, action="rss", limit=10):
+        """نص التقرير لأحد ACTIONS."""
+        if action == "snap":
+            return self.snap(limit)
+        if action == "stop":
+            return self.stop()
+        if action == "objects":
+            return self.objects(limit)
+        return self.rss_report()
+
+DIAGNOSTICS = MemoryDiagnostics(frames=Config.MEMORY_TRACE_FRAMES)
+
+def _short_path(filename):
+    """آخر جزأين من المسار (site-packages/telethon/... يصبح telethon/client.py)."""
+    parts = filename.replace("\\", "/").split("/")
+    return "/".join(parts[-2:])
@@ -0,0 +1,122 @@
+"""
+ترتيب المحتويات حسب الشعبية بعدادات تقريبية محدودة الذاكرة.
+
+كل ضغطة على محتوى أو حلقة تُعد في الذاكرة فقط: Count-Min Sketch يقدّر عدد ضغطات
+أي مسلسل بحجم ثابت مهما كبر الكتالوج، وقائمة Top-K تحتفظ بالأكثر شعبية للعرض.
+العدادات تتناقص مع الوقت (نصف عمر) حتى يظهر الرائج حالياً وليس الأقدم، وتُحفظ
+قائمة Top-K في جدول series_popularity دورياً وعند الإيقاف لتُحمّل عند الإقلاع.
+"""
+import threading
+from array import array
+from datetime import datetime
+
+from sqlalchemy import text
+
+# عدد أولي كبير لدوال التجزئة (key * a + b) mod p لكل صف في الـ Sketch
+_HASH_PRIME = (1 << 61) - 1
+_HASH_SEEDS = (
+    (0x5bd1e995, 0x1b873593), (0x85ebca6b, 0xc2b2ae35), (0x27d4eb2f, 0x165667b1),
+    (0x9e3779b1, 0x7f4a7c15), (0x94d049bb, 0x2545f491), (0x61c88647, 0x4cf5ad43),
+    (0x3c6ef372, 0x7feb352d), (0x846ca68b, 0x68e31da4),
+)
+
+class CountMinSketch:
+    """تقدير تكرار المفاتيح (أعداد صحيحة) بذاكرة ثابتة = width * depth عداد."""
+
+    def __init__(self, width=2048, depth=4):
+        if not 1 <= depth <= len(_HASH_SEEDS):
+            raise ValueError(f"depth يجب أن يكون بين 1 و {len(_HASH_SEEDS)}")
+        self.width = width
+        self.depth = depth
+        self.rows = [array("d", bytes(8 * width)) for _ in range(depth)]
+
+    def _slots(self, key):
+        for row, (a, b) in zip(self.rows, _HASH_SEEDS):
+            yield row, ((key * a + b) % _HASH_PRIME) % self.width
+
+    def add(self, key, amount=1.0):
+        """زيادة عداد المفتاح وإرجاع التقدير الجديد."""
+        estimate = None
+        for row, slot in self._slots(key):
+            row[slot] += amount
+            if estimate is None or row[slot] < estimate:
+                estimate = row[slot]
+        return estimate
+
+    def estimate(self, key):
+        return min(row[slot] for row, slot in self._slots(key))
+
+    def decay(self, factor):
+        for row in self.rows:
+            for slot in range(self.width):
+                row[slot] *= factor
+
+class PopularityTracker:
+    """Count-Min Sketch مع قائمة Top-K للأكثر شعبية (heavy hitters)."""
+
+    def __init__(self, top_k=100, width=2048, depth=4):
+        self.top_k = top_k
+        self.sketch = CountMinSketch(width, depth)
+        self.top = {}
+        # الحفظ يتم في خيط منفصل (asyncio.to_thread) بينما العد في حلقة الأحداث
+        self.lock = threading.Lock()
+
+    def _offer(self, series_id, estimate):
+        if series_id in self.top or len(self.top) < self.top_k:
+            self.top[series_id] = estimate
+            return
+        weakest = min(self.top, key=self.top.get)
+        if estimate > self.top[weakest]:
+            del self.top[weakest]
+            self.top[series_id] = estimate
+
+    def hit(self, series_id, weight=1.0):
+        """تسجيل ضغطة على محتوى (في الذاكرة فقط)."""
+        with self.lock:
+            self._offer(series_id, self.sketch.add(series_id, weight))
+
+    def score(self, series_id):
+        with self.lock:
+            return self.sketch.estimate(series_id)
+
+    def ranked(self, limit=None):
+        """الأكثر شعبية: [(series_id, score)] مرتبة تنازلياً."""
+        with self.lock:
+            items = sorted(self.top.items(), key=lambda item: (-item[1], item[0]))
+        return items[:limit] if limit else items
+
+    def decay(self, factor):
+        """تخفيض كل العدادات (يُستدعى دورياً حسب نصف العمر)."""
+        with self.lock:
+            self.sketch.decay(factor)
+            for series_id in self.top:
+                self.top[series_id] *= factor
+
+    def load(self, rows):
+        """تحميل لقطة محفوظة: [(series_id, score)]."""
+        for series_id, score in rows:
+            if score > 0:
+                self.hit(series_id, score)
+
+def decay_factor(elapsed_seconds, half_life_seconds):
+    """معامل التناقص لمدة معينة: يصبح العداد نصفه بعد half_life_seconds."""
+    if half_life_seconds <= 0:
+        return 1.0
+    return 0.5 ** (elapsed_seconds / half_life_seconds)
+
+def save_snapshot(engine, rows):
+    """استبدال لقطة الشعبية المحفوظة بقائمة Top-K الحالية في معاملة واحدة."""
+    now = datetime.utcnow()
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM series_popularity"))
+        if rows:
+            conn.execute(text("""
+                INSERT INTO series_popularity (series_id, score, updated_at)
+                VALUES (:series_id, :score, :updated_at)
+            """), [{"series_id": series_id, "score": score, "updated_at": now} for series_id, score in rows])
+    return len(rows)
+
+def load_snapshot(engine):
+    """آخر لقطة محفوظة: [(series_id, score)]."""
+    with engine.connect() as conn:
+        return [tuple(r) for r in conn.execute(text("SELECT series_id, score FROM series_popularity")).fetchall()]
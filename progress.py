@@ -0,0 +1,93 @@
+"""
+تتبع آخر حلقة فتحها كل مستخدم في كل مسلسل، مع كتابة مؤجلة (write-behind).
+
+التسجيل عند فتح الحلقة يتم في الذاكرة فقط، وتُدمج الكتابات بحيث يبقى آخر موضع
+لكل (مستخدم، مسلسل)، ثم تُكتب إلى قاعدة البيانات دفعة واحدة كل فترة وعند الإيقاف.
+"""
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+from sqlalchemy import text
+
+UPSERT_PROGRESS = """
+    INSERT INTO watch_progress (user_id, series_id, season, episode_number,
+                                telegram_message_id, updated_at)
+    VALUES (:user_id, :series_id, :season, :episode_number, :message_id, :updated_at)
+    ON CONFLICT (user_id, series_id) DO UPDATE SET
+        season = excluded.season,
+        episode_number = excluded.episode_number,
+        telegram_message_id = excluded.telegram_message_id,
+        updated_at = excluded.updated_at
+"""
+
+# قيمة تعني "لا يوجد تقدم محفوظ" حتى لا نكرر الاستعلام لنفس المستخدم والمسلسل
+_NO_PROGRESS = ()
+
+class ProgressBuffer:
+    """ذاكرة الكتابات المعلقة مع ذاكرة قراءة محدودة الحجم للمواضع المعروفة."""
+
+    def __init__(self, cache_size=10000):
+        self.pending = {}
+        self.known = OrderedDict()
+        self.cache_size = cache_size
+        # الدفع يتم في خيط منفصل (asyncio.to_thread) بينما التسجيل في حلقة الأحداث
+        self.lock = threading.Lock()
+
+    def _remember(self, key, position):
+        self.known[key] = position
+        self.known.move_to_end(key)
+        while len(self.known) > self.cache_size:
+            self.known.popitem(last=False)
+
+    def record(self, user_id, series_id, season, episode_number, message_id):
+        """تسجيل آخر حلقة مفتوحة (في الذاكرة فقط، بدون أي استعلام)."""
+        position = (season, episode_number, message_id, datetime.utcnow())
+        with self.lock:
+            self.pending[(user_id, series_id)] = position
+            self._remember((user_id, series_id), position)
+
+    def get(self, user_id, series_id, engine=None):
+        """آخر موضع: (season, episode_number, message_id) أو None."""
+        key = (user_id, series_id)
+        with self.lock:
+            position = self.pending.get(key) or self.known.get(key)
+        if position is None and engine is not None:
+            with engine.connect() as conn:
+                row = conn.execute(text("""
+                    SELECT season, episode_number, telegram_message_id, updated_at
+                    FROM watch_progress
+                    WHERE user_id = :user_id AND series_id = :series_id
+                """), {"user_id": user_id, "series_id": series_id}).fetchone()
+            position = tuple(row) if row else _NO_PROGRESS
+            with self.lock:
+                # قد يكون المستخدم فتح حلقة أثناء الاستعلام
+                if key not in self.pending:
+                    self._remember(key, position)
+        if not position:
+            return None
+        return position[:3]
+
+    def flush(self, engine):
+        """كتابة الكتابات المعلقة دفعة واحدة، وإرجاع عدد الصفوف المكتوبة."""
+        with self.lock:
+            batch, self.pending = self.pending, {}
+        if not batch:
+            return 0
+        rows = [
+            {
+                "user_id": user_id, "series_id": series_id, "season": season,
+                "episode_number": episode_number, "message_id": message_id, "updated_at": updated_at,
+            }
+            for (user_id, series_id), (season, episode_number, message_id, updated_at) in batch.items()
+        ]
+        try:
+            with engine.begin() as conn:
+                conn.execute(text(UPSERT_PROGRESS), rows)
+        except Exception:
+            # إعادة الدفعة للمحاولة لاحقاً دون الكتابة فوق مواضع أحدث
+            with self.lock:
+                for key, position in batch.items():
+                    self.pending.setdefault(key, position)
+            raise
+        return len(rows)
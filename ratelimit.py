@@ -0,0 +1,64 @@
+"""
+تحديد معدل الطلبات الواردة لكل مستخدم قبل وصولها إلى المعالجات.
+
+لكل (مستخدم، فئة أوامر) دلو رموز (token bucket): سعة تسمح بدفعة قصيرة، وإعادة
+تعبئة بمعدل ثابت في الدقيقة. الفئات مستقلة، فاستهلاك أوامر الإحصائيات المكلفة
+لا يمنع التصفح العادي.
+
+الحالة في الذاكرة فقط وبحجم محدود: أقدم المستخدمين استخداماً يُحذفون أولاً (LRU)،
+والمستخدم المحذوف يعود بدلو ممتلئ وهذا آمن.
+"""
+import time
+from collections import OrderedDict
+
+class RateLimiter:
+    """دلاء رموز لكل (مستخدم، فئة) مع حد أقصى لعدد الدلاء في الذاكرة."""
+
+    def __init__(self, limits, max_entries=50000):
+        # {الفئة: (السعة، عدد الرموز المضافة في الدقيقة)}
+        self.limits = dict(limits)
+        self.max_entries = max_entries
+        # (user_id, الفئة) -> [الرموز، وقت آخر تحديث، هل أُبلغ المستخدم بالتجاوز]
+        self.buckets = OrderedDict()
+        self.rejected = 0
+
+    def _bucket(self, key, now):
+        capacity, per_minute = self.limits[key[1]]
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = [float(capacity), now, False]
+            if len(self.buckets) > self.max_entries:
+                self.buckets.popitem(last=False)
+        else:
+            self.buckets.move_to_end(key)
+            bucket[0] = min(capacity, bucket[0] + (now - bucket[1]) * per_minute / 60)
+            bucket[1] = now
+        return bucket
+
+    def allow(self, user_id, category, now=None):
+        """استهلاك رمز إن وُجد. الفئة غير المعرفة في limits غير محدودة."""
+        if category not in self.limits:
+            return True
+        bucket = self._bucket((user_id, category), time.monotonic() if now is None else now)
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            bucket[2] = False
+            return True
+        self.rejected += 1
+        return False
+
+    def first_rejection(self, user_id, category):
+        """True مرة واحدة لكل فترة تجاوز، حتى لا يُرد على كل طلب مرفوض برسالة."""
+        bucket = self.buckets.get((user_id, category))
+        if bucket is None or bucket[2]:
+            return False
+        bucket[2] = True
+        return True
+
+    def retry_after(self, user_id, category):
+        """الثواني حتى يتوفر رمز واحد."""
+        bucket = self.buckets.get((user_id, category))
+        if bucket is None:
+            return 0
+        _, per_minute = self.limits[category]
+        return max(0, (1 - bucket[0]) * 60 / per_minute)
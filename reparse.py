@@ -0,0 +1,115 @@
+"""
+إعادة تحليل الرسائل المحفوظة في raw_messages بعد تعديل قواعد parse_content_info.
+
+لا يتصل بتليجرام: يقرأ آخر نسخة من كل رسالة على دفعات مرتبة برقم الرسالة،
+ويحللها بالإصدار الحالي (worker.PARSER_VERSION)، ولا يغير إلا الحلقات التي
+اختلفت نتيجتها. كل دفعة في معاملة واحدة مع زيادة إصدار الكتالوج عند التغيير.
+raw_messages لا يُعدّل: النتيجة الجديدة تُضاف كصف 'reparse' بنفس النص، فيصبح آخر نسخة للرسالة.
+
+الاستخدام:
+    python reparse.py --dry-run          # عرض الفروقات فقط
+    python reparse.py --chunk 2000       # تطبيق الفروقات
+    python reparse.py --all              # إعادة تحليل كل الرسائل وليس الأقدم إصداراً فقط
+"""
+import argparse
+import contextlib
+import os
+import sys
+import time
+
+from sqlalchemy import bindparam, text
+
+import worker
+from database import create_db_engine
+
+LATEST_RAW_MESSAGES = """
+    SELECT r.id, r.telegram_message_id, r.text, r.event, r.parser_version, r.parse_status, r.message_date
+    FROM raw_messages r
+    WHERE r.id IN (
+        SELECT MAX(id) FROM raw_messages
+        WHERE telegram_message_id > :after_id
+        GROUP BY telegram_message_id
+        ORDER BY telegram_message_id
+        LIMIT :chunk
+    )
+    ORDER BY r.telegram_message_id
+"""
+
+CURRENT_EPISODES = """
+    SELECT e.telegram_message_id, s.id, s.name, s.type, e.season, e.episode_number
+    FROM episodes e
+    JOIN series s ON s.id = e.series_id
+    WHERE e.telegram_message_id IN :msg_ids
+"""
+
+def parse_quietly(message_text, verbose):
+    """parse_content_info يطبع تحذيراً لكل رسالة غير معروفة، وهذا مزعج في التحليل الجماعي."""
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(sys.stdout if verbose else devnull):
+        parsed = worker.parse_content_info(message_text)
+    return parsed if worker.parse_status_of(parsed) == "parsed" else None
+
+def reparse_chunk(conn, rows, dry_run, verbose):
+    """تطبيق نتائج التحليل الجديد على دفعة، وإرجاع عدد الحلقات التي تغيرت."""
+    msg_ids = [row[1] for row in rows]
+    current = {
+        row[0]: tuple(row[1:])
+        for row in conn.execute(
+            text(CURRENT_EPISODES).bindparams(bindparam("msg_ids", expanding=True)), {"msg_ids": msg_ids}
+        )
+    }
+    changed = 0
+    for _, msg_id, message_text, event, parser_version, parse_status, message_date in rows:
+        parsed = parse_quietly(message_text, verbose)
+        old = current.get(msg_id)
+        if not worker.same_episode(conn, parsed, old):
+            changed += 1
+            print(f"🔁 {msg_id}: {old[1:] if old else None} -> {parsed}")
+            if not dry_run:
+                # تحديث في المكان مثل الرسائل المعدلة: الحلقة تحتفظ بمعرفها
+                worker.replace_episode(conn, parsed, msg_id, old)
+        status = "parsed" if parsed else "unparsed"
+        if not dry_run and (parser_version < worker.PARSER_VERSION or status != parse_status):
+            worker.archive_raw_message(conn, msg_id, message_text, "reparse", status, message_date)
+    return changed
+
+def reparse(engine, chunk, reparse_all=False, dry_run=False, verbose=False):
+    """المرور على كل الرسائل المحفوظة على دفعات، وإرجاع (عدد المفحوصة، عدد المتغيرة)."""
+    after_id = 0
+    scanned = changed = 0
+    while True:
+        with engine.connect() as conn:
+            rows = conn.execute(text(LATEST_RAW_MESSAGES), {"after_id": after_id, "chunk": chunk}).fetchall()
+        if not rows:
+            break
+        after_id = rows[-1][1]
+        # الرسائل المحذوفة تبقى محذوفة، والمحللة بالإصدار الحالي لا تحتاج إعادة
+        pending = [
+            row for row in rows
+            if row[3] != "delete" and (reparse_all or row[4] < worker.PARSER_VERSION)
+        ]
+        if pending:
+            with engine.begin() as conn:
+                changed += reparse_chunk(conn, pending, dry_run, verbose)
+        scanned += len(pending)
+    return scanned, changed
+
+def main():
+    parser = argparse.ArgumentParser(description="إعادة تحليل الرسائل المحفوظة بدون تليجرام")
+    parser.add_argument("--db", help="رابط قاعدة البيانات (الافتراضي DATABASE_URL)")
+    parser.add_argument("--chunk", type=int, default=1000, help="عدد الرسائل في كل دفعة")
+    parser.add_argument("--all", action="store_true", help="إعادة تحليل كل الرسائل")
+    parser.add_argument("--dry-run", action="store_true", help="عرض الفروقات بدون كتابة")
+    parser.add_argument("--verbose", action="store_true", help="إظهار تحذيرات المحلل")
+    args = parser.parse_args()
+
+    worker.engine = create_db_engine(args.db)
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        worker.create_tables()
+
+    started = time.perf_counter()
+    scanned, changed = reparse(worker.engine, args.chunk, args.all, args.dry_run, args.verbose)
+    print(f"✅ إصدار المحلل {worker.PARSER_VERSION}: فحص {scanned} رسالة، "
+          f"{'ستتغير' if args.dry_run else 'تغيرت'} {changed} ({time.perf_counter() - started:.2f} ث)")
+
+if __name__ == "__main__":
+    main()
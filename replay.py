@@ -0,0 +1,349 @@
+"""
+إعادة تشغيل تدفق رسائل مسجل عبر مسار التحليل والحفظ في worker.py بدون اتصال بالشبكة.
+
+صيغة ملف JSONL (سطر لكل حدث، بالترتيب):
+    {"id": 10, "date": "2024-01-01T12:00:00", "text": "المحافظ الحلقة 1"}
+    {"op": "edit", "id": 10, "date": "2024-01-01T12:05:00", "text": "المحافظ الحلقة 2"}
+    {"op": "delete", "ids": [10, 11]}
+
+الاستخدام:
+    python replay.py stream.jsonl --db sqlite:///replay.db
+    python replay.py --synthesize 20000 --out stream.jsonl
+    python replay.py stream.jsonl --history   # عبر import_channel_history بدلاً من الأحداث الحية
+    python replay.py --synthesize 20000 --export --flood-rate 0.05   # التصدير المتوازي مع FloodWait مصطنع
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from sqlalchemy import text
+from telethon import events
+from telethon.errors import FloodWaitError
+
+import worker
+
+# ==============================
+# 1. تحميل التدفق المسجل وتوليده
+# ==============================
+def load_stream(path):
+    """قراءة أحداث JSONL مع تحويل التاريخ إلى datetime."""
+    records = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            record.setdefault("op", "new")
+            if record.get("date"):
+                record["date"] = datetime.fromisoformat(record["date"])
+            records.append(record)
+    return records
+
+def synthesize_stream(count, seed=0):
+    """توليد تدفق اصطناعي يشبه منشورات القناة (مسلسلات، أفلام، تعديلات، حذف)."""
+    rng = random.Random(seed)
+    names = [f"مسلسل تجريبي {i}" for i in range(max(1, count // 40))]
+    films = [f"فيلم تجريبي {i}" for i in range(max(1, count // 200))]
+    next_episode = {}
+    date = datetime(2024, 1, 1)
+    records = []
+    for msg_id in range(1, count + 1):
+        date += timedelta(seconds=rng.randint(5, 600))
+        roll = rng.random()
+        if roll < 0.80:
+            name = rng.choice(names)
+            season, episode = next_episode.get(name, (1, 0))
+            episode += 1
+            if episode > 30:
+                season, episode = season + 1, 1
+            next_episode[name] = (season, episode)
+            caption = f"{name} الموسم {season} الحلقة {episode}"
+        elif roll < 0.92:
+            caption = f"{rng.choice(films)}-{rng.randint(1, 3)}"
+        else:
+            caption = "إعلان: تابعونا على القناة"
+        records.append({"op": "new", "id": msg_id, "date": date.isoformat(), "text": caption})
+
+        # تعديلات وحذف متفرقة على رسائل سابقة
+        if msg_id > 10 and rng.random() < 0.02:
+            target = rng.randint(1, msg_id - 1)
+            records.append({"op": "edit", "id": target, "date": date.isoformat(),
+                            "text": f"{rng.choice(names)} الحلقة {rng.randint(1, 30)}"})
+        if msg_id > 10 and rng.random() < 0.01:
+            records.append({"op": "delete", "ids": [rng.randint(1, msg_id - 1)]})
+    return records
+
+# ==============================
+# 2. عميل Telethon وهمي
+# ==============================
+def make_message(record):
+    return SimpleNamespace(
+        id=record["id"],
+        date=record.get("date"),
+        text=record.get("text") or "",
+        message=record.get("text") or "",
+        media=None,
+    )
+
+class FakeClient:
+    """عميل يحاكي واجهة TelegramClient التي يستخدمها worker.py.
+
+    للتصدير المتوازي يمكن حقن FloodWait وأخطاء عشوائية وزمن استجابة لكل طلب iter_messages.
+    """
+
+    def __init__(self, records, history_records=(), channel_title="replay",
+                 flood_rate=0.0, flood_seconds=1, error_rate=0.0, latency=0.0, seed=0):
+        self.records = records
+        self.history_records = history_records
+        self.channel = SimpleNamespace(id=-1000, title=channel_title, username="replay")
+        self.handlers = {}
+        self.timings = {}
+        self.processed = 0
+        self.flood_sleep_threshold = 60
+        self.flood_rate = flood_rate
+        self.flood_seconds = flood_seconds
+        self.error_rate = error_rate
+        self.latency = latency
+        self.rng = random.Random(seed)
+        self.in_flight = 0
+        self.stats = {"requests": 0, "floods": 0, "errors": 0, "peak_in_flight": 0, "takeout": False}
+
+    async def start(self):
+        return self
+
+    async def get_entity(self, username):
+        return self.channel
+
+    async def disconnect(self):
+        pass
+
+    def on(self, event_builder):
+        def decorator(func):
+            self.handlers[type(event_builder)] = func
+            return func
+        return decorator
+
+    @contextlib.asynccontextmanager
+    async def takeout(self, finalize=True, **kwargs):
+        self.stats["takeout"] = True
+        yield self
+
+    async def iter_messages(self, entity, limit=None, reverse=False, min_id=0, max_id=0, **kwargs):
+        """إرجاع الرسائل الجديدة بنفس ترتيب Telethon (الأحدث أولاً افتراضياً، min_id و max_id غير شاملين)."""
+        self.stats["requests"] += 1
+        self.in_flight += 1
+        self.stats["peak_in_flight"] = max(self.stats["peak_in_flight"], self.in_flight)
+        try:
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            roll = self.rng.random()
+            if roll < self.flood_rate:
+                self.stats["floods"] += 1
+                raise FloodWaitError(request=None, capture=self.flood_seconds)
+            if roll < self.flood_rate + self.error_rate:
+                self.stats["errors"] += 1
+                raise ConnectionError("خطأ شبكة مصطنع")
+        finally:
+            self.in_flight -= 1
+        messages = [
+            make_message(r) for r in self.history_records
+            if r["op"] == "new" and r["id"] > min_id and (not max_id or r["id"] < max_id)
+        ]
+        if not reverse:
+            messages.reverse()
+        if limit is not None:
+            messages = messages[:limit]
+        for message in messages:
+            yield message
+
+    async def run_until_disconnected(self):
+        """تمرير الأحداث المسجلة إلى المعالجات المسجلة بالترتيب."""
+        for record in self.records:
+            op = record["op"]
+            if op == "new":
+                handler = self.handlers.get(events.NewMessage)
+                event = SimpleNamespace(message=make_message(record))
+            elif op == "edit":
+                handler = self.handlers.get(events.MessageEdited)
+                event = SimpleNamespace(message=make_message(record))
+            elif op == "delete":
+                handler = self.handlers.get(events.MessageDeleted)
+                event = SimpleNamespace(deleted_ids=record.get("ids") or [record["id"]])
+            else:
+                continue
+            if handler is None:
+                continue
+
+            started = time.perf_counter()
+            await handler(event)
+            self.timings.setdefault(f"event:{op}", []).append(time.perf_counter() - started)
+            self.processed += 1
+
+# ==============================
+# 3. القياس والتقرير
+# ==============================
+def timed(timings, stage, func):
+    """تغليف دالة من worker لقياس زمن كل مرحلة."""
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            timings.setdefault(stage, []).append(time.perf_counter() - started)
+    return wrapper
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+def table_state():
+    """الحالة النهائية للجداول بعد إعادة التشغيل."""
+    with worker.engine.connect() as conn:
+        by_type = conn.execute(text("SELECT type, COUNT(*) FROM series GROUP BY type")).fetchall()
+        episodes = conn.execute(text("SELECT COUNT(*) FROM episodes")).scalar()
+        top = conn.execute(text("""
+            SELECT s.name, s.type, COUNT(e.id) AS ep_count
+            FROM series s
+            LEFT JOIN episodes e ON s.id = e.series_id
+            GROUP BY s.id, s.name, s.type
+            ORDER BY ep_count DESC
+            LIMIT 5
+        """)).fetchall()
+    return by_type, episodes, top
+
+def print_report(records, elapsed, timings):
+    print("=" * 50)
+    print(f"📊 الأحداث: {len(records)} خلال {elapsed:.2f} ث")
+    print(f"⚡ الإنتاجية: {len(records) / elapsed:.1f} رسالة/ث" if elapsed else "⚡ الإنتاجية: -")
+    print("-" * 50)
+    print(f"{'المرحلة':<16}{'العدد':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for stage in sorted(timings):
+        values = timings[stage]
+        print(
+            f"{stage:<16}{len(values):>8}"
+            f"{percentile(values, 0.50) * 1000:>10.3f}"
+            f"{percentile(values, 0.95) * 1000:>10.3f}"
+            f"{percentile(values, 0.99) * 1000:>10.3f}"
+            f"{max(values) * 1000:>10.3f}"
+        )
+    print("-" * 50)
+    by_type, episodes, top = table_state()
+    for content_type, count in by_type:
+        print(f"• series[{content_type}]: {count}")
+    print(f"• episodes: {episodes}")
+    for name, content_type, ep_count in top:
+        print(f"   - {name} ({content_type}): {ep_count}")
+    print("=" * 50)
+
+# ==============================
+# 4. نقطة الدخول
+# ==============================
+async def replay(records, history=False):
+    """تشغيل monitor_channel الحقيقية فوق العميل الوهمي."""
+    if history:
+        # في وضع الاستيراد تمر الرسائل الجديدة عبر iter_messages والتعديلات والحذف كأحداث حية
+        client = FakeClient([r for r in records if r["op"] != "new"], history_records=records)
+    else:
+        client = FakeClient(records)
+    worker.IMPORT_HISTORY = history
+    await worker.monitor_channel(client=client)
+    return client
+
+async def replay_export(records, args):
+    """تشغيل export_channel_history فوق العميل الوهمي والتحقق من الترتيب والاكتمال."""
+    client = FakeClient(
+        [], history_records=records, flood_rate=args.flood_rate, flood_seconds=args.flood_seconds,
+        error_rate=args.error_rate, latency=args.latency, seed=args.seed,
+    )
+    fed_ids = []
+
+    def on_message(message):
+        fed_ids.append(message.id)
+        worker.process_message(message)
+
+    await worker.export_channel_history(
+        client, client.channel, on_message, concurrency=args.concurrency, range_size=args.range_size
+    )
+    return client, fed_ids
+
+def check_export(records, client, fed_ids, elapsed):
+    expected = sorted(r["id"] for r in records if r["op"] == "new")
+    in_order = fed_ids == sorted(fed_ids)
+    complete = fed_ids == expected
+    stats = client.stats
+    print("=" * 50)
+    print(f"📦 تصدير {len(fed_ids)} رسالة في {elapsed:.2f} ث")
+    print(f"   - طلبات: {stats['requests']} | FloodWait مصطنع: {stats['floods']} | أخطاء مصطنعة: {stats['errors']}")
+    print(f"   - أقصى تزامن فعلي: {stats['peak_in_flight']} | takeout: {'نعم' if stats['takeout'] else 'لا'}")
+    print(f"   - بالترتيب: {'✅' if in_order else '❌'} | مكتمل بدون تكرار: {'✅' if complete else '❌'}")
+    print("=" * 50)
+    return in_order and complete
+
+def main():
+    parser = argparse.ArgumentParser(description="إعادة تشغيل تدفق القناة عبر worker.py")
+    parser.add_argument("stream", nargs="?", help="ملف JSONL للأحداث المسجلة")
+    parser.add_argument("--db", default="sqlite:///replay.db", help="رابط قاعدة البيانات المحلية")
+    parser.add_argument("--history", action="store_true", help="تمرير الرسائل عبر import_channel_history")
+    parser.add_argument("--synthesize", type=int, help="توليد تدفق اصطناعي بهذا العدد من الرسائل")
+    parser.add_argument("--out", help="حفظ التدفق الاصطناعي في ملف بدلاً من تشغيله")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--verbose", action="store_true", help="إظهار مخرجات worker.py")
+    parser.add_argument("--export", action="store_true", help="تمرير الرسائل عبر export_channel_history")
+    parser.add_argument("--concurrency", type=int, default=4, help="التزامن في وضع --export")
+    parser.add_argument("--range-size", type=int, default=200, help="حجم النطاق في وضع --export")
+    parser.add_argument("--flood-rate", type=float, default=0.0, help="نسبة الطلبات التي ترد بـ FloodWait")
+    parser.add_argument("--flood-seconds", type=int, default=1, help="مدة FloodWait المصطنع")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="نسبة الطلبات التي تفشل بخطأ شبكة")
+    parser.add_argument("--latency", type=float, default=0.02, help="زمن كل طلب مصطنع بالثواني")
+    args = parser.parse_args()
+
+    if args.synthesize:
+        raw = synthesize_stream(args.synthesize, args.seed)
+        if args.out:
+            with open(args.out, "w", encoding="utf-8") as f:
+                for record in raw:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            print(f"✅ تم حفظ {len(raw)} حدث في {args.out}")
+            return
+        records = [dict(r, date=datetime.fromisoformat(r["date"])) if r.get("date") else r for r in raw]
+    elif args.stream:
+        records = load_stream(args.stream)
+    else:
+        parser.error("حدد ملف التدفق أو --synthesize")
+
+    worker.init_database(args.db)
+
+    timings = {}
+    worker.parse_content_info = timed(timings, "parse", worker.parse_content_info)
+    worker.save_to_database = timed(timings, "persist:new", worker.save_to_database)
+    worker.update_edited_message = timed(timings, "persist:edit", worker.update_edited_message)
+    worker.delete_messages = timed(timings, "persist:delete", worker.delete_messages)
+
+    if args.export:
+        started = time.perf_counter()
+        with open(os.devnull, "w") as devnull:
+            with contextlib.redirect_stdout(sys.stdout if args.verbose else devnull):
+                client, fed_ids = asyncio.run(replay_export(records, args))
+        ok = check_export(records, client, fed_ids, time.perf_counter() - started)
+        sys.exit(0 if ok else 1)
+
+    started = time.perf_counter()
+    with open(os.devnull, "w") as devnull:
+        with contextlib.redirect_stdout(sys.stdout if args.verbose else devnull):
+            client = asyncio.run(replay(records, history=args.history))
+    elapsed = time.perf_counter() - started
+
+    timings.update(client.timings)
+    print_report(records, elapsed, timings)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+لقطة إحصائيات الكتالوج لأوامر /debug و /test وزر اختبار قاعدة البيانات.
+
+تُجمع اللقطة في الخلفية (عند الإقلاع وعند تغير الكتالوج) وتقرأها الأوامر مباشرة،
+فلا يمسح أي أمر الجداول عند طلب المستخدم. في PostgreSQL تُقرأ أعداد الجداول
+الكبيرة تقريبياً من إحصائيات المخطط (pg_class.reltuples) بدلاً من COUNT(*).
+"""
+import time
+from datetime import datetime
+
+from sqlalchemy import inspect, text
+
+# الجداول الكبيرة التي تكفي فيها الأعداد التقريبية على PostgreSQL
+# (raw_messages يزيد مع كل رسالة جديدة أو معدلة أو محذوفة، و watch_progress صف لكل مستخدم وحلقة)
+APPROXIMATE_TABLES = ("episodes", "raw_messages", "watch_progress")
+
+def _exact_count(conn, table_name):
+    quoted_name = conn.dialect.identifier_preparer.quote(table_name)
+    return conn.execute(text(f"SELECT COUNT(*) FROM {quoted_name}")).scalar()
+
+def _planner_counts(conn, table_names):
+    """الأعداد التقديرية من pg_class (-1 أو غياب الصف يعني أن الجدول لم يُحلل بعد)."""
+    rows = conn.execute(text("""
+        SELECT c.relname, c.reltuples::bigint
+        FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = current_schema() AND c.relkind = 'r'
+    """)).fetchall()
+    return {name: count for name, count in rows if name in table_names and count >= 0}
+
+def table_counts(conn):
+    """عدد الصفوف لكل جدول: تقريبي على PostgreSQL، ودقيق على SQLite."""
+    table_names = inspect(conn).get_table_names()
+    approximate = {}
+    if conn.dialect.name == "postgresql":
+        approximate = _planner_counts(conn, APPROXIMATE_TABLES)
+
+    counts = {}
+    approximated = set()
+    for table_name in table_names:
+        if table_name in approximate:
+            counts[table_name] = approximate[table_name]
+            approximated.add(table_name)
+        else:
+            counts[table_name] = _exact_count(conn, table_name)
+    return counts, approximated
+
+def collect_stats(engine):
+    """جمع لقطة كاملة للإحصائيات (تُستدعى من مهمة خلفية فقط)."""
+    started = time.perf_counter()
+    with engine.connect() as conn:
+        counts, approximated = table_counts(conn)
+
+        # series صغير نسبياً، فالعد حسب النوع دقيق
+        by_type = dict(conn.execute(text("SELECT type, COUNT(*) FROM series GROUP BY type")).fetchall())
+
+        series_with_episodes = conn.execute(text("""
+            SELECT s.name, s.type,
+                   (SELECT COUNT(*) FROM episodes e WHERE e.series_id = s.id) AS ep_count
+            FROM series s
+            ORDER BY s.id ASC
+            LIMIT 5
+        """)).fetchall()
+
+        series_sample = conn.execute(text("""
+            SELECT id, name, type FROM series ORDER BY id LIMIT 5
+        """)).fetchall()
+
+        episodes_sample = conn.execute(text("""
+            SELECT id, series_id, season, episode_number FROM episodes ORDER BY id LIMIT 5
+        """)).fetchall()
+
+        series_examples = conn.execute(text("""
+            SELECT name FROM series WHERE type = 'series' ORDER BY id LIMIT 3
+        """)).fetchall()
+
+        movies_examples = conn.execute(text("""
+            SELECT name FROM series WHERE type = 'movie' ORDER BY id LIMIT 3
+        """)).fetchall()
+
+    return {
+        "series_count": by_type.get("series", 0),
+        "movies_count": by_type.get("movie", 0),
+        "episodes_count": counts.get("episodes", 0),
+        "episodes_approximate": "episodes" in approximated,
+        "table_counts": counts,
+        "approximate_tables": approximated,
+        "series_with_episodes": [tuple(r) for r in series_with_episodes],
+        "series_sample": [tuple(r) for r in series_sample],
+        "episodes_sample": [tuple(r) for r in episodes_sample],
+        "series_examples": [r[0] for r in series_examples],
+        "movies_examples": [r[0] for r in movies_examples],
+        "collected_at": datetime.utcnow(),
+        "collect_seconds": time.perf_counter() - started,
+    }
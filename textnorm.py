@@ -0,0 +1,70 @@
+"""
+توحيد كتابة العناوين العربية/اللاتينية للمقارنة والفهرسة.
+
+الاسم المخزن في series.name لا يتغير، وإنما تُستخدم الصيغة الموحدة كمفتاح:
+إزالة التشكيل والتطويل، توحيد أشكال الألف والياء والتاء المربوطة، تحويل الأرقام
+العربية الهندية، وحذف الكلمات الزائدة مثل "مسلسل" والأرقام في النهاية.
+"""
+import re
+import unicodedata
+
+# التشكيل وعلامة الألف الخنجرية
+_DIACRITICS = re.compile(r"[\u064B-\u065F\u0670]")
+_TATWEEL = "\u0640"
+
+_LETTER_MAP = str.maketrans({
+    "أ": "ا", "إ": "ا", "آ": "ا", "ٱ": "ا",
+    "ى": "ي", "ئ": "ي", "ؤ": "و", "ة": "ه",
+    # الأرقام العربية الهندية والفارسية
+    "٠": "0", "١": "1", "٢": "2", "٣": "3", "٤": "4",
+    "٥": "5", "٦": "6", "٧": "7", "٨": "8", "٩": "9",
+    "۰": "0", "۱": "1", "۲": "2", "۳": "3", "۴": "4",
+    "۵": "5", "۶": "6", "۷": "7", "۸": "8", "۹": "9",
+})
+
+# كلمات لا تميز العنوان (بعد التوحيد)
+_NOISE_WORDS = re.compile(r"\b(مسلسل|فيلم|الموسم|موسم|الحلقه|حلقه|الجزء|جزء|series|movie)\b")
+# رقم بعد فاصل أو ملتصق بحرف عربي (وليس مثل "s2" أو "24" وحدها)
+_TRAILING_NUMBER = re.compile(r"(?:[\s\-_]+|(?<=[\u0600-\u06FF]))\d+$")
+_NON_WORD = re.compile(r"[^\w\s]")
+_SPACES = re.compile(r"\s+")
+
+def fold_letters(text):
+    """توحيد الحروف فقط (بدون حذف كلمات): تشكيل، تطويل، أشكال الألف... وحروف صغيرة."""
+    text = unicodedata.normalize("NFKC", text or "")
+    text = _DIACRITICS.sub("", text).replace(_TATWEEL, "")
+    return text.translate(_LETTER_MAP).lower()
+
+def normalize_title(name, strip_number=True):
+    """الصيغة الموحدة للعنوان، مثال: 'مسلسل  الـمـحافـظ ٢' -> 'المحافظ'."""
+    text = fold_letters(name)
+    text = _NON_WORD.sub(" ", text).replace("_", " ")
+    text = _NOISE_WORDS.sub(" ", text)
+    text = _SPACES.sub(" ", text).strip()
+    return strip_trailing_number(text) if strip_number else text
+
+def strip_trailing_number(key):
+    """حذف الرقم في نهاية اسم موحد (غالباً رقم موسم أو جزء التصق بالاسم)."""
+    stripped = _TRAILING_NUMBER.sub("", key).strip()
+    return stripped or key
+
+# أداة التعريف في أول العنوان لا تُحسب في الترتيب الأبجدي
+_LEADING_ARTICLE = re.compile(r"^(?:ال(?=\w{2})|the\s+)")
+_ARABIC_LETTER = re.compile(r"[ء-ي]")
+
+def sort_key(name):
+    """مفتاح الترتيب الأبجدي المخزن في series.sort_key.
+
+    بعد التوحيد يكون ترتيب نقاط يونيكود للحروف العربية هو الترتيب الهجائي نفسه
+    (ا ب ت ... ن ه و ي)، فيكفي ترتيب ثنائي (BINARY في SQLite و "C" في PostgreSQL).
+    """
+    key = normalize_title(name, strip_number=False)
+    key = _LEADING_ARTICLE.sub("", key) or key
+    return (key or fold_letters(name).strip())[:255]
+
+def index_letter(key):
+    """حرف الفهرس لمفتاح ترتيب: حرف عربي أو لاتيني، أو '#' للأرقام والرموز."""
+    first = key[:1]
+    if _ARABIC_LETTER.match(first) or "a" <= first <= "z":
+        return first
+    return "#"
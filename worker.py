@@ -1,13 +1,28 @@
 import os
 import asyncio
+import hmac
 import re
+import signal
 import sys
-from datetime import datetime
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import AsyncExitStack, asynccontextmanager
+from functools import partial
+from datetime import datetime, timedelta
 from telethon import TelegramClient, events
+from telethon.errors import FloodWaitError, TakeoutInitDelayError
 from telethon.sessions import StringSession
 from telethon.tl.types import Message
-from sqlalchemy import create_engine, text
+from sqlalchemy import bindparam, text
 from sqlalchemy.exc import SQLAlchemyError
+from config import Config
+from database import (
+    create_db_engine, init_db, bump_catalog_version, get_catalog_version, series_index_fields, adjust_letter_count,
+    find_series, has_episode,
+)
+from callbacks import encode_start_episode, encode_start_series, start_link
+from worker_metrics import WorkerMetrics, start_metrics_server
+from memdiag import ACTIONS as MEMORY_ACTIONS, DIAGNOSTICS
 
 # ==============================
 # 1. إعدادات التهيئة من متغيرات البيئة
@@ -15,60 +30,65 @@ from sqlalchemy.exc import SQLAlchemyError
 API_ID = int(os.environ.get("API_ID", 0))
 API_HASH = os.environ.get("API_HASH", "")
 CHANNEL_USERNAME = os.environ.get("CHANNEL_USERNAME", "https://t.me/ShoofFilm")
-DATABASE_URL = os.environ.get("DATABASE_URL", "")
+DATABASE_URL = Config.DATABASE_URL
 STRING_SESSION = os.environ.get("STRING_SESSION", "")
 IMPORT_HISTORY = os.environ.get("IMPORT_HISTORY", "false").lower() == "true"  # تفعيل/تعطيل الاستيراد
+IMPORT_BULK = os.environ.get("IMPORT_BULK", "false").lower() == "true"  # تصدير كامل متوازي بدلاً من آخر 1000 رسالة
+EXPORT_CONCURRENCY = int(os.environ.get("EXPORT_CONCURRENCY", 4))  # أقصى عدد طلبات متزامنة
+EXPORT_RANGE_SIZE = int(os.environ.get("EXPORT_RANGE_SIZE", 500))  # عدد معرفات الرسائل في كل نطاق
+METRICS_PORT = int(os.environ.get("METRICS_PORT", 0))  # منفذ /metrics و /ready (0 = معطل)
+METRICS_HOST = os.environ.get("METRICS_HOST", "127.0.0.1")
+READY_MAX_LAG_SECONDS = int(os.environ.get("READY_MAX_LAG_SECONDS", 300))  # أقصى تأخر قبل فشل /ready
+READY_LAG_WINDOW_SECONDS = float(os.environ.get("READY_LAG_WINDOW_SECONDS", 300))  # مدة احتساب آخر تأخر مقاس في /ready
+BOT_USERNAME = os.environ.get("BOT_USERNAME", "")  # لإنشاء روابط t.me/<bot>?start=... (فارغ = بدون روابط)
+DEEP_LINK_POST = os.environ.get("DEEP_LINK_POST", "").lower()  # "" أو reply (رد تحت المنشور) أو pin (رد مثبت)
+MEMORY_DEBUG_TOKEN = os.environ.get("MEMORY_DEBUG_TOKEN", "")  # يفعّل /debug/memory على خادم المقاييس (فارغ = معطل)
 
-# تحقق من وجود المتغيرات الأساسية
-if not all([API_ID, API_HASH, DATABASE_URL, STRING_SESSION]):
-    print("❌ خطأ: واحد أو أكثر من المتغيرات التالية مفقود: API_ID, API_HASH, DATABASE_URL, STRING_SESSION")
-    sys.exit(1)
-
-# إصلاح رابط قاعدة البيانات
-if DATABASE_URL.startswith("postgres://"):
-    DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
+# مقاييس العامل (تُعرض على METRICS_PORT إن كان مفعلاً)
+METRICS = WorkerMetrics(lag_window=READY_LAG_WINDOW_SECONDS)
 
 # ==============================
 # 2. إعداد الاتصال بقاعدة البيانات
 # ==============================
-try:
-    engine = create_engine(DATABASE_URL)
+engine = None
+
+def init_database(database_url):
+    """إنشاء محرك قاعدة البيانات واختبار الاتصال ثم التحقق من الجداول."""
+    global engine
+    
+    engine = create_db_engine(database_url)
     with engine.connect() as conn:
         conn.execute(text("SELECT 1"))
-    print("✅ تم الاتصال بقاعدة البيانات بنجاح.")
-except Exception as e:
-    print(f"❌ فشل الاتصال بقاعدة البيانات: {e}")
-    sys.exit(1)
+    print(f"✅ تم الاتصال بقاعدة البيانات بنجاح ({engine.dialect.name}).")
+    
+    create_tables()
+    return engine
+
+# الوضع المدمج (combined.py): البوت يشارك حلقة asyncio، فتُنفذ كتابات الـ Worker في خيط
+# مخصص بدلاً من إيقاف الحلقة. خيط واحد فقط يحفظ ترتيب الرسائل (جديدة، تعديل، حذف).
+DB_IN_THREAD = False
+_DB_EXECUTOR = {"executor": None}
+
+async def run_blocking(func, *args, **kwargs):
+    """تشغيل دالة قاعدة بيانات متزامنة: مباشرة، أو في خيط الكتابة إذا كان DB_IN_THREAD مفعلاً."""
+    if not DB_IN_THREAD:
+        return func(*args, **kwargs)
+    if _DB_EXECUTOR["executor"] is None:
+        _DB_EXECUTOR["executor"] = ThreadPoolExecutor(max_workers=1, thread_name_prefix="worker-db")
+    return await asyncio.get_running_loop().run_in_executor(
+        _DB_EXECUTOR["executor"], partial(func, *args, **kwargs)
+    )
 
 # ==============================
 # 3. إنشاء الجداول إذا لم تكن موجودة
 # ==============================
-try:
-    with engine.begin() as conn:
-        conn.execute(text("""
-            CREATE TABLE IF NOT EXISTS series (
-                id SERIAL PRIMARY KEY,
-                name VARCHAR(255) NOT NULL,
-                type VARCHAR(10) DEFAULT 'series',  -- 'series' أو 'movie'
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """))
-        conn.execute(text("""
-            CREATE TABLE IF NOT EXISTS episodes (
-                id SERIAL PRIMARY KEY,
-                series_id INTEGER REFERENCES series(id),
-                season INTEGER DEFAULT 1,
-                episode_number INTEGER NOT NULL,
-                telegram_message_id INTEGER UNIQUE NOT NULL,
-                telegram_channel_id VARCHAR(255),
-                added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """))
-        # إنشاء فهرس لتسريع البحث
-        conn.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS idx_series_name_type ON series(name, type)"))
-    print("✅ تم التحقق من هياكل الجداول.")
-except Exception as e:
-    print(f"⚠️ ملاحظة حول الجداول: {e}")
+def create_tables():
+    """إنشاء جداول المسلسلات والحلقات إذا لم تكن موجودة (تعريفها في database.py)."""
+    try:
+        init_db(engine)
+        print("✅ تم التحقق من هياكل الجداول.")
+    except Exception as e:
+        print(f"⚠️ ملاحظة حول الجداول: {e}")
 
 # ==============================
 # 4. دوال المساعدة (التحليل والحفظ)
@@ -97,9 +117,13 @@ def extract_numbers_from_name(name):
         return int(match.group(1))
     return None
 
+# إصدار قواعد التحليل: يُزاد عند تعديل parse_content_info ثم يُشغّل reparse.py
+PARSER_VERSION = 1
+
 def parse_content_info(message_text):
     """تحليل نص الرسالة لاستخراج المعلومات."""
     if not message_text:
+        METRICS.pattern("empty")
         return None, None, None, None
     
     text_cleaned = message_text.strip()
@@ -116,6 +140,7 @@ def parse_content_info(message_text):
         season_num = int(match.group(2))  # الرقم بعد الشرطة يعتبر موسم
         episode_num = 1  # الأفليس ليس لها حلقات
         clean_name_text = clean_name(raw_name)
+        METRICS.pattern("film_dash")
         return clean_name_text, content_type, season_num, episode_num
     
     # نمط 2: "فيلم يوم 13"
@@ -127,6 +152,7 @@ def parse_content_info(message_text):
         season_num = int(match.group(2))  # الرقم بعد المسافة يعتبر موسم
         episode_num = 1
         clean_name_text = clean_name(raw_name)
+        METRICS.pattern("film_space")
         return clean_name_text, content_type, season_num, episode_num
     
     # نمط 3: "فيلم [اسم]" بدون رقم
@@ -145,6 +171,7 @@ def parse_content_info(message_text):
             season_num = 1  # موسم افتراضي
         episode_num = 1
         clean_name_text = clean_name(raw_name)
+        METRICS.pattern("film_name_only")
         return clean_name_text, content_type, season_num, episode_num
     
     # =============================================
@@ -158,6 +185,7 @@ def parse_content_info(message_text):
         season_num = int(match.group(2))
         episode_num = int(match.group(3))
         clean_name_text = clean_name(raw_name)
+        METRICS.pattern("series_season")
         return clean_name_text, content_type, season_num, episode_num
     
     # =============================================
@@ -171,6 +199,7 @@ def parse_content_info(message_text):
         season_num = 1  # موسم افتراضي
         episode_num = int(match.group(2))
         clean_name_text = clean_name(raw_name)
+        METRICS.pattern("series_episode")
         return clean_name_text, content_type, season_num, episode_num
     
     # =============================================
@@ -193,6 +222,7 @@ def parse_content_info(message_text):
             episode_num = int(match.group(2))  # الرقم يعتبر حلقة
         
         clean_name_text = clean_name(raw_name)
+        METRICS.pattern("simple")
         return clean_name_text, content_type, season_num, episode_num
     
     # =============================================
@@ -206,6 +236,7 @@ def parse_content_info(message_text):
         season_num = int(match.group(2))
         episode_num = int(match.group(3))
         clean_name_text = clean_name(raw_name)
+        METRICS.pattern("arabic_series_season")
         return clean_name_text, content_type, season_num, episode_num
     
     # =============================================
@@ -219,6 +250,7 @@ def parse_content_info(message_text):
         season_num = 1
         episode_num = int(match.group(2))
         clean_name_text = clean_name(raw_name)
+        METRICS.pattern("arabic_series_episode")
         return clean_name_text, content_type, season_num, episode_num
     
     # إذا لم يتطابق مع أي نمط
@@ -237,60 +269,213 @@ def parse_content_info(message_text):
         episode_num = 1
         clean_name_text = clean_name(raw_name)
         print(f"   ⚠️ معالجة كفيلم افتراضي: {clean_name_text}")
+        METRICS.pattern("film_fallback")
         return clean_name_text, content_type, season_num, episode_num
     
+    METRICS.pattern("none")
     return None, None, None, None
 
-def save_to_database(name, content_type, season_num, episode_num, telegram_msg_id, series_id=None):
-    """حفظ المحتوى في قاعدة البيانات."""
-    try:
-        with engine.begin() as conn:
-            # البحث عن المسلسل/الفيلم بنفس الاسم والنوع
-            if not series_id:
-                result = conn.execute(
-                    text("""
-                        SELECT id FROM series 
-                        WHERE name = :name AND type = :type
-                    """),
-                    {"name": name, "type": content_type}
-                ).fetchone()
-                
-                if not result:
-                    # إضافة مسلسل/فيلم جديد
-                    conn.execute(
-                        text("""
-                            INSERT INTO series (name, type) 
-                            VALUES (:name, :type)
-                        """),
-                        {"name": name, "type": content_type}
-                    )
-                    # جلب الـ ID الجديد
-                    result = conn.execute(
-                        text("""
-                            SELECT id FROM series 
-                            WHERE name = :name AND type = :type
-                        """),
-                        {"name": name, "type": content_type}
-                    ).fetchone()
-                
-                series_id = result[0]
-            
-            # إضافة الحلقة/الجزء
-            conn.execute(
-                text("""
-                    INSERT INTO episodes (series_id, season, episode_number, 
-                           telegram_message_id, telegram_channel_id)
-                    VALUES (:sid, :season, :ep_num, :msg_id, :channel)
-                    ON CONFLICT (telegram_message_id) DO NOTHING
-                """),
-                {
-                    "sid": series_id,
-                    "season": season_num,
-                    "ep_num": episode_num,
-                    "msg_id": telegram_msg_id,
-                    "channel": "@ShoofFilm"
-                }
+# دوال تُستدعى بعد كل معاملة غيرت الكتالوج (الوضع المدمج في combined.py):
+# listener(الإصدار السابق، الإصدار الجديد، أرقام الرسائل المحذوفة، صفوف الحلقات المضافة)
+INGEST_LISTENERS = []
+
+def catalog_version_for_listeners(conn):
+    """إصدار الكتالوج داخل المعاملة، ويُقرأ فقط إذا وُجد مستمعون."""
+    return get_catalog_version(conn) if INGEST_LISTENERS else None
+
+def catalog_change(conn, previous_version, removed_msg_ids=(), added_msg_ids=()):
+    """وصف تغيير المعاملة الحالية لإبلاغ المستمعين بعد نجاحها، أو None إذا لم يتغير شيء."""
+    if previous_version is None:
+        return None
+    version = get_catalog_version(conn)
+    if version == previous_version:
+        return None
+    added = []
+    if added_msg_ids:
+        # نفس شكل صفوف آخر الإضافات في bot.py
+        added = conn.execute(text("""
+            SELECT e.id, s.id, s.name, s.type, e.season, e.episode_number, e.telegram_message_id
+            FROM episodes e
+            JOIN series s ON e.series_id = s.id
+            WHERE e.telegram_message_id IN :msg_ids
+            ORDER BY e.id
+        """).bindparams(bindparam("msg_ids", expanding=True)), {"msg_ids": list(added_msg_ids)}).fetchall()
+    return previous_version, version, list(removed_msg_ids), [tuple(row) for row in added]
+
+def notify_ingest(change):
+    if not change:
+        return
+    for listener in INGEST_LISTENERS:
+        try:
+            listener(*change)
+        except Exception as e:
+            print(f"⚠️ خطأ في مستمع تغييرات الكتالوج: {e}")
+
+def message_date_of(message):
+    """تاريخ رسالة تليجرام بتوقيت UTC بدون منطقة زمنية (كما تُخزن بقية التواريخ)."""
+    date = getattr(message, "date", None)
+    if date is not None and date.tzinfo is not None:
+        date = date.replace(tzinfo=None) - (date.utcoffset() or timedelta(0))
+    return date
+
+def archive_raw_message(conn, telegram_msg_id, message_text, event, parse_status, message_date=None):
+    """إضافة نص الرسالة الخام إلى raw_messages داخل معاملة مفتوحة.
+
+    الجدول للإضافة فقط: كل تعديل صف جديد، والحذف صف بدون نص، ونتيجة إعادة التحليل
+    صف 'reparse' (reparse.py). الرسائل الجديدة لا تُضاف مرتين (إعادة استيراد التاريخ عند كل تشغيل).
+    """
+    params = {
+        "msg_id": telegram_msg_id, "message_date": message_date, "text": message_text,
+        "event": event, "status": parse_status, "version": PARSER_VERSION, "received_at": datetime.utcnow(),
+    }
+    insert = """
+        INSERT INTO raw_messages (telegram_message_id, message_date, text, event,
+                                  parse_status, parser_version, received_at)
+        SELECT :msg_id, :message_date, :text, :event, :status, :version, :received_at
+    """
+    if event == "new":
+        insert += """
+            WHERE NOT EXISTS (
+                SELECT 1 FROM raw_messages WHERE telegram_message_id = :msg_id AND event = 'new'
             )
+        """
+    conn.execute(text(insert), params)
+
+def parse_status_of(parsed):
+    name, content_type, season_num, episode_num = parsed
+    return "parsed" if name and content_type and episode_num else "unparsed"
+
+def archive_unparsed_message(telegram_msg_id, message_text, message_date=None):
+    """حفظ رسالة لم يتم تحليلها حتى يمكن إعادة تحليلها لاحقاً بدون تليجرام."""
+    try:
+        with METRICS.timed("archive"), engine.begin() as conn:
+            archive_raw_message(conn, telegram_msg_id, message_text, "new", "unparsed", message_date)
+    except SQLAlchemyError as e:
+        print(f"❌ خطأ في حفظ الرسالة الخام {telegram_msg_id}: {e}")
+
+def create_series(conn, name, content_type):
+    """إضافة مسلسل/فيلم جديد مع مفتاح الفهرس الأبجدي، وإرجاع معرفه."""
+    key, initial = series_index_fields(name)
+    conn.execute(
+        text("""
+            INSERT INTO series (name, type, sort_key, initial) 
+            VALUES (:name, :type, :sort_key, :initial)
+        """),
+        {"name": name, "type": content_type, "sort_key": key, "initial": initial}
+    )
+    adjust_letter_count(conn, content_type, initial, 1)
+    # جلب الـ ID الجديد
+    return conn.execute(
+        text("""
+            SELECT id FROM series 
+            WHERE name = :name AND type = :type
+        """),
+        {"name": name, "type": content_type}
+    ).fetchone()[0]
+
+def insert_episode(conn, name, content_type, season_num, episode_num, telegram_msg_id, series_id=None,
+                   added_at=None):
+    """إضافة حلقة/جزء داخل معاملة مفتوحة مع إنشاء المسلسل/الفيلم عند الحاجة."""
+    # البحث عن المسلسل/الفيلم بنفس الاسم والنوع (أو باسم دُمج فيه سابقاً)
+    aliased = False
+    if not series_id:
+        series_id, aliased = find_series(conn, name, content_type)
+        if series_id is None:
+            series_id = create_series(conn, name, content_type)
+    
+    # اسم مدموج: حلقة موجودة في المحتوى الأساسي حُذفت عند الدمج كمكررة، فلا تعود
+    # (إعادة استيراد التاريخ، إعادة التحليل، أو منشور جديد بالاسم القديم)
+    if aliased and has_episode(conn, series_id, season_num, episode_num):
+        return series_id
+    
+    # إضافة الحلقة/الجزء
+    result = conn.execute(
+        text("""
+            INSERT INTO episodes (series_id, season, episode_number, 
+                   telegram_message_id, telegram_channel_id, added_at)
+            VALUES (:sid, :season, :ep_num, :msg_id, :channel, :added_at)
+            ON CONFLICT (telegram_message_id) DO NOTHING
+        """),
+        {
+            "sid": series_id,
+            "season": season_num,
+            "ep_num": episode_num,
+            "msg_id": telegram_msg_id,
+            "channel": "@ShoofFilm",
+            # القيمة الافتراضية في database.py لا تُطبق على استعلامات text()
+            "added_at": added_at or datetime.utcnow()
+        }
+    )
+    if result.rowcount:
+        bump_catalog_version(conn)
+    return series_id
+
+def current_episode(conn, telegram_msg_id):
+    """الحلقة الحالية لرسالة بصيغة (series_id, name, type, season, episode_number)، أو None."""
+    row = conn.execute(text("""
+        SELECT s.id, s.name, s.type, e.season, e.episode_number
+        FROM episodes e
+        JOIN series s ON s.id = e.series_id
+        WHERE e.telegram_message_id = :msg_id
+    """), {"msg_id": telegram_msg_id}).fetchone()
+    return tuple(row) if row else None
+
+def same_episode(conn, parsed, current):
+    """هل يطابق التحليل (name, type, season, episode_number) أو None الحلقة الحالية؟
+
+    الاسم المدموج (series_aliases) يطابق المحتوى الأساسي، والحلقة المحذوفة عند الدمج
+    لأنها مكررة في الأساسي تبقى محذوفة (insert_episode يتجاهلها أيضاً).
+    """
+    if parsed is None:
+        return current is None
+    if current is not None and tuple(parsed) == current[1:]:
+        return True
+    name, content_type, season, episode_number = parsed
+    series_id, aliased = find_series(conn, name, content_type)
+    if current is None:
+        return aliased and has_episode(conn, series_id, season, episode_number)
+    return series_id == current[0] and (season, episode_number) == tuple(current[3:])
+
+def replace_episode(conn, parsed, telegram_msg_id, current):
+    """تطبيق تحليل جديد لرسالة على حلقتها داخل معاملة مفتوحة، وإرجاع True إذا تغير الكتالوج.
+
+    الحلقة تُحدّث في مكانها (نفس المعرف)، ولا يتغير شيء إذا طابق التحليل الحلقة الحالية.
+    """
+    if same_episode(conn, parsed, current):
+        return False
+    params = {"msg_id": telegram_msg_id}
+    if current is None:
+        insert_episode(conn, *parsed, telegram_msg_id)
+        return True
+    if parsed is not None:
+        name, content_type, season_num, episode_num = parsed
+        series_id, aliased = find_series(conn, name, content_type)
+        # مكررة في المحتوى الأساسي لاسم مدموج: تُحذف كما لا يضيفها insert_episode
+        if not (aliased and has_episode(conn, series_id, season_num, episode_num)):
+            if series_id is None:
+                series_id = create_series(conn, name, content_type)
+            conn.execute(text("""
+                UPDATE episodes SET series_id = :sid, season = :season, episode_number = :ep_num
+                WHERE telegram_message_id = :msg_id
+            """), {**params, "sid": series_id, "season": season_num, "ep_num": episode_num})
+            bump_catalog_version(conn)
+            return True
+    conn.execute(text("DELETE FROM episodes WHERE telegram_message_id = :msg_id"), params)
+    bump_catalog_version(conn)
+    return True
+
+def save_to_database(name, content_type, season_num, episode_num, telegram_msg_id, series_id=None,
+                     message_text=None, message_date=None):
+    """حفظ المحتوى في قاعدة البيانات (مع نص الرسالة الخام في نفس المعاملة إن وُجد)."""
+    try:
+        with METRICS.timed("save"), engine.begin() as conn:
+            previous_version = catalog_version_for_listeners(conn)
+            if message_text is not None:
+                archive_raw_message(conn, telegram_msg_id, message_text, "new", "parsed", message_date)
+            insert_episode(conn, name, content_type, season_num, episode_num, telegram_msg_id, series_id)
+            change = catalog_change(conn, previous_version, added_msg_ids=[telegram_msg_id])
+        METRICS.saved(True)
+        notify_ingest(change)
             
         type_arabic = "مسلسل" if content_type == 'series' else "فيلم"
         if content_type == 'movie':
@@ -300,9 +485,127 @@ def save_to_database(name, content_type, season_num, episode_num, telegram_msg_i
         return True
         
     except SQLAlchemyError as e:
+        METRICS.saved(False)
         print(f"❌ خطأ في قاعدة البيانات: {e}")
         return False
 
+def update_edited_message(telegram_msg_id, message_text, message_date=None):
+    """إعادة تحليل رسالة معدلة وتحديث الحلقة المرتبطة بها إذا تغيرت نتيجة التحليل."""
+    METRICS.message("edit")
+    with METRICS.timed("parse"):
+        parsed = parse_content_info(message_text)
+    name, content_type, season_num, episode_num = parsed
+    try:
+        with METRICS.timed("edit"), engine.begin() as conn:
+            previous_version = catalog_version_for_listeners(conn)
+            archive_raw_message(conn, telegram_msg_id, message_text, "edit", parse_status_of(parsed), message_date)
+            # تعديل النص فقط (بدون تغيير التحليل) لا يمس الحلقة ولا إصدار الكتالوج
+            changed = replace_episode(
+                conn, parsed if name and content_type and episode_num else None,
+                telegram_msg_id, current_episode(conn, telegram_msg_id)
+            )
+            change = catalog_change(conn, previous_version, [telegram_msg_id], [telegram_msg_id])
+        notify_ingest(change)
+        if changed:
+            print(f"✏️ تم تحديث الرسالة المعدلة {telegram_msg_id}")
+        else:
+            print(f"✏️ الرسالة المعدلة {telegram_msg_id} بدون تغيير في الحلقة")
+        return True
+    except SQLAlchemyError as e:
+        print(f"❌ خطأ في تحديث الرسالة {telegram_msg_id}: {e}")
+        return False
+
+def delete_messages(telegram_msg_ids):
+    """حذف الحلقات المرتبطة برسائل محذوفة من القناة."""
+    if not telegram_msg_ids:
+        return 0
+    METRICS.message("delete")
+    try:
+        with METRICS.timed("delete"), engine.begin() as conn:
+            previous_version = catalog_version_for_listeners(conn)
+            for telegram_msg_id in telegram_msg_ids:
+                archive_raw_message(conn, telegram_msg_id, None, "delete", "deleted")
+            result = conn.execute(
+                text("DELETE FROM episodes WHERE telegram_message_id IN :msg_ids")
+                .bindparams(bindparam("msg_ids", expanding=True)),
+                {"msg_ids": list(telegram_msg_ids)}
+            )
+            if result.rowcount:
+                bump_catalog_version(conn)
+            change = catalog_change(conn, previous_version, telegram_msg_ids)
+        notify_ingest(change)
+        print(f"🗑️ تم حذف {result.rowcount} حلقة/جزء لرسائل محذوفة")
+        return result.rowcount
+    except SQLAlchemyError as e:
+        print(f"❌ خطأ في حذف الرسائل: {e}")
+        return 0
+
+def process_message(message):
+    """تحليل رسالة جديدة من القناة وحفظها، مشترك بين المراقبة والاستيراد."""
+    if not message.text:
+        return False
+    METRICS.message("new")
+    with METRICS.timed("parse"):
+        name, content_type, season_num, episode_num = parse_content_info(message.text)
+    if name and content_type and episode_num:
+        type_arabic = "مسلسل" if content_type == 'series' else "فيلم"
+        if content_type == 'movie':
+            print(f"   تم التعرف على {type_arabic}: {name} - الجزء {season_num}")
+        else:
+            print(f"   تم التعرف على {type_arabic}: {name} - الموسم {season_num} الحلقة {episode_num}")
+        return save_to_database(name, content_type, season_num, episode_num, message.id,
+                                message_text=message.text, message_date=message_date_of(message))
+    archive_unparsed_message(message.id, message.text, message_date_of(message))
+    return False
+
+# ==============================
+# 4.1 روابط البوت العميقة للحلقات الجديدة
+# ==============================
+def deep_links_for(telegram_msg_id):
+    """(رابط الحلقة، رابط المسلسل) لرسالة محفوظة كحلقة، أو None."""
+    if not BOT_USERNAME:
+        return None
+    with engine.connect() as conn:
+        row = conn.execute(
+            text("SELECT series_id FROM episodes WHERE telegram_message_id = :msg_id"),
+            {"msg_id": telegram_msg_id}
+        ).fetchone()
+    if not row:
+        return None
+    return (
+        start_link(BOT_USERNAME, encode_start_episode(telegram_msg_id)),
+        start_link(BOT_USERNAME, encode_start_series(row[0])),
+    )
+
+def is_deep_link_post(message_text):
+    """منشورات الروابط التي يضيفها الـ Worker نفسه لا تُحلل كمحتوى."""
+    return bool(BOT_USERNAME) and f"t.me/{BOT_USERNAME.lstrip('@')}?start=" in (message_text or "")
+
+async def post_deep_links(client, channel, message):
+    """طباعة روابط الحلقة، ونشرها رداً على المنشور (وتثبيتها) حسب DEEP_LINK_POST."""
+    try:
+        links = await run_blocking(deep_links_for, message.id)
+    except SQLAlchemyError as e:
+        print(f"⚠️ تعذر إنشاء روابط البوت للرسالة {message.id}: {e}")
+        return
+    if not links:
+        return
+    episode_link, series_link = links
+    print(f"🔗 روابط البوت: {episode_link} | {series_link}")
+    if DEEP_LINK_POST not in ("reply", "pin"):
+        return
+    try:
+        posted = await client.send_message(
+            channel,
+            f"▶️ افتح الحلقة في البوت: {episode_link}\n📺 كل الحلقات: {series_link}",
+            reply_to=message.id,
+            link_preview=False,
+        )
+        if DEEP_LINK_POST == "pin":
+            await client.pin_message(channel, posted, notify=False)
+    except Exception as e:
+        print(f"⚠️ تعذر نشر روابط البوت للرسالة {message.id}: {e}")
+
 # ==============================
 # 5. استيراد المسلسلات القديمة
 # ==============================
@@ -328,18 +631,23 @@ async def import_channel_history(client, channel):
         print(f"📊 تم جمع {len(all_messages)} رسالة للاستيراد...")
         
         for message in all_messages:
-            if not message.text:
+            # منشورات الروابط التي أضافها الـ Worker نفسه (كما في المعالجات الحية)
+            if not message.text or is_deep_link_post(message.text):
                 continue
             
             try:
-                name, content_type, season_num, episode_num = parse_content_info(message.text)
+                METRICS.message("new")
+                with METRICS.timed("parse"):
+                    name, content_type, season_num, episode_num = parse_content_info(message.text)
                 if name and content_type and episode_num:
-                    if save_to_database(name, content_type, season_num, episode_num, message.id):
+                    if await run_blocking(save_to_database, name, content_type, season_num, episode_num, message.id,
+                                          message_text=message.text, message_date=message_date_of(message)):
                         imported_count += 1
                     else:
                         skipped_count += 1
                 else:
                     print(f"⚠️ لم يتم تحليل الرسالة: {message.text[:50]}...")
+                    await run_blocking(archive_unparsed_message, message.id, message.text, message_date_of(message))
                     error_count += 1
             except Exception as e:
                 print(f"❌ خطأ في معالجة الرسالة {message.id}: {e}")
@@ -355,16 +663,280 @@ async def import_channel_history(client, channel):
     except Exception as e:
         print(f"❌ خطأ أثناء استيراد التاريخ: {e}")
 
+# ==============================
+# 5.1 تصدير التاريخ الكامل (متوازي ومتكيف مع FloodWait)
+# ==============================
+class FloodPacer:
+    """تحديد عدد الطلبات المتزامنة وسرعتها حسب ردود تليجرام.
+
+    FloodWait يوقف كل الطلبات حتى انتهاء المدة، ويقسم التزامن على 2 ويبطئ الإيقاع.
+    الأخطاء الأخرى تنقص التزامن بواحد، والنجاح المتتالي يعيده تدريجياً حتى الحد الأقصى.
+    """
+
+    SUCCESSES_PER_STEP = 10
+    MAX_INTERVAL = 2.0
+
+    def __init__(self, max_concurrency):
+        self.max_concurrency = max(1, max_concurrency)
+        self.limit = self.max_concurrency
+        self.active = 0
+        self.interval = 0.0
+        self.next_start = 0.0
+        self.paused_until = 0.0
+        self.successes = 0
+        self.stats = {"requests": 0, "flood_waits": 0, "flood_seconds": 0, "errors": 0, "min_limit": self.limit}
+        self.condition = asyncio.Condition()
+
+    @asynccontextmanager
+    async def slot(self):
+        """انتظار مكان متاح (ضمن التزامن الحالي وبعد أي توقف أو فاصل زمني)."""
+        while True:
+            now = time.monotonic()
+            wait = max(self.paused_until, self.next_start) - now
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+            async with self.condition:
+                if self.active < self.limit and max(self.paused_until, self.next_start) <= time.monotonic():
+                    self.active += 1
+                    self.next_start = time.monotonic() + self.interval
+                    break
+                if self.active >= self.limit:
+                    await self.condition.wait()
+        self.stats["requests"] += 1
+        try:
+            yield
+        finally:
+            async with self.condition:
+                self.active -= 1
+                self.condition.notify_all()
+
+    def success(self):
+        self.successes += 1
+        self.interval *= 0.9
+        if self.successes >= self.SUCCESSES_PER_STEP and self.limit < self.max_concurrency:
+            self.limit += 1
+            self.successes = 0
+
+    def flood(self, seconds):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.limit = max(1, self.limit // 2)
+        self.interval = min(max(self.interval * 2, 0.1), self.MAX_INTERVAL)
+        self.successes = 0
+        self.stats["flood_waits"] += 1
+        self.stats["flood_seconds"] += seconds
+        self.stats["min_limit"] = min(self.stats["min_limit"], self.limit)
+
+    def failure(self):
+        self.limit = max(1, self.limit - 1)
+        self.successes = 0
+        self.stats["errors"] += 1
+        self.stats["min_limit"] = min(self.stats["min_limit"], self.limit)
+
+async def latest_message_id(client, channel):
+    async for message in client.iter_messages(channel, limit=1):
+        return message.id
+    return 0
+
+async def fetch_range(client, channel, low, high, pacer, max_attempts=5):
+    """جلب الرسائل من low إلى high (شاملة) بالترتيب التصاعدي.
+
+    FloodWait لا يُحسب من المحاولات (التوقف يحترم المدة المطلوبة)، والأخطاء الأخرى
+    يُعاد بعدها المحاولة بانتظار متزايد حتى max_attempts.
+    """
+    attempt = 0
+    while True:
+        async with pacer.slot():
+            try:
+                # min_id و max_id في Telethon غير شاملين
+                with METRICS.timed("fetch_range"):
+                    messages = [
+                        message async for message in client.iter_messages(
+                            channel, min_id=low - 1, max_id=high + 1, reverse=True, wait_time=0
+                        )
+                    ]
+                pacer.success()
+                return messages
+            except FloodWaitError as e:
+                print(f"⏳ FloodWait {e.seconds} ث عند النطاق {low}-{high}")
+                pacer.flood(e.seconds)
+                continue
+            except Exception as e:
+                attempt += 1
+                print(f"⚠️ خطأ في جلب النطاق {low}-{high} (محاولة {attempt}): {e}")
+                pacer.failure()
+                if attempt >= max_attempts:
+                    raise
+        await asyncio.sleep(min(2 ** attempt, 30))
+
+@asynccontextmanager
+async def takeout_session(client):
+    """جلسة takeout (حدود أعلى للتصدير) إن كانت متاحة، وإلا العميل نفسه."""
+    async with AsyncExitStack() as stack:
+        source = client
+        if hasattr(client, "takeout"):
+            try:
+                source = await stack.enter_async_context(client.takeout(finalize=True, channels=True))
+                print("✅ تم بدء جلسة takeout للتصدير")
+            except TakeoutInitDelayError as e:
+                print(f"⚠️ تليجرام يطلب الانتظار {e.seconds} ث قبل takeout، سيتم التصدير بالجلسة العادية")
+            except Exception as e:
+                print(f"⚠️ تعذر بدء جلسة takeout ({e})، سيتم التصدير بالجلسة العادية")
+        yield source
+
+async def export_channel_history(client, channel, on_message=None,
+                                 concurrency=EXPORT_CONCURRENCY, range_size=EXPORT_RANGE_SIZE):
+    """تصدير كل تاريخ القناة بنطاقات معرفات منفصلة تُجلب بالتوازي وتُمرر بترتيب المعرفات.
+
+    on_message (الافتراضي process_message) يُستدعى لكل رسالة بترتيب تصاعدي، ويُحتفظ
+    في الذاكرة بعدد محدود من النطاقات الجاهزة قبل دورها.
+    """
+    on_message = on_message or process_message
+    started = time.perf_counter()
+    pacer = FloodPacer(concurrency)
+    # Telethon ينتظر FloodWait القصير تلقائياً؛ نريد استلامه لنكيف السرعة بأنفسنا
+    previous_threshold = getattr(client, "flood_sleep_threshold", None)
+    if previous_threshold is not None:
+        client.flood_sleep_threshold = 0
+    
+    fed = 0
+    try:
+        async with takeout_session(client) as source:
+            last_id = await latest_message_id(source, channel)
+            ranges = [(low, min(low + range_size - 1, last_id)) for low in range(1, last_id + 1, range_size)]
+            print(f"📦 تصدير {last_id} معرف رسالة في {len(ranges)} نطاق (تزامن حتى {concurrency})")
+            
+            results = {}
+            state = {"next_range": 0, "next_feed": 0, "error": None}
+            ready = asyncio.Condition()
+            window = concurrency * 4
+            
+            async def fetcher():
+                while True:
+                    async with ready:
+                        index = state["next_range"]
+                        if index >= len(ranges):
+                            return
+                        state["next_range"] += 1
+                        # عدم الابتعاد كثيراً عن النطاق الذي ينتظر التمرير
+                        await ready.wait_for(lambda: index < state["next_feed"] + window)
+                    try:
+                        messages = await fetch_range(source, channel, *ranges[index], pacer)
+                    except Exception as e:
+                        async with ready:
+                            state["error"] = e
+                            ready.notify_all()
+                        return
+                    async with ready:
+                        results[index] = messages
+                        ready.notify_all()
+            
+            fetchers = [asyncio.create_task(fetcher()) for _ in range(concurrency)]
+            try:
+                for index in range(len(ranges)):
+                    async with ready:
+                        await ready.wait_for(lambda: index in results or state["error"])
+                        if index not in results:
+                            raise state["error"]
+                        messages = results.pop(index)
+                        state["next_feed"] = index + 1
+                        ready.notify_all()
+                    for message in messages:
+                        # منشورات الروابط التي أضافها الـ Worker نفسه (كما في المعالجات الحية)
+                        if is_deep_link_post(message.text):
+                            continue
+                        await run_blocking(on_message, message)
+                        fed += 1
+                await asyncio.gather(*fetchers)
+            finally:
+                for task in fetchers:
+                    task.cancel()
+    finally:
+        if previous_threshold is not None:
+            client.flood_sleep_threshold = previous_threshold
+    
+    elapsed = time.perf_counter() - started
+    stats = pacer.stats
+    print("="*50)
+    print(f"✅ اكتمل التصدير: {fed} رسالة في {elapsed:.1f} ث")
+    print(f"   - طلبات: {stats['requests']} | FloodWait: {stats['flood_waits']} ({stats['flood_seconds']} ث) "
+          f"| أخطاء: {stats['errors']} | أقل تزامن: {stats['min_limit']}")
+    print("="*50)
+    return fed, stats
+
+# ==============================
+# 5.2 تشخيص الذاكرة (إشارات و /debug/memory)
+# ==============================
+def entity_cache_size(client):
+    """عدد الكيانات في ذاكرة Telethon المؤقتة (_mb_entity_cache في 1.28، و_entity_cache في الإصدارات الأقدم)."""
+    cache = getattr(client, "_mb_entity_cache", None)
+    if cache is None:
+        cache = getattr(client, "_entity_cache", None)
+    if cache is None:
+        return 0
+    entries = getattr(cache, "hash_map", cache)
+    return len(entries) if hasattr(entries, "__len__") else len(vars(entries))
+
+def watch_client_memory(client):
+    """أنواع Telethon وذاكراته المؤقتة التي تُعرض في تقارير الذاكرة."""
+    DIAGNOSTICS.watch_types("Message", "MessageService", "User", "Channel", "PeerChannel", "PeerUser")
+    DIAGNOSTICS.track_size("worker_pending", lambda: len(METRICS.pending))
+    DIAGNOSTICS.track_size("telethon_entity_cache", lambda: entity_cache_size(client))
+    DIAGNOSTICS.track_size("telethon_session_entities", lambda: len(client.session._entities))
+
+def memory_route(params):
+    """/debug/memory?token=...&action=rss|snap|stop|objects"""
+    if not hmac.compare_digest(params.get("token", ""), MEMORY_DEBUG_TOKEN):
+        return 403, "forbidden\n"
+    action = params.get("action", "rss")
+    if action not in MEMORY_ACTIONS:
+        return 400, f"action: {'|'.join(MEMORY_ACTIONS)}\n"
+    return 200, DIAGNOSTICS.report(action) + "\n"
+
+def install_memory_signals():
+    """SIGUSR1: لقطة tracemalloc (الأولى تبدأ التتبع)، SIGUSR2: RSS وعدد الكائنات. التقرير في السجل."""
+    loop = asyncio.get_running_loop()
+    actions = {"SIGUSR1": ("snap",), "SIGUSR2": ("rss", "objects")}
+    for name, reports in actions.items():
+        signum = getattr(signal, name, None)
+        if signum is None:
+            continue
+        try:
+            loop.add_signal_handler(
+                signum, lambda reports=reports: print("\n".join(DIAGNOSTICS.report(action) for action in reports))
+            )
+        except (NotImplementedError, RuntimeError):
+            pass
+
 # ==============================
 # 6. الدالة الرئيسية لمراقبة القناة
 # ==============================
-async def monitor_channel():
-    """الدالة الرئيسية لمراقبة القناة وإضافة المحتوى."""
+async def monitor_channel(client=None):
+    """الدالة الرئيسية لمراقبة القناة وإضافة المحتوى.
+
+    يمكن تمرير عميل بديل (مثل العميل الوهمي في replay.py) بدلاً من TelegramClient.
+    """
     print("="*50)
     print(f"🔍 بدء مراقبة القناة: {CHANNEL_USERNAME}")
     print("="*50)
     
-    client = TelegramClient(StringSession(STRING_SESSION), API_ID, API_HASH)
+    if client is None:
+        client = TelegramClient(StringSession(STRING_SESSION), API_ID, API_HASH)
+    
+    watch_client_memory(client)
+    install_memory_signals()
+    memory_sampler = DIAGNOSTICS.start_sampling(Config.MEMORY_RSS_SECONDS)
+    
+    metrics_server = None
+    if METRICS_PORT:
+        routes = {"/debug/memory": memory_route} if MEMORY_DEBUG_TOKEN else None
+        metrics_server = await start_metrics_server(
+            METRICS, METRICS_HOST, METRICS_PORT, READY_MAX_LAG_SECONDS, routes=routes
+        )
+        print(f"📈 المقاييس على http://{METRICS_HOST}:{METRICS_PORT}/metrics (الجاهزية: /ready)")
+    # التحديثات التي استلمها Telethon ولم تصل إلى المعالجات بعد
+    METRICS.add_queue_probe(lambda: client._updates_queue.qsize())
+    METRICS.add_queue_probe(lambda: len(client._event_handler_tasks))
     
     try:
         await client.start()
@@ -374,7 +946,9 @@ async def monitor_channel():
         print(f"✅ تم العثور على القناة: {channel.title}")
         
         # استيراد المحتوى القديم إذا كان مفعلاً
-        if IMPORT_HISTORY:
+        if IMPORT_HISTORY and IMPORT_BULK:
+            await export_channel_history(client, channel)
+        elif IMPORT_HISTORY:
             await import_channel_history(client, channel)
         else:
             print("⚠️ استيراد المحتوى القديم معطل. لتفعيله، أضف IMPORT_HISTORY=true في متغيرات البيئة.")
@@ -383,17 +957,34 @@ async def monitor_channel():
         @client.on(events.NewMessage(chats=channel))
         async def handler(event):
             message = event.message
+            if is_deep_link_post(message.text):
+                return
             if message.text:
                 print(f"📥 رسالة جديدة: {message.text[:50]}...")
-                name, content_type, season_num, episode_num = parse_content_info(message.text)
-                if name and content_type and episode_num:
-                    type_arabic = "مسلسل" if content_type == 'series' else "فيلم"
-                    if content_type == 'movie':
-                        print(f"   تم التعرف على {type_arabic}: {name} - الجزء {season_num}")
-                    else:
-                        print(f"   تم التعرف على {type_arabic}: {name} - الموسم {season_num} الحلقة {episode_num}")
-                    save_to_database(name, content_type, season_num, episode_num, message.id)
+                METRICS.received(message.id, message_date_of(message))
+                saved = False
+                try:
+                    saved = await run_blocking(process_message, message)
+                finally:
+                    METRICS.done(message.id, datetime.utcnow() if saved else None)
+                if saved:
+                    await post_deep_links(client, channel, message)
         
+        # مراقبة الرسائل المعدلة
+        @client.on(events.MessageEdited(chats=channel))
+        async def edit_handler(event):
+            message = event.message
+            if is_deep_link_post(message.text):
+                return
+            print(f"✏️ رسالة معدلة: {message.id}")
+            await run_blocking(update_edited_message, message.id, message.text, message_date_of(message))
+        
+        # مراقبة الرسائل المحذوفة
+        @client.on(events.MessageDeleted(chats=channel))
+        async def delete_handler(event):
+            await run_blocking(delete_messages, event.deleted_ids)
+        
+        METRICS.live = True
         print("\n🎯 جاهز لاستقبال المحتوى الجديد من القناة...")
         print("   (اضغط Ctrl+C في Railway لإيقاف المراقبة)\n")
         
@@ -402,6 +993,11 @@ async def monitor_channel():
     except Exception as e:
         print(f"❌ خطأ في تشغيل الـ Worker: {e}")
     finally:
+        METRICS.live = False
+        if metrics_server:
+            metrics_server.close()
+        if memory_sampler:
+            memory_sampler.cancel()
         await client.disconnect()
         print("🛑 تم إيقاف مراقبة القناة.")
 
@@ -409,5 +1005,16 @@ async def monitor_channel():
 # 7. نقطة دخول البرنامج
 # ==============================
 if __name__ == "__main__":
+    # تحقق من وجود المتغيرات الأساسية
+    if not all([API_ID, API_HASH, STRING_SESSION]):
+        print("❌ خطأ: واحد أو أكثر من المتغيرات التالية مفقود: API_ID, API_HASH, STRING_SESSION")
+        sys.exit(1)
+    
+    try:
+        init_database(DATABASE_URL)
+    except Exception as e:
+        print(f"❌ فشل الاتصال بقاعدة البيانات: {e}")
+        sys.exit(1)
+    
     print("🚀 بدء تشغيل Worker لمراقبة قناة المسلسلات والأفلام...")
     asyncio.run(monitor_channel())
@@ -0,0 +1,232 @@
+"""
+مقاييس worker.py: زمن كل مرحلة، عدادات أنماط المحلل، تأخر وصول الحلقات، وعمق الطابور.
+
+تُجمع المقاييس في الذاكرة فقط (بدون مكتبات إضافية) وتُعرض بصيغة Prometheus النصية
+على خادم HTTP محلي صغير:
+    /metrics  كل المقاييس
+    /healthz  الحياة فقط (200 دائماً ما دامت الحلقة تعمل)
+    /ready    الجاهزية: 503 قبل بدء المراقبة الحية أو إذا تجاوز التأخر الحد المسموح
+ومسارات إضافية اختيارية (مثل /debug/memory في worker.py).
+
+التأخر (freshness lag) هو الفرق بين message.date في تليجرام و added_at عند الحفظ،
+ويُقاس للرسائل الحية فقط لأن رسائل الاستيراد قديمة بطبيعتها. آخر تأخر مقاس يُحسب في
+الجاهزية لمدة lag_window ثانية فقط، فرسالة بطيئة واحدة لا تُبقي /ready فاشلاً حتى
+وصول المنشور التالي (قد يتأخر ساعات في قناة هادئة).
+"""
+import asyncio
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from datetime import datetime
+from urllib.parse import parse_qs
+
+from memdiag import rss_bytes
+
+# حدود المدرجات بالثواني
+STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+LAG_BUCKETS = (1, 2, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+
+class Histogram:
+    """مدرج تراكمي بحدود ثابتة مثل مدرجات Prometheus."""
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def render(self, name, labels=""):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f"{name}_bucket{{{_join(labels, _label('le', bound))}}} {cumulative}")
+        lines.append(f"{name}_bucket{{{_join(labels, _label('le', '+Inf'))}}} {self.count}")
+        suffix = f"{{{labels}}}" if labels else ""
+        lines.append(f"{name}_sum{suffix} {self.total:.6f}")
+        lines.append(f"{name}_count{suffix} {self.count}")
+        return lines
+
+def _join(*parts):
+    return ",".join(part for part in parts if part)
+
+def _label(name, value):
+    return f'{name}="{value}"'
+
+class WorkerMetrics:
+    """كل مقاييس العامل في مكان واحد (تُستدعى من حلقة asyncio واحدة)."""
+
+    def __init__(self, lag_window=300):
+        self.started_at = time.monotonic()
+        self.lag_window = lag_window
+        self.live = False
+        self.stages = {}
+        self.patterns = {}
+        self.messages = {}
+        self.saves = {"ok": 0, "error": 0}
+        self.lag = Histogram(LAG_BUCKETS)
+        self.last_lag = None
+        self.last_lag_at = None
+        self.last_message_at = None
+        # الرسائل الحية التي وصلت ولم تنته معالجتها: معرف الرسالة -> تاريخها
+        self.pending = {}
+        # دوال تُرجع عدد التحديثات المنتظرة خارج العامل (مثل طابور تحديثات Telethon)
+        self.queue_probes = []
+
+    # ------------------------------
+    # التسجيل
+    # ------------------------------
+    @contextmanager
+    def timed(self, stage):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            histogram = self.stages.get(stage)
+            if histogram is None:
+                histogram = self.stages[stage] = Histogram(STAGE_BUCKETS)
+            histogram.observe(time.perf_counter() - started)
+
+    def pattern(self, name):
+        """تسجيل النمط الذي طابق رسالة في parse_content_info ('none' إن لم يطابق شيء)."""
+        self.patterns[name] = self.patterns.get(name, 0) + 1
+
+    def message(self, event):
+        self.messages[event] = self.messages.get(event, 0) + 1
+
+    def saved(self, ok):
+        self.saves["ok" if ok else "error"] += 1
+
+    def received(self, msg_id, message_date):
+        """رسالة حية دخلت المعالجة."""
+        if message_date is not None:
+            self.pending[msg_id] = message_date
+
+    def done(self, msg_id, added_at=None):
+        """انتهت معالجة رسالة حية؛ added_at موجود إذا حُفظت حلقة."""
+        message_date = self.pending.pop(msg_id, None)
+        self.last_message_at = datetime.utcnow()
+        if message_date is not None and added_at is not None:
+            lag = max(0.0, (added_at - message_date).total_seconds())
+            self.lag.observe(lag)
+            self.last_lag = lag
+            self.last_lag_at = time.monotonic()
+
+    def add_queue_probe(self, read):
+        self.queue_probes.append(read)
+
+    # ------------------------------
+    # القراءة
+    # ------------------------------
+    def current_lag(self):
+        """أكبر من: آخر تأخر مقاس خلال lag_window، وعمر أقدم رسالة ما زالت تنتظر المعالجة."""
+        lags = [0.0]
+        if self.last_lag is not None and time.monotonic() - self.last_lag_at <= self.lag_window:
+            lags.append(self.last_lag)
+        if self.pending:
+            oldest = min(self.pending.values())
+            lags.append((datetime.utcnow() - oldest).total_seconds())
+        return max(lags)
+
+    def readiness(self, max_lag):
+        """(جاهز؟، السبب)."""
+        if not self.live:
+            return False, "not live yet (connecting or importing history)"
+        lag = self.current_lag()
+        if lag > max_lag:
+            return False, f"freshness lag {lag:.0f}s > {max_lag}s"
+        return True, f"ok (lag {lag:.0f}s)"
+
+    def queue_depth(self):
+        depth = len(self.pending)
+        for read in self.queue_probes:
+            try:
+                depth += read()
+            except Exception:
+                pass
+        return depth
+
+    def render(self):
+        """كل المقاييس بصيغة Prometheus النصية."""
+        lines = [
+            "# TYPE worker_uptime_seconds gauge",
+            f"worker_uptime_seconds {time.monotonic() - self.started_at:.0f}",
+            "# TYPE worker_live gauge",
+            f"worker_live {int(self.live)}",
+            "# TYPE worker_messages_total counter",
+        ]
+        lines += [f"worker_messages_total{{{_label('event', event)}}} {count}"
+                  for event, count in sorted(self.messages.items())]
+        lines.append("# TYPE worker_parse_total counter")
+        lines += [f"worker_parse_total{{{_label('pattern', name)}}} {count}"
+                  for name, count in sorted(self.patterns.items())]
+        lines.append("# TYPE worker_saves_total counter")
+        lines += [f"worker_saves_total{{{_label('result', result)}}} {count}"
+                  for result, count in self.saves.items()]
+        lines.append("# TYPE worker_stage_seconds histogram")
+        for stage, histogram in sorted(self.stages.items()):
+            lines += histogram.render("worker_stage_seconds", _label("stage", stage))
+        lines.append("# TYPE worker_freshness_lag_seconds histogram")
+        lines += self.lag.render("worker_freshness_lag_seconds")
+        lines += [
+            "# TYPE worker_freshness_lag_current_seconds gauge",
+            f"worker_freshness_lag_current_seconds {self.current_lag():.3f}",
+            "# TYPE worker_queue_depth gauge",
+            f"worker_queue_depth {self.queue_depth()}",
+        ]
+        rss = rss_bytes()
+        if rss is not None:
+            lines += ["# TYPE process_resident_memory_bytes gauge", f"process_resident_memory_bytes {rss}"]
+        return "\n".join(lines) + "\n"
+
+# ==============================
+# خادم HTTP المحلي
+# ==============================
+_REASONS = {200: "OK", 400: "Bad Request", 403: "Forbidden", 404: "Not Found", 503: "Service Unavailable"}
+
+async def start_metrics_server(metrics, host, port, max_lag, routes=None):
+    """تشغيل خادم المقاييس وإرجاعه (يُغلق بـ server.close()).
+
+    routes: {المسار: دالة (معاملات الرابط) -> (الحالة، النص)} لمسارات إضافية.
+    """
+    routes = routes or {}
+
+    async def handle(reader, writer):
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), 5)
+            # تجاهل بقية الترويسات
+            while (await asyncio.wait_for(reader.readline(), 5)).strip():
+                pass
+            parts = request_line.decode("latin-1").split()
+            path, _, query = (parts[1] if len(parts) > 1 else "/").partition("?")
+            if path in routes:
+                params = {name: values[-1] for name, values in parse_qs(query).items()}
+                status, body = routes[path](params)
+            elif path == "/metrics":
+                status, body = 200, metrics.render()
+            elif path == "/healthz":
+                status, body = 200, "ok\n"
+            elif path == "/ready":
+                ready, reason = metrics.readiness(max_lag)
+                status, body = (200 if ready else 503), reason + "\n"
+            else:
+                status, body = 404, "not found\n"
+            payload = body.encode("utf-8")
+            writer.write(
+                f"HTTP/1.1 {status} {_REASONS[status]}\r\n"
+                f"Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                f"Content-Length: {len(payload)}\r\n"
+                f"Connection: close\r\n\r\n".encode("latin-1") + payload
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port)